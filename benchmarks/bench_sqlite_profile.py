@@ -0,0 +1,115 @@
+"""
+Compare read/write latency of the SQLite engine profiles.
+
+Each profile gets a fresh temporary database seeded with --rows movies.
+The benchmark then times single-row commits (the add_movie path), point
+lookups by title, full list_movies reads and point lookups made by a
+reader thread while a writer keeps committing.
+
+Usage:
+    python -m benchmarks.bench_sqlite_profile --rows 20000 --ops 500
+"""
+import argparse
+import contextlib
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from sqlalchemy import text
+
+from storage_api import movie_storage_sql as storage
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(samples):
+    """Return mean, p50 and p99 latency in milliseconds."""
+    return {'mean_ms': statistics.fmean(samples) * 1000,
+            'p50_ms': percentile(samples, 0.50) * 1000,
+            'p99_ms': percentile(samples, 0.99) * 1000}
+
+
+def timed(operation, count):
+    samples = []
+    for i in range(count):
+        start = time.perf_counter()
+        operation(i)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run_profile(profile, rows, ops):
+    directory = tempfile.mkdtemp()
+    db_url = f"sqlite:///{os.path.join(directory, 'movies.sqlite3')}"
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        # echo=True logs to the stdout captured here, like it would to a terminal
+        engine = storage.build_engine(db_url, profile)
+        previous, storage.engine = storage.engine, engine
+        try:
+            storage.create_schema()
+            storage.add_movies({'title': f'Movie {i}', 'year': 1950 + i % 70,
+                                'rating': round(random.uniform(1, 10), 1),
+                                'image_link': 'N/A'} for i in range(rows))
+            lookup = text("SELECT title, year, rating FROM movies WHERE title = :title")
+
+            def write(i):
+                with engine.begin() as connection:
+                    connection.execute(
+                        text("UPDATE movies SET rating = :rating WHERE title = :title"),
+                        {'title': f'Movie {random.randrange(rows)}',
+                         'rating': round(random.uniform(1, 10), 1)})
+
+            def read(i):
+                with engine.connect() as connection:
+                    connection.execute(
+                        lookup, {'title': f'Movie {random.randrange(rows)}'}).fetchall()
+
+            results = {
+                'write': summarize(timed(write, ops)),
+                'point_read': summarize(timed(read, ops)),
+                'list_movies': summarize(timed(lambda i: storage.list_movies(),
+                                               max(1, ops // 50))),
+            }
+
+            stop = threading.Event()
+
+            def writer():
+                while not stop.is_set():
+                    write(0)
+
+            thread = threading.Thread(target=writer)
+            thread.start()
+            try:
+                results['read_during_writes'] = summarize(timed(read, ops))
+            finally:
+                stop.set()
+                thread.join()
+        finally:
+            storage.engine = previous
+            engine.dispose()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--ops', type=int, default=500)
+    parser.add_argument('--profiles', nargs='+', default=['legacy', 'production'],
+                        choices=sorted(storage.ENGINE_PROFILES))
+    args = parser.parse_args(argv)
+
+    print(f"{'profile':<12}{'operation':<20}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for profile in args.profiles:
+        for operation, stats in run_profile(profile, args.rows, args.ops).items():
+            print(f"{profile:<12}{operation:<20}{stats['mean_ms']:>10.3f}"
+                  f"{stats['p50_ms']:>10.3f}{stats['p99_ms']:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
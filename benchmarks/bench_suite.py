@@ -0,0 +1,211 @@
+"""
+End-to-end benchmark of the storage layer and site generation on
+synthetic catalogs, with results written as JSON.
+
+For every --sizes entry a fresh temporary SQLite database is filled with
+that many synthetic movies: most are bulk loaded with add_movies and the
+last --import-rows (at most a tenth of the catalog) go through bulk_import
+with an offline OMDb stand-in, so no network is used. The suite then times
+full listings, filtered pages, sorted listings, searches, rating
+statistics and a full site build.
+
+Compare a run with an earlier one to catch regressions:
+
+    python -m benchmarks.bench_suite --sizes 1000 100000 --output new.json
+    python -m benchmarks.bench_suite --sizes 1000 100000 --baseline old.json
+
+With --baseline the run fails (exit status 1) when any operation got slower
+than --tolerance allows.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_sqlite_profile import summarize
+from benchmarks.synthetic_catalog import (FIRST_YEAR, WORDS, YEARS, SyntheticOmdb,
+                                          synthetic_movies, synthetic_titles)
+from movies_omdb_api.bulk_import import bulk_import
+from storage_api import movie_query as query
+from storage_api import movie_search as search
+from storage_api import movie_storage_sql as storage
+from website_generator import site_builder
+
+DEFAULT_SIZES = (1000, 100000, 1000000)
+IMPORT_ROWS = 10000
+# Sites bigger than this are not built: every movie gets its own page
+SITE_MAX_ROWS = 100000
+TOLERANCE = 0.25
+
+
+def timed(function):
+    """Return (seconds, result) of one call."""
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def repeated(operation, count, rng):
+    """Time count calls of operation(rng) and summarize their latencies."""
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        operation(rng)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def throughput(seconds, rows):
+    return {'seconds': seconds, 'rows_per_s': rows / seconds if seconds else None}
+
+
+def drain(iterable):
+    count = 0
+    for _ in iterable:
+        count += 1
+    return count
+
+
+def _filter_page(rng):
+    year = FIRST_YEAR + rng.randrange(YEARS)
+    query.query_movies(min_rating=rng.randrange(1, 9), start_year=year,
+                       end_year=year + 10, order_by='rating', descending=True,
+                       limit=50)
+
+
+def _sorted_page(rng):
+    query.query_movies(order_by=rng.choice(['title', 'rating', 'year']),
+                       descending=rng.random() < 0.5, limit=50)
+
+
+def _search(rng):
+    search.search_movies(f'{rng.choice(WORDS)} {rng.choice(WORDS).lower()[:3]}')
+
+
+def run_size(rows, ops=200, import_rows=IMPORT_ROWS, site_max_rows=SITE_MAX_ROWS,
+             seed=1):
+    """
+    Build a catalog of rows movies in a temporary database and benchmark it.
+
+    Returns:
+        dict: Wall time and rows/s of the bulk operations, and mean/p50/p99
+        latencies of the repeated ones.
+    """
+    directory = tempfile.mkdtemp(prefix='movies-bench-')
+    rng = random.Random(seed)
+    import_rows = min(import_rows, rows // 10)
+    results = {'rows': rows}
+    try:
+        storage.configure(f"sqlite:///{os.path.join(directory, 'movies.sqlite3')}")
+        loaded = rows - import_rows
+        seconds, _ = timed(lambda: storage.add_movies(synthetic_movies(loaded),
+                                                      replace=False))
+        results['bulk_load'] = throughput(seconds, loaded)
+        omdb = SyntheticOmdb()
+        seconds, report = timed(lambda: bulk_import(
+            synthetic_titles(import_rows, start=loaded), fetcher=omdb))
+        results['omdb_import'] = dict(throughput(seconds, import_rows),
+                                      stored=report.stored)
+
+        seconds, count = timed(lambda: drain(query.iter_movies()))
+        results['list'] = throughput(seconds, count)
+        seconds, count = timed(lambda: drain(query.iter_movies(order_by='title')))
+        results['sort_full'] = throughput(seconds, count)
+        results['sort_page'] = repeated(_sorted_page, ops, rng)
+        results['filter_page'] = repeated(_filter_page, ops, rng)
+        results['search'] = repeated(_search, ops, rng)
+        results['stats'] = repeated(lambda rng: query.rating_stats(), ops, rng)
+
+        if rows <= site_max_rows:
+            output_dir = os.path.join(directory, 'site')
+            os.makedirs(output_dir)
+            with contextlib.redirect_stdout(sys.stderr):
+                seconds, report = timed(lambda: site_builder.build_site(output_dir))
+            results['site_build'] = dict(throughput(seconds, rows),
+                                         pages=len(report.written))
+        else:
+            results['site_build'] = None
+    finally:
+        storage.engine.dispose()
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def run_suite(sizes=DEFAULT_SIZES, ops=200, import_rows=IMPORT_ROWS,
+              site_max_rows=SITE_MAX_ROWS):
+    """Run every size and return the JSON-serializable report."""
+    report = {'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+              'python': platform.python_version(), 'platform': platform.platform(),
+              'cpus': os.cpu_count(), 'ops': ops, 'sizes': []}
+    for rows in sizes:
+        report['sizes'].append(run_size(rows, ops, import_rows, site_max_rows))
+        print(f'Benchmarked {rows} movies', file=sys.stderr)
+    return report
+
+
+def _timing(result):
+    """The number compared between runs: p50 latency or wall time."""
+    if result is None or not isinstance(result, dict):
+        return None
+    return result.get('p50_ms', result.get('seconds'))
+
+
+def regressions(baseline, report, tolerance=TOLERANCE):
+    """
+    List the operations of report that got slower than baseline.
+
+    Returns:
+        list of tuple: (rows, operation, baseline timing, new timing).
+    """
+    previous = {size['rows']: size for size in baseline['sizes']}
+    slower = []
+    for size in report['sizes']:
+        for operation, result in size.items():
+            old = _timing(previous.get(size['rows'], {}).get(operation))
+            new = _timing(result)
+            if old and new and new > old * (1 + tolerance):
+                slower.append((size['rows'], operation, old, new))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+    parser.add_argument('--ops', type=int, default=200,
+                        help='calls timed per repeated operation')
+    parser.add_argument('--import-rows', type=int, default=IMPORT_ROWS,
+                        help='movies added through bulk_import')
+    parser.add_argument('--site-max-rows', type=int, default=SITE_MAX_ROWS,
+                        help='skip the site build for bigger catalogs')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--baseline', help='JSON report of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='allowed slowdown against the baseline (0.25 = 25%%)')
+    args = parser.parse_args(argv)
+
+    report = run_suite(args.sizes, args.ops, args.import_rows, args.site_max_rows)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            slower = regressions(json.load(f), report, args.tolerance)
+        for rows, operation, old, new in slower:
+            print(f'Regression: {operation} on {rows} movies went from {old:.3f} '
+                  f'to {new:.3f}', file=sys.stderr)
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
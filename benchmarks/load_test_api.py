@@ -0,0 +1,132 @@
+"""
+Load-test the catalog HTTP API on a synthetic database.
+
+The database is seeded with --rows movies (kept at --db, so later runs
+reuse it), the server is started in its own process and --concurrency
+keep-alive connections send --requests requests drawn from a mix of
+list pages, filtered pages, per-movie lookups, searches and stats.
+Throughput and latency percentiles are reported overall and per endpoint.
+
+Usage:
+    python -m benchmarks.load_test_api --rows 1000000 --concurrency 32 --requests 20000
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import quote
+
+from benchmarks.bench_sqlite_profile import summarize
+from benchmarks.synthetic_catalog import synthetic_movies
+
+
+def seed(db_path, rows):
+    """Fill db_path with synthetic movies unless it already holds enough."""
+    os.environ['MOVIES_DB_URL'] = f'sqlite:///{db_path}'
+    from storage_api import movie_query as query
+    from storage_api import movie_storage_sql as storage
+
+    storage.configure(os.environ['MOVIES_DB_URL'])
+    existing = query.count_movies()
+    if existing >= rows:
+        return existing
+    start = time.perf_counter()
+    storage.add_movies(synthetic_movies(rows - existing, start=existing), replace=False)
+    print(f'Seeded {rows - existing} movies in {time.perf_counter() - start:.1f}s')
+    return rows
+
+
+def request_mix(rng, rows):
+    """Return (endpoint, path) for one request of the workload."""
+    pick = rng.random()
+    if pick < 0.35:
+        return 'movie', f'/movies/{rng.randrange(1, rows + 1)}'
+    if pick < 0.60:
+        year = rng.randrange(1920, 2025)
+        return 'filter', (f'/movies?sort=rating&desc=1&limit=50&start_year={year}'
+                          f'&end_year={year}&min_rating={rng.randrange(1, 9)}')
+    if pick < 0.80:
+        return 'list', f'/movies?sort={rng.choice(["id", "title", "year"])}&limit=50'
+    if pick < 0.95:
+        term = rng.choice(['night', 'star ret', 'ghost', 'blue 12'])
+        return 'search', f'/search?q={quote(term)}'
+    return 'stats', '/stats'
+
+
+async def client(host, port, paths, samples):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for endpoint, path in paths:
+            start = time.perf_counter()
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode())
+            await writer.drain()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+            await reader.readexactly(length)
+            samples.setdefault(endpoint, []).append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def run_load(host, port, rows, concurrency, requests, seed_value):
+    rng = random.Random(seed_value)
+    paths = [request_mix(rng, rows) for _ in range(requests)]
+    samples = {}
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, paths[i::concurrency], samples)
+                           for i in range(concurrency)))
+    return time.perf_counter() - start, samples
+
+
+def start_server(db_path, cache_size):
+    env = dict(os.environ, MOVIES_DB_URL=f'sqlite:///{db_path}')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'web_api.server', '--port', '0',
+         '--cache-size', str(cache_size)],
+        env=env, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    host, port = line.rsplit('/', 1)[1].strip().split(':')
+    return process, host, int(port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--db', default=os.path.join(tempfile.gettempdir(),
+                                                     'movies-load-test.sqlite3'))
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--cache-size', type=int, default=1024)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    rows = seed(args.db, args.rows)
+    process, host, port = start_server(args.db, args.cache_size)
+    try:
+        elapsed, samples = asyncio.run(run_load(host, port, rows, args.concurrency,
+                                                args.requests, args.seed))
+    finally:
+        process.terminate()
+        process.wait()
+
+    total = [sample for endpoint in samples.values() for sample in endpoint]
+    print(f'{len(total)} requests over {args.concurrency} connections on {rows} movies: '
+          f'{len(total) / elapsed:.0f} requests/s')
+    print(f"{'endpoint':<10}{'requests':>10}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for endpoint, endpoint_samples in sorted(samples.items()) + [('all', total)]:
+        stats = summarize(endpoint_samples)
+        print(f"{endpoint:<10}{len(endpoint_samples):>10}{stats['mean_ms']:>10.2f}"
+              f"{stats['p50_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Deterministic synthetic catalogs and an offline OMDb stand-in for the
+benchmarks.
+
+Titles are built from a small vocabulary plus a running number, so they
+are unique, tokenize like real titles for the search benchmarks and repeat
+words often enough for filters and FTS queries to hit many rows.
+"""
+import random
+import time
+import zlib
+
+WORDS = ['Night', 'Star', 'Return', 'Lost', 'City', 'Dark', 'River', 'King',
+         'Last', 'Dream', 'Blue', 'Silent', 'Iron', 'Ghost', 'Summer']
+FIRST_YEAR = 1920
+YEARS = 105
+
+
+def synthetic_title(rng, number):
+    return f'{rng.choice(WORDS)} {rng.choice(WORDS)} {number}'
+
+
+def synthetic_movies(count, start=0, seed=42):
+    """
+    Yield count synthetic movies numbered from start.
+
+    The same (start, seed) always yields the same movies, so catalogs of
+    different sizes share their first rows.
+    """
+    rng = random.Random(f'{seed}:{start}')
+    for number in range(start, start + count):
+        yield {'title': synthetic_title(rng, number),
+               'year': FIRST_YEAR + number % YEARS,
+               'rating': round(rng.uniform(1, 10), 1),
+               'image_link': f'https://img.example/{number}.jpg'}
+
+
+def synthetic_titles(count, start=0, seed=42):
+    """Yield only the titles of synthetic_movies(count, start, seed)."""
+    return (movie['title'] for movie in synthetic_movies(count, start, seed))
+
+
+class SyntheticOmdb:
+    """
+    Offline stand-in for bulk_import.OmdbFetcher.
+
+    Every title is "found" and answered with year, rating and poster
+    derived from a checksum of the title, after an optional simulated
+    network latency.
+
+    Args:
+        latency (float): Seconds slept per fetch.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def fetch(self, movie_name):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        checksum = zlib.crc32(movie_name.encode())
+        return {'title': movie_name, 'year': FIRST_YEAR + checksum % YEARS,
+                'rating': round(1 + (checksum >> 8) % 91 / 10, 1),
+                'image_link': f'https://img.example/{checksum:x}.jpg'}
+
+    def close(self):
+        pass
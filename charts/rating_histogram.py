@@ -0,0 +1,101 @@
+"""
+Rating histogram chart, rendered headless and cached per catalog version.
+
+matplotlib is only imported when a chart actually has to be drawn, and
+then only its Agg canvas, never pyplot or an interactive backend. The
+ratings are binned from the rating_histogram summary table (one row per
+distinct rating) with numpy, and the rendered PNG is cached under
+CACHE_DIR keyed by the database (its URL and storage.database_id(), so a
+database recreated at the same path gets charts of its own), the bin count
+and storage.data_version(),
+so asking again for an unchanged catalog just copies the cached file.
+"""
+import hashlib
+import os
+import shutil
+
+from instrumentation import metrics
+from storage_api import movie_query as query
+from storage_api import movie_storage_sql as storage
+
+CACHE_DIR = os.getenv("MOVIES_CHART_CACHE", os.path.join("database", "charts"))
+DEFAULT_BINS = 5
+
+
+def bin_ratings(histogram, bins=DEFAULT_BINS):
+    """
+    Bin a rating histogram into equal-width bins, like numpy.histogram
+    would bin the individual ratings.
+
+    Args:
+        histogram (list of (rating, count)): As in rating_stats()['histogram'].
+        bins (int): Number of bins.
+
+    Returns:
+        tuple: (counts, edges) numpy arrays, with len(edges) == bins + 1.
+    """
+    import numpy as np
+
+    ratings = np.fromiter((rating for rating, _ in histogram), dtype=np.float64)
+    weights = np.fromiter((count for _, count in histogram), dtype=np.int64)
+    counts, edges = np.histogram(ratings, bins=bins, weights=weights)
+    return counts.astype(np.int64), edges
+
+
+def _cache_prefix(bins):
+    database = hashlib.sha256(
+        f"{storage.get_engine().url}|{storage.database_id()}".encode()).hexdigest()[:12]
+    return f"rating-histogram-{database}-{bins}-"
+
+
+def _draw(counts, edges, path):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    axes.stairs(counts, edges, fill=True, edgecolor="black")
+    axes.set_title("Movie Ratings Histogram")
+    axes.set_xlabel("Rating")
+    axes.set_ylabel("Number of Movies")
+    figure.savefig(path, format="png")
+
+
+def render_rating_histogram(filename, bins=DEFAULT_BINS, cache_dir=None):
+    """
+    Save a histogram of the movie ratings as a PNG file.
+
+    Args:
+        filename (str): Where to save the chart.
+        bins (int): Number of bins.
+        cache_dir (str, optional): Cache directory, CACHE_DIR by default.
+
+    Returns:
+        bool: True if the chart came from the cache, False if it was drawn.
+        None if there are no movies to chart.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    prefix = _cache_prefix(bins)
+    cached = os.path.join(cache_dir, f"{prefix}{storage.data_version()}.png")
+    if os.path.exists(cached):
+        metrics.count('chart_cache.hits')
+        shutil.copyfile(cached, filename)
+        return True
+    metrics.count('chart_cache.misses')
+
+    summary = query.rating_stats(quantiles=())
+    if summary is None:
+        return None
+    counts, edges = bin_ratings(summary["histogram"], bins)
+    os.makedirs(cache_dir, exist_ok=True)
+    with metrics.span('chart.draw'):
+        _draw(counts, edges, cached + ".tmp")
+    os.replace(cached + ".tmp", cached)
+    for name in os.listdir(cache_dir):
+        # Charts of earlier versions of this catalog won't be asked for again
+        if name.startswith(prefix) and name.endswith(".png") \
+                and name != os.path.basename(cached):
+            os.remove(os.path.join(cache_dir, name))
+    shutil.copyfile(cached, filename)
+    return False
@@ -0,0 +1,178 @@
+"""
+Lightweight timing spans and counters for the hot paths.
+
+Instrumented code calls span(), timed() and count() unconditionally; they
+do nothing but check a flag until collection is enabled, with enable() or
+the MOVIES_METRICS environment variable. The CLI's and the API server's
+--metrics option, like the environment variable, also print the summary
+when the process exits.
+
+    with metrics.span('site.render_task'):
+        ...
+
+    @metrics.timed('storage.add_movies')
+    def add_movies(...):
+        ...
+
+    metrics.count('query.rows', len(rows))
+
+Spans record the number of calls and the total and slowest duration per
+name; nested spans are timed independently, so a parent's total includes
+its children. Only the current process is measured: pages rendered by the
+site builder's worker processes are reported through record().
+
+profile() wraps a block in cProfile and dumps the statistics to a file
+that snakeviz, gprof2dot or flameprof can turn into a call graph or flame
+graph.
+"""
+import atexit
+import contextlib
+import functools
+import os
+import sys
+import threading
+import time
+
+ENABLED = os.getenv('MOVIES_METRICS', '') not in ('', '0')
+
+_lock = threading.Lock()
+# name -> [calls, total seconds, max seconds]
+_spans = {}
+_counters = {}
+_summary_at_exit = False
+
+
+def enable(summary_at_exit=False):
+    """
+    Start collecting spans and counters.
+
+    Args:
+        summary_at_exit (bool): Print the summary to stderr when the
+            process exits.
+    """
+    global ENABLED, _summary_at_exit
+    ENABLED = True
+    if summary_at_exit and not _summary_at_exit:
+        _summary_at_exit = True
+        atexit.register(print_summary)
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    """Forget every span and counter collected so far."""
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+
+def record(name, seconds):
+    """Add one measured duration to a span."""
+    if not ENABLED:
+        return
+    with _lock:
+        entry = _spans.get(name)
+        if entry is None:
+            _spans[name] = [1, seconds, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            if seconds > entry[2]:
+                entry[2] = seconds
+
+
+def count(name, amount=1):
+    """Add amount to a counter."""
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+@contextlib.contextmanager
+def span(name):
+    """Time the enclosed block under name."""
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def timed(name):
+    """Decorator timing every call of a function under name."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    """
+    Return what was collected so far.
+
+    Returns:
+        dict: 'spans' maps each name to its 'calls', 'total_ms' and
+        'max_ms'; 'counters' maps each counter to its value.
+    """
+    with _lock:
+        spans = {name: {'calls': calls, 'total_ms': total * 1000, 'max_ms': slowest * 1000}
+                 for name, (calls, total, slowest) in _spans.items()}
+        return {'spans': spans, 'counters': dict(_counters)}
+
+
+def format_summary():
+    """Return the collected spans (slowest total first) and counters as text."""
+    collected = snapshot()
+    lines = [f"{'span':<36}{'calls':>8}{'total ms':>12}{'mean ms':>10}{'max ms':>10}"]
+    for name, entry in sorted(collected['spans'].items(),
+                              key=lambda item: -item[1]['total_ms']):
+        lines.append(f"{name:<36}{entry['calls']:>8}{entry['total_ms']:>12.2f}"
+                     f"{entry['total_ms'] / entry['calls']:>10.3f}{entry['max_ms']:>10.2f}")
+    if collected['counters']:
+        lines.append(f"{'counter':<36}{'value':>8}")
+        for name, value in sorted(collected['counters'].items()):
+            lines.append(f'{name:<36}{value:>8}')
+    return '\n'.join(lines)
+
+
+def print_summary(stream=None):
+    print(format_summary(), file=stream or sys.stderr)
+
+
+@contextlib.contextmanager
+def profile(path):
+    """
+    Run the enclosed block under cProfile and dump the statistics to path.
+
+    Args:
+        path (str): Output file in the pstats format.
+    """
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        print(f'Profile written to {path}', file=sys.stderr)
+
+
+if ENABLED:
+    enable(summary_at_exit=True)
@@ -1,246 +1,293 @@
-from storage_api import movie_storage_sql as storage
-from movies_omdb_api import movie_omdb_api as movie_api
-import random
-import difflib
-import matplotlib.pyplot as plt
+import argparse
+import contextlib
+import csv
+import importlib.util
+import itertools
+import json
+import os
+import sys
+import time
 
+from instrumentation import metrics
 
-def list_movies():
-    """Retrieve and display all movies from the database."""
-    movies = storage.list_movies()
-    print(f'\n{len(movies)} movies in total')
-    for movie in movies:
-        print(f"{movie} ({movies[movie]['year']}) : {movies[movie]['rating']}")
-    print()
 
+def lazy_import(name):
+    """
+    Return a module that is only executed when one of its attributes is
+    first used, so starting the CLI doesn't import SQLAlchemy, requests,
+    numpy or matplotlib (or open the database) until a command needs them.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    parent, _, child = name.rpartition('.')
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
+storage = lazy_import('storage_api.movie_storage_sql')
+movie_record = lazy_import('storage_api.movie_record')
+backends = lazy_import('storage_api.backends')
+json_storage = lazy_import('storage_api.movie_storage')
+query = lazy_import('storage_api.movie_query')
+search = lazy_import('storage_api.movie_search')
+movie_cache = lazy_import('storage_api.movie_cache')
+movie_changes = lazy_import('storage_api.movie_changes')
+transfer = lazy_import('storage_api.movie_transfer')
+movie_api = lazy_import('movies_omdb_api.movie_omdb_api')
+refresh = lazy_import('movies_omdb_api.refresh')
+site_builder = lazy_import('website_generator.site_builder')
+rating_histogram = lazy_import('charts.rating_histogram')
+
+# Best matches shown by the search command
+SEARCH_RESULTS_LIMIT = 20
+
+# Output formats and fields of the scriptable commands
+OUTPUT_FORMATS = ('text', 'json', 'csv')
+MOVIE_FIELDS = ('id', 'title', 'year', 'rating', 'image_link')
+# Stores other than SQL don't number their movies
+STORED_MOVIE_FIELDS = MOVIE_FIELDS[1:]
+OUTCOME_FIELDS = ('line', 'op', 'title', 'outcome')
+CHANGE_FIELDS = ('seq', 'op', 'movie_id', 'title', 'year', 'rating', 'image_link',
+                 'changed_at')
+
+# Source format of the migrate command for the old data.json files
+LEGACY_JSON = 'legacy-json'
+
+# Operations of a batch file applied per transaction
+BATCH_OPERATIONS = 5000
+
+
+@metrics.timed('menu.list_movies')
+def list_movies(catalog):
+    """
+    Display all movies.
 
-def list_movies_spl(movies):
-    """Retrieve and display all movies from the database."""
-    print(f'\n{len(movies)} movies in total')
+    Args:
+        catalog (CatalogCache): Session cache of the catalog.
+    """
+    movies = catalog.movies()
+    print_movies(movies, len(movies))
+
+
+def print_movies(movies, total):
+    """
+    Display movies.
+
+    Args:
+        movies (iterable of Movie or dict): Movies to list.
+        total (int): Number of movies in the listing.
+    """
+    print(f'\n{total} movies in total')
     for movie in movies:
-        print(f"{movie} ({movies[movie]['year']}) : {movies[movie]['rating']}")
+        print(f"{movie['title']} ({movie['year']}) : {movie['rating']}")
     print()
 
 
-def add_movie(movie_name):
+@metrics.timed('menu.add_movie')
+def add_movie(catalog, movie_name):
     """
     Add a new movie to the database if it doesn't already exist.
+
+    Args:
+        catalog (CatalogCache): Session cache of the catalog.
+        movie_name (str): Name of the movie to look up on OMDb.
     """
-    movies = storage.list_movies()
-    for movie in movies:
-        if movie_name.lower() == movie.lower():
-            print('Movie already in the database.\n')
-            return
+    if catalog.get_movie(movie_name) is not None:
+        print('Movie already in the database.\n')
+        return
 
     movie_info = movie_api.get_movie_info(movie_name)
-    if movie_info is not None:
-        storage.add_movie(movie_info['title'], year=movie_info['year'], rating=movie_info['rating'], image_link=movie_info['image_link'])
+    if movie_info is None:
+        return
+    if catalog.add_movie(movie_info, fetched_at=time.time()) == storage.ADDED:
+        print(f"Movie '{movie_info.title}' added successfully.")
+    else:
+        print(f"Error: Movie '{movie_info.title}' already exists.")
 
 
-def delete_movie(movie_name):
+@metrics.timed('menu.delete_movie')
+def delete_movie(catalog, movie_name):
     """
     Delete a movie from the database by its name.
+
+    Args:
+        catalog (CatalogCache): Session cache of the catalog.
+        movie_name (str): Name of the movie to delete.
     """
-    movies = storage.list_movies()
-    for movie in movies:
-        if movie_name.lower() == movie.lower():
-            storage.delete_movie(movie)
-            return
-    print(f"Movie {movie_name} doesn't exist.\n")
-    return
+    movie = catalog.get_movie(movie_name)
+    if movie is None or catalog.delete_movie(movie.title) != storage.DELETED:
+        print(f"Movie {movie_name} doesn't exist.\n")
+        return
+    print(f"Movie '{movie.title}' deleted successfully.")
 
 
-def update_movie(movies, movie_name, movie_rating):
+@metrics.timed('menu.update_movie')
+def update_movie(catalog, movie_name, movie_rating):
     """
     Update the rating of an existing movie.
 
     Args:
-        movies (dict of dicts): Existing movie dictionaries.
+        catalog (CatalogCache): Session cache of the catalog.
         movie_name (str): Name of the movie to update.
         movie_rating (float): New rating value.
-
-    Returns:
-        dict of dicts: Updated dict of movies.
     """
-    for movie in movies:
-        if movie_name.lower() == movie.lower():
-            movies[movie]['rating'] = movie_rating
-            storage.update_movie(movie, movie_rating)
-            print(f'Movie {movie} successfully updated.\n')
-            return movies
-    print(f"Movie {movie_name} doesn't exist.\n")
-    return movies
-
-
-def stats(movies):
+    movie = catalog.get_movie(movie_name)
+    try:
+        outcome = None if movie is None else catalog.update_rating(movie.title, movie_rating)
+    except ValueError as e:
+        print(f'Invalid rating: {e}\n')
+        return
+    if outcome != storage.UPDATED:
+        print(f"Movie {movie_name} doesn't exist.\n")
+        return
+    print(f'Movie {movie.title} successfully updated.\n')
+
+
+@metrics.timed('menu.stats')
+def stats():
     """
     Display statistics about the movie ratings:
     average, median, best-rated, and worst-rated movies.
-
-    Args:
-        movies (dict of dicts): Dict of movie dictionaries.
     """
-    ratings = sorted(movies[movie]['rating'] for movie in movies)
-    avg_rating = sum(ratings) / len(ratings)
-    print(f'Average rating: {avg_rating:.2f}')
-
-    ratings_len = len(ratings)
-    if ratings_len % 2 == 1:
-        median_rating = ratings[ratings_len // 2]
-    else:
-        median_rating = (ratings[ratings_len // 2 - 1] + \
-                         ratings[ratings_len // 2]) / 2
-    print(f'Median rating: {median_rating:.2f}')
-
-    best = max(movies, key=lambda title: movies[title]['rating'])
-    worst = min(movies, key=lambda title: movies[title]['rating'])
-    print(f'Best movie: {best}, {movies[best]["rating"]}')
-    print(f'Worst movie: {worst}, {movies[worst]["rating"]}\n')
-
-
-def random_movie(movies):
+    summary = query.rating_stats()
+    if summary is None:
+        print('No movies in the database.\n')
+        return
+    print(f'Average rating: {summary["mean"]:.2f}')
+    print(f'Median rating: {summary["median"]:.2f}')
+    best, worst = summary['best'], summary['worst']
+    print(f'Best movie: {best["title"]}, {best["rating"]}')
+    print(f'Worst movie: {worst["title"]}, {worst["rating"]}\n')
+
+
+@metrics.timed('menu.random_movie')
+def random_movie(catalog):
     """
-    Select and display a random movie from the list.
+    Select and display a random movie from the catalog.
 
     Args:
-        movies (dict of dicts): Dict of movie dictionaries.
+        catalog (CatalogCache): Session cache of the catalog.
     """
-    movies_list = [movie for movie in movies]
-    choice = random.choice(movies_list)
-    print(f"Your movie for tonight: {choice}, rated {movies[choice]['rating']}\
+    choice = catalog.random_movie()
+    if choice is None:
+        print('No movies in the database.\n')
+        return
+    print(f"Your movie for tonight: {choice['title']}, rated {choice['rating']}\
             \n")
 
 
-def search_movie(movies, search_term):
+@metrics.timed('menu.search_movie')
+def search_movie(search_term):
     """
     Search for movies whose names contain the search term (case-insensitive).
     If none found, suggest the closest match.
 
     Args:
-        movies (dict of dicts): List of movie dictionaries.
         search_term (str): Substring to search for in movie names.
     """
-    name_to_rating = {m: movies[m]['rating'] for m in movies}
-    lookup = {m.lower(): m for m in movies}
-    found = False
-
-    for lower_name, original_name in lookup.items():
-        if search_term.lower() in lower_name:
-            print(f'{original_name}, Rating: {name_to_rating[original_name]}')
-            found = True
+    found = search.search_movies(search_term, limit=SEARCH_RESULTS_LIMIT)
+    for movie in found:
+        print(f"{movie['title']}, Rating: {movie['rating']}")
 
     if not found:
         print(f'The movie "{search_term}" does not exist. Did you mean:')
-        suggestions = difflib.get_close_matches(
-            search_term, name_to_rating.keys(), n=1, cutoff=0.6
-        )
-        for suggestion in suggestions:
-            print(f"{suggestion}, Rating: {name_to_rating[suggestion]}")
+        for suggestion in search.suggest_titles(search_term, limit=1, cutoff=0.6):
+            print(f"{suggestion['title']}, Rating: {suggestion['rating']}")
     print()
 
 
-def movies_sorted_by_rating():
+@metrics.timed('menu.movies_sorted_by_rating')
+def movies_sorted_by_rating(catalog):
     """
     Print movies sorted in descending order by rating.
 
     Args:
-        movies (dict of dicts): List of movie dictionaries.
+        catalog (CatalogCache): Session cache of the catalog.
     """
-    movies = storage.list_movies()
-    sorted_dict = {
-      title: movies[title]
-      for title in sorted(movies, key=lambda t: movies[t]['rating'], reverse=True)
-    }
-    list_movies_spl(sorted_dict)
+    movies = catalog.movies(order_by='rating', descending=True)
+    print_movies(movies, len(movies))
 
 
-def movies_sorted_chronological_order(choice):
+@metrics.timed('menu.movies_sorted_chronological_order')
+def movies_sorted_chronological_order(catalog, choice):
     """
-    Print movies sorted in chronological order by rating.
+    Print movies sorted in chronological order.
 
     Args:
-        movies (dict of dicts): List of movie dictionaries.
+        catalog (CatalogCache): Session cache of the catalog.
+        choice (str): 'Y' to show the latest movies first.
     """
-    reverse = True if choice == 'Y' else False
-    movies = storage.list_movies()
-    sorted_dict = {
-      title: movies[title]
-      for title in sorted(movies, key=lambda t: movies[t]['year'], reverse=reverse)
-    }
-    list_movies_spl(sorted_dict)
+    reverse = True if choice.upper() == 'Y' else False
+    movies = catalog.movies(order_by='year', descending=reverse)
+    print_movies(movies, len(movies))
 
 
-def filter_movies(movies, min_rating=0.0, start_year=0, end_year=9999):
+@metrics.timed('menu.filter_movies')
+def filter_movies(catalog, min_rating=0.0, start_year=0, end_year=9999):
     """
     Filter the movies based on rating, start year and end year.
 
     Args:
-        movies (dict of dicts): List of movie dictionaries
+        catalog (CatalogCache): Session cache of the catalog.
         min_rating: Minimum rating of the listed movies
         start_year: Start year of the listed movies
         end_year:   End year of the listed movies
     """
-    if not min_rating:
-        min_rating = 0.0
-    if not start_year:
-        start_year = 0
-    if not end_year:
-        end_year = 9999
+    filters = {
+        'min_rating': min_rating if min_rating else None,
+        'start_year': start_year if start_year else None,
+        'end_year': end_year if end_year else None,
+    }
     print('Filtered Movies:')
-    filtered_movies = dict()
-    for movie in movies:
-        if min_rating <= movies[movie]['rating'] and \
-        start_year <= movies[movie]['year'] and \
-        end_year >= movies[movie]['year']:
-            filtered_movies[movie] = movies[movie]
-    list_movies_spl(filtered_movies)
+    movies = catalog.movies(**filters)
+    print_movies(movies, len(movies))
 
 
-def create_rating_histogram(movies):
+@metrics.timed('menu.create_rating_histogram')
+def create_rating_histogram():
     """
     Generate and save a histogram of movie ratings to a file.
-
-    Args:
-        movies (dict of dicts): List of movie dictionaries.
     """
-    ratings = [movies[title]['rating'] for title in movies]
     filename = input("Enter the filename to save the histogram\
     (e.g., ratings.png): ")
-    plt.figure()
-    plt.hist(ratings, bins=5, edgecolor='black')
-    plt.title("Movie Ratings Histogram")
-    plt.xlabel("Rating")
-    plt.ylabel("Number of Movies")
-    plt.savefig(filename)
+    try:
+        rendered = rating_histogram.render_rating_histogram(filename)
+    except ImportError as e:
+        print(f"Error: the histogram needs numpy and matplotlib ({e}); "
+              "install them with: pip install numpy matplotlib\n")
+        return
+    if rendered is None:
+        print('No movies in the database.\n')
+        return
     print(f"Histogram saved to {filename}\n")
-    plt.close()
-
-def serialize_movie(movies):
-    """ Serializes the movies object data and produces a HTML string as output """
-    output = ''
-    for movie in movies:
-        output += '<li>\n'
-        output += '<div class ="movie" >\n'
-        output += f'<img class ="movie-poster" src="{movies[movie]["image_link"]}"/>\n'
-        output += f'<div class ="movie-title"> {movie}</div>\n'
-        output += f'<div class ="movie-year"> {movies[movie]["year"]} </div>\n'
-        output += '</div>\n'
-        output += '</li>\n'
-    return output
-
-
-def generate_website():
-    """ Generates the HTML code necessary for the website """
-    movies = storage.list_movies()
 
-    template_str = ''
-    with open('static/index_template.html', 'r+') as f:
-        template_str = f.read()
+@metrics.timed('menu.generate_website')
+def generate_website(choice='Y'):
+    """
+    Generates the HTML pages of the website, rewriting only changed pages.
+    Posters that fail to download are linked at their remote URL.
 
-    final_output = template_str.replace('__TEMPLATE_MOVIE_GRID__', serialize_movie(movies))
-    with open('static/index.html', 'w+') as f:
-        f.write(final_output)
-    print('Website was generated successfully.')
+    Args:
+        choice (str): 'Y' to mirror new posters locally first, 'N' to link
+            every poster at its remote URL (quick, and works offline).
+    """
+    posters = None
+    if choice.upper() == 'Y':
+        try:
+            posters, poster_report = site_builder.mirror_posters()
+            print(poster_report)
+        except OSError as e:
+            print(f"Error: posters could not be mirrored ({e}); "
+                  "linking the remote posters instead.")
+    report = site_builder.build_site(posters=posters)
+    print(f'Website was generated successfully ({report}).')
 
 
 def get_input_from_user(input_str, error_str, data_type, q_type='y', allow_blank=False):
@@ -287,14 +334,574 @@ def get_input_from_user(input_str, error_str, data_type, q_type='y', allow_blank
             print(error_str)
 
 
-def main():
+def write_records(records, fields, output_format='text', text_line=None,
+                  stream=None):
+    """
+    Stream records to stdout as text lines, a JSON array or CSV.
+
+    Args:
+        records (iterable of dict): Records to write.
+        fields (tuple of str): Keys written for every record.
+        output_format (str): One of OUTPUT_FORMATS.
+        text_line (function, optional): Formats one record for 'text';
+            defaults to the field values separated by ' | '.
+        stream (file, optional): Where to write, sys.stdout by default.
+    """
+    stream = stream or sys.stdout
+    if output_format == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(records)
+    elif output_format == 'json':
+        separator = '[\n'
+        for record in records:
+            stream.write(separator + json.dumps({field: record[field] for field in fields}))
+            separator = ',\n'
+        stream.write('[]\n' if separator == '[\n' else '\n]\n')
+    else:
+        for record in records:
+            stream.write((text_line(record) if text_line else
+                          ' | '.join(str(record[field]) for field in fields)) + '\n')
+
+
+def _movie_line(movie):
+    return f"{movie['title']} ({movie['year']}) : {movie['rating']}"
+
+
+def _outcome_line(record):
+    return f"{record['op']} {record['title']}: {record['outcome']}"
+
+
+class BatchError(ValueError):
+    """An invalid line in a batch file."""
+
+
+def _parse_operation(number, line):
+    try:
+        record = json.loads(line)
+        op = record['op']
+        title = record['title']
+        if op in ('add', 'upsert'):
+            movie = movie_record.Movie.parse(title, record['year'], record['rating'],
+                                             record.get('image_link'))
+            return {'line': number, 'op': op, 'title': title, 'movie': movie}
+        if op == 'update':
+            rating = movie_record.checked_rating(title, record['rating'])
+            return {'line': number, 'op': op, 'title': title, 'rating': rating}
+        if op == 'delete':
+            return {'line': number, 'op': op, 'title': title}
+        raise ValueError(f'unknown op {op!r}')
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise BatchError(f'line {number}: {e}') from None
+
+
+def read_operations(source):
+    """
+    Parse a batch file of JSON lines, one operation per line:
+
+        {"op": "add", "title": "...", "year": 1999, "rating": 8.7, "image_link": "..."}
+        {"op": "upsert", ...same fields as add...}
+        {"op": "update", "title": "...", "rating": 9.0}
+        {"op": "delete", "title": "..."}
+
+    "add" leaves movies that are already stored untouched, "upsert"
+    replaces them. Blank lines and lines starting with # are skipped.
+
+    Args:
+        source (file): Open text file.
+
+    Yields:
+        dict: Parsed operations with their 'line' number.
+
+    Raises:
+        BatchError: On the first invalid line.
+    """
+    for number, line in enumerate(source, start=1):
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield _parse_operation(number, line)
+
+
+def _apply(op, operations, connection):
+    if op in ('add', 'upsert'):
+        return storage.add_movies([operation['movie'] for operation in operations],
+                                  replace=op == 'upsert', connection=connection)
+    if op == 'update':
+        return storage.update_ratings(
+            [(operation['title'], operation['rating']) for operation in operations],
+            connection=connection)
+    return storage.delete_movies([operation['title'] for operation in operations],
+                                 connection=connection)
+
+
+def run_batch(operations, group_size=None):
+    """
+    Apply batch operations in order, group_size (default BATCH_OPERATIONS)
+    operations per transaction. Consecutive operations of the same kind
+    are sent to the database together.
+
+    If a line turns out to be invalid, the groups before it stay applied
+    and the group it is in is not started.
+
+    Yields:
+        dict: 'line', 'op', 'title' and 'outcome' of every operation.
+    """
+    group_size = group_size or BATCH_OPERATIONS
+    operations = iter(operations)
+    while True:
+        group = list(itertools.islice(operations, group_size))
+        if not group:
+            return
+        with storage.get_engine().begin() as connection:
+            results = []
+            for op, run in itertools.groupby(group, key=lambda operation: operation['op']):
+                run = list(run)
+                results.extend(zip(run, _apply(op, run, connection)))
+        for operation, outcome in results:
+            yield {'line': operation['line'], 'op': operation['op'],
+                   'title': operation['title'], 'outcome': outcome}
+
+
+def _open_store():
+    """Open the configured storage backend for the add, delete and update commands."""
+    return backends.open_store()
+
+
+def _require_sql(args):
+    """Refuse a command that needs the SQL indexes when another backend is selected."""
+    if backends.STORAGE_BACKEND != backends.SQL:
+        print(f"Error: {args.command} needs the sql storage backend "
+              f"(MOVIES_STORAGE_BACKEND is {backends.STORAGE_BACKEND}).", file=sys.stderr)
+        return False
+    return True
+
+
+def _command_list(args):
+    if backends.STORAGE_BACKEND == backends.SQL:
+        write_records(query.iter_movies(order_by=args.sort, descending=args.desc),
+                      MOVIE_FIELDS, args.format, _movie_line)
+        return 0
+    if args.sort != 'id' or args.desc:
+        print('Error: only the sql storage backend can sort listings.', file=sys.stderr)
+        return 2
+    store = _open_store()
+    try:
+        write_records(store.iter_movies(), STORED_MOVIE_FIELDS, args.format, _movie_line)
+    finally:
+        store.close()
+    return 0
+
+
+def _command_filter(args):
+    if not _require_sql(args):
+        return 2
+    movies = query.iter_movies(order_by=args.sort, descending=args.desc,
+                               min_rating=args.min_rating, max_rating=args.max_rating,
+                               start_year=args.start_year, end_year=args.end_year)
+    write_records(movies, MOVIE_FIELDS, args.format, _movie_line)
+
+
+def _command_search(args):
+    if not _require_sql(args):
+        return 2
+    movies = search.search_movies(args.term, limit=args.limit)
+    write_records(movies, MOVIE_FIELDS, args.format, _movie_line)
+
+
+def _command_stats(args):
+    if not _require_sql(args):
+        return 2
+    summary = query.rating_stats()
+    if summary is None:
+        print('No movies in the database.', file=sys.stderr)
+        return 1
+    record = {'count': summary['count'], 'mean': summary['mean'],
+              'median': summary['median'], 'best': summary['best']['title'],
+              'best_rating': summary['best']['rating'],
+              'worst': summary['worst']['title'],
+              'worst_rating': summary['worst']['rating']}
+    write_records([record], tuple(record), args.format,
+                  lambda r: (f"{r['count']} movies, average {r['mean']:.2f}, "
+                             f"median {r['median']:.2f}, best {r['best']} "
+                             f"({r['best_rating']}), worst {r['worst']} "
+                             f"({r['worst_rating']})"))
+
+
+def _command_add(args):
+    records = []
+    store = _open_store()
+    try:
+        for title in args.titles:
+            movie_info = movie_api.get_movie_info(title)
+            if movie_info is None:
+                outcome = 'not_found'
+            else:
+                outcome, = store.add_movies([movie_info], replace=False,
+                                            fetched_at=time.time())
+                title = movie_info.title
+            records.append({'line': None, 'op': 'add', 'title': title, 'outcome': outcome})
+    finally:
+        store.close()
+    write_records(records, OUTCOME_FIELDS, args.format, _outcome_line)
+    return 0 if all(r['outcome'] == storage.ADDED for r in records) else 1
+
+
+def _command_delete(args):
+    store = _open_store()
+    try:
+        outcomes = store.delete_movies(args.titles)
+    finally:
+        store.close()
+    write_records([{'line': None, 'op': 'delete', 'title': title, 'outcome': outcome}
+                   for title, outcome in zip(args.titles, outcomes)],
+                  OUTCOME_FIELDS, args.format, _outcome_line)
+    return 0 if all(outcome == storage.DELETED for outcome in outcomes) else 1
+
+
+def _command_update(args):
+    store = _open_store()
+    try:
+        outcome, = store.update_ratings([(args.title, args.rating)])
+    finally:
+        store.close()
+    write_records([{'line': None, 'op': 'update', 'title': args.title,
+                    'outcome': outcome}], OUTCOME_FIELDS, args.format, _outcome_line)
+    return 0 if outcome == storage.UPDATED else 1
+
+
+def _command_changes(args):
+    if not _require_sql(args):
+        return 2
+    write_records(movie_changes.changes_since(args.since, args.limit), CHANGE_FIELDS,
+                  args.format,
+                  lambda change: f"{change['seq']} {change['op']} {change['title']}")
+
+
+def _command_refresh(args):
+    if not _require_sql(args):
+        return 2
+    report = refresh.refresh_ratings(args.budget, args.max_age_days * refresh.DAY,
+                                     args.prioritize)
+    print(report, file=sys.stderr)
+    return 1 if report.failed else 0
+
+
+def _command_generate(args):
+    if not _require_sql(args):
+        return 2
+    output_dir = args.output_dir or site_builder.STATIC_DIR
+    posters = None
+    if not args.no_posters:
+        posters, poster_report = site_builder.mirror_posters(output_dir)
+        print(poster_report, file=sys.stderr)
+    report = site_builder.build_site(output_dir, posters=posters)
+    print(f'Website was generated successfully ({report}).', file=sys.stderr)
+
+
+def _open_file(path, mode, standard_stream, **options):
+    """
+    Open a command's file argument, or return standard_stream for '-'.
+
+    Returns:
+        file: The open file, or None after printing why it can't be opened.
+    """
+    if path == '-':
+        return standard_stream
+    try:
+        return open(path, mode, encoding='utf-8', **options)
+    except OSError as e:
+        print(f'Error: cannot open {path}: {e.strerror or e}', file=sys.stderr)
+        return None
+
+
+def _command_batch(args):
+    if not _require_sql(args):
+        return 2
+    source = _open_file(args.file, 'r', sys.stdin)
+    if source is None:
+        return 2
+    counts = {}
+
+    def counted(records):
+        for record in records:
+            counts[record['outcome']] = counts.get(record['outcome'], 0) + 1
+            yield record
+
+    try:
+        results = counted(run_batch(read_operations(source), args.group_size))
+        if args.quiet:
+            for _ in results:
+                pass
+        else:
+            write_records(results, OUTCOME_FIELDS, args.format, _outcome_line)
+    except BatchError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        return 2
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        print(', '.join(f'{count} {outcome}' for outcome, count in sorted(counts.items()))
+              or 'No operations', file=sys.stderr)
+    return 0
+
+
+def _transfer_format(args):
+    """Return the --format of export and import, or the one of the file's extension."""
+    file_format = args.format or transfer.format_of(args.file)
+    if file_format is None:
+        print(f'Error: give --format for {args.file}, one of '
+              f"{', '.join(transfer.FORMATS)}.", file=sys.stderr)
+    return file_format
+
+
+def _command_export(args):
+    if not _require_sql(args):
+        return 2
+    file_format = _transfer_format(args)
+    if file_format is None:
+        return 2
+    target = _open_file(args.file, 'w', sys.stdout, newline='')
+    if target is None:
+        return 2
+    try:
+        count = transfer.export_movies(target, file_format, args.fetch_size)
+    finally:
+        if target is not sys.stdout:
+            target.close()
+    print(f'Exported {count} movies.', file=sys.stderr)
+    return 0
+
+
+def _command_import(args):
+    if not _require_sql(args):
+        return 2
+    file_format = _transfer_format(args)
+    if file_format is None:
+        return 2
+    source = _open_file(args.file, 'r', sys.stdin, newline='')
+    if source is None:
+        return 2
+    try:
+        report = transfer.import_movies(source, file_format, replace=not args.skip_existing,
+                                        chunk_rows=args.chunk_rows, workers=args.workers)
+    except ValueError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        return 2
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    for error in report.errors:
+        print(f'Invalid: {error}', file=sys.stderr)
+    print(f'Imported {report}.', file=sys.stderr)
+    return 1 if report.invalid else 0
+
+
+def _command_migrate(args):
+    if args.source == args.target == backends.SQL:
+        # One SQL engine per process: copy databases with SQLite's .backup
+        print('Error: migrate copies between different backends.', file=sys.stderr)
+        return 2
+    if args.source == args.target and args.source_location == args.target_location:
+        print('Error: source and target are the same store.', file=sys.stderr)
+        return 2
+    if args.source == LEGACY_JSON:
+        source = None
+        movies = json_storage.read_legacy_json(args.source_location or 'data.json')
+    else:
+        source = backends.open_store(args.source, args.source_location)
+        movies = source.iter_movies()
+    target = backends.open_store(args.target, args.target_location)
+    try:
+        copied = backends.migrate(movies, target)
+        total = target.count_movies()
+    finally:
+        target.close()
+        if source is not None:
+            source.close()
+    print(f'Copied {copied} movies; the {args.target} store now holds {total}.',
+          file=sys.stderr)
+    return 0
+
+
+def _rating_argument(value):
+    """argparse type of a rating: a number from 0 to 10."""
+    rating = movie_record.parse_rating(value)
+    if rating is None:
+        raise argparse.ArgumentTypeError(f'{value!r} is not a rating from 0 to 10')
+    return rating
+
+
+def build_parser():
+    """Return the argument parser of the scriptable command mode."""
+    parser = argparse.ArgumentParser(
+        prog='movies.py',
+        description='Manage the movie database. Without a command, the '
+                    'interactive menu is started.')
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--format', choices=OUTPUT_FORMATS, default='text',
+                        help='output format (default: text)')
+    parser.add_argument('--metrics', action='store_true',
+                        help='print timing spans and counters when done')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='run under cProfile and dump the statistics to FILE')
+    subparsers = parser.add_subparsers(dest='command')
+
+    def add_command(name, help_text, handler, parents=(common,), **options):
+        command = subparsers.add_parser(name, help=help_text, parents=list(parents),
+                                        **options)
+        command.set_defaults(handler=handler)
+        return command
+
+    def listing(name, help_text, handler):
+        command = add_command(name, help_text, handler)
+        command.add_argument('--sort', choices=sorted(query.SORT_COLUMNS), default='id')
+        command.add_argument('--desc', action='store_true', help='sort descending')
+        return command
+
+    listing('list', 'list every movie', _command_list)
+    command = listing('filter', 'list movies within rating and year bounds',
+                      _command_filter)
+    command.add_argument('--min-rating', type=float)
+    command.add_argument('--max-rating', type=float)
+    command.add_argument('--start-year', type=int)
+    command.add_argument('--end-year', type=int)
+
+    command = add_command('search', 'search titles', _command_search)
+    command.add_argument('term')
+    command.add_argument('--limit', type=int, default=SEARCH_RESULTS_LIMIT)
+
+    add_command('stats', 'rating statistics', _command_stats)
+
+    command = add_command('add', 'look up titles on OMDb and add them', _command_add)
+    command.add_argument('titles', nargs='+', metavar='title')
+
+    command = add_command('delete', 'delete movies', _command_delete)
+    command.add_argument('titles', nargs='+', metavar='title')
+
+    command = add_command('update', "update a movie's rating", _command_update)
+    command.add_argument('title')
+    command.add_argument('rating', type=_rating_argument)
+
+    command = add_command('changes', 'stream the changes made after a cursor',
+                          _command_changes)
+    command.add_argument('--since', type=int, default=0,
+                         help='seq of the last change already seen (default: 0)')
+    command.add_argument('--limit', type=int)
+
+    command = add_command('refresh', 're-fetch the ratings of stale movies from OMDb',
+                          _command_refresh)
+    command.add_argument('--budget', type=int, default=1000,
+                         help='most OMDb requests made (default: 1000)')
+    command.add_argument('--max-age-days', type=float, default=7,
+                         help='refresh movies fetched longer ago than this (default: 7)')
+    command.add_argument('--prioritize', choices=('stale', 'popular'), default='stale')
+
+    command = add_command('generate', 'generate the website', _command_generate)
+    command.add_argument('--output-dir', help='default: static')
+    command.add_argument('--no-posters', action='store_true',
+                         help="link to the remote posters instead of mirroring them")
+
+    command = add_command(
+        'batch', 'apply a file of JSON-lines operations (- for stdin)', _command_batch,
+        description=read_operations.__doc__.split('Args:')[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    command.add_argument('file')
+    command.add_argument('--group-size', type=int, default=BATCH_OPERATIONS,
+                         help='operations per transaction')
+    command.add_argument('--quiet', action='store_true',
+                         help='only print the outcome counts')
+
+    def transfer_command(name, help_text, handler, file_help):
+        command = add_command(name, help_text, handler, parents=())
+        command.add_argument('file', help=file_help)
+        command.add_argument('--format', choices=('csv', 'jsonl', 'json'),
+                             help="csv, jsonl or the dict-shaped json of data.json "
+                                  "(default: the file's extension)")
+        return command
+
+    command = transfer_command('export', 'stream every movie to a CSV, JSON Lines or '
+                               'JSON file', _command_export, 'file to write, - for stdout')
+    command.add_argument('--fetch-size', type=int, default=10000,
+                         help='rows fetched per round trip (default: 10000)')
+
+    command = transfer_command('import', 'add the movies of a CSV, JSON Lines or JSON '
+                               'file', _command_import, 'file to read, - for stdin')
+    command.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                         help='processes parsing CSV and JSON Lines (default: one per CPU)')
+    command.add_argument('--chunk-rows', type=int, default=5000,
+                         help='movies parsed per task and stored per transaction '
+                              '(default: 5000)')
+    command.add_argument('--skip-existing', action='store_true',
+                         help='leave movies that are already stored untouched '
+                              'instead of replacing them')
+
+    command = add_command(
+        'migrate', 'copy every movie from one storage backend to another',
+        _command_migrate)
+    command.add_argument('--from', dest='source', required=True,
+                         choices=backends.BACKENDS + (LEGACY_JSON,))
+    command.add_argument('--to', dest='target', required=True, choices=backends.BACKENDS)
+    command.add_argument('--from-location', dest='source_location',
+                         help='database URL, log file or data.json to read '
+                              '(default: the configured one)')
+    command.add_argument('--to-location', dest='target_location',
+                         help='database URL or log file to write '
+                              '(default: the configured one)')
+    return parser
+
+
+def run_command(argv):
+    """
+    Run one command of the scriptable mode, or the interactive menu when
+    only the --metrics and --profile options are given.
+
+    Returns:
+        int: Exit status.
+    """
+    args = build_parser().parse_args(argv)
+    if args.metrics:
+        metrics.enable(summary_at_exit=True)
+    with metrics.profile(args.profile) if args.profile else contextlib.nullcontext():
+        if args.command is None:
+            interactive_menu()
+            return 0
+        with metrics.span(f'command.{args.command}'):
+            return args.handler(args) or 0
+
+
+def main(argv=None):
+    """
+    Run a command given on the command line, or the interactive Movies
+    Database CLI when there is none.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        try:
+            return run_command(argv)
+        except BrokenPipeError:
+            # The output was piped into a command that stopped reading it,
+            # such as head; silence the error Python would print at exit
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            return 1
+    if backends.STORAGE_BACKEND != backends.SQL:
+        # Search, statistics and the website need the SQL indexes
+        print(f"Error: the interactive menu needs the sql storage backend "
+              f"(MOVIES_STORAGE_BACKEND is {backends.STORAGE_BACKEND}); "
+              f"use the add, delete, update and list commands instead.", file=sys.stderr)
+        return 2
+    interactive_menu()
+    return 0
+
+
+def interactive_menu():
     """
     Run the interactive Movies Database CLI.
     Offers a menu for listing, adding, deleting, updating, and analyzing
     movies.
-    """
-    movies = storage.list_movies()
 
+    Reads are answered from a CatalogCache kept for the whole session.
+    """
+    catalog = movie_cache.CatalogCache()
     while True:
         print('****** My Movies Database ******')
         print('0. Exit')
@@ -308,27 +915,27 @@ def main():
         print('8. Movies sorted by rating')
         print('9. Generate website')
         print('10. Movies sorted chronologically')
-        print('11. Filter Movies\n')
+        print('11. Filter Movies')
+        print('12. Create rating histogram\n')
 
         try:
-            choice = int(input('Enter choice (0-11): ').strip())
+            choice = int(input('Enter choice (0-12): ').strip())
         except ValueError:
-            print("Invalid input. Please enter a number between 0 and 11.\n")
+            print("Invalid input. Please enter a number between 0 and 12.\n")
             continue
 
         if choice == 1:
-            movies = storage.list_movies()
-            list_movies()
+            list_movies(catalog)
         elif choice == 2:
             movie_name = get_input_from_user('Enter new movie name: ', \
               'Invalid Input, Please enter a valid Movie name.', type("abc")
               )
-            add_movie(movie_name)
+            add_movie(catalog, movie_name)
         elif choice == 3:
             movie_name = get_input_from_user('Enter movie name to delete: ', \
               'Invalid Input, Please enter a valid Movie name.', type("abc")
               )
-            delete_movie(movie_name)
+            delete_movie(catalog, movie_name)
         elif choice == 4:
             name = get_input_from_user('Enter movie name to update: ', \
               'Invalid Input, Please enter a valid Movie name.', type("abc")
@@ -336,28 +943,33 @@ def main():
             rating = get_input_from_user('Enter new rating (0-10): ', \
               'Invalid Input, Please enter a valid Movie rating.', type(1.1)
               )
-            update_movie(movies, name, rating)
+            update_movie(catalog, name, rating)
         elif choice == 5:
-            stats(movies)
+            stats()
         elif choice == 6:
-            random_movie(movies)
+            random_movie(catalog)
         elif choice == 7:
             term = get_input_from_user(
               'Enter part of the movie name to search: ', 
               'Invalid Input, Please enter a valid Movie name.', type("abc")
               )
-            search_movie(movies, term)
+            search_movie(term)
         elif choice == 8:
-            movies_sorted_by_rating()
+            movies_sorted_by_rating(catalog)
         elif choice == 9:
-            generate_website()
+            choice = get_input_from_user(
+              'Download the posters to serve them locally? Y/N: ',
+              'Invalid Input, Please enter either Y or N', type("abc"),
+              'yes_no'
+            )
+            generate_website(choice)
         elif choice == 10:
             choice = get_input_from_user(
               'Do you want to see the latest movies first? Y/N: ',
               'Invalid Input, Please enter either Y or N', type("abc"),
               'yes_no'
             )
-            movies_sorted_chronological_order(choice)
+            movies_sorted_chronological_order(catalog, choice)
         elif choice == 11:
             min_rating = get_input_from_user(
                 'Enter minimum rating (leave blank for no minimum rating):',
@@ -374,13 +986,15 @@ def main():
                 'Invalid Input, Please enter a valid Movie end year', type(1),
                 '', True
             )
-            filter_movies(movies, min_rating, start_year, end_year)
+            filter_movies(catalog, min_rating, start_year, end_year)
+        elif choice == 12:
+            create_rating_histogram()
         elif choice == 0:
             print('Bye!')
             break
         else:
-            print('Invalid choice! Please enter a number between 0 and 11')
+            print('Invalid choice! Please enter a number between 0 and 12')
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,319 @@
+"""
+Concurrent bulk import of movies from OMDb into the SQL storage.
+
+Titles (or IMDb IDs) are read one per line from a file or stdin, fetched
+by a bounded pool of worker threads that share one keep-alive HTTP
+session, and written to movie_storage_sql in batched transactions.
+
+Usage:
+    python -m movies_omdb_api.bulk_import titles.txt --workers 16 --rate 10
+    cat titles.txt | python -m movies_omdb_api.bulk_import -
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import metrics
+from movies_omdb_api import movie_omdb_api as movie_api
+from movies_omdb_api.omdb_cache import get_cache
+from storage_api import movie_storage_sql as storage
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def read_titles(source):
+    """
+    Yield titles or IMDb IDs from a file, one per line.
+
+    Blank lines and lines starting with '#' are skipped.
+
+    Args:
+        source (str or file object): Path to the file, '-' for stdin,
+            or an already opened text stream.
+    """
+    if source == '-':
+        stream = sys.stdin
+    elif isinstance(source, str):
+        stream = open(source, 'r', encoding='utf-8')
+    else:
+        stream = source
+    try:
+        for line in stream:
+            title = line.strip()
+            if title and not title.startswith('#'):
+                yield title
+    finally:
+        if stream is not source and stream is not sys.stdin:
+            stream.close()
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket, one bucket per host.
+
+    Args:
+        rate (float): Requests per second allowed for each host. A rate of
+            0 or None disables limiting.
+        burst (int): Number of requests that may be sent back to back.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, host):
+        """Block until a request to the given host is allowed."""
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, last = self._buckets.get(host, (self.burst, now))
+                tokens = min(self.burst, tokens + (now - last) * self.rate)
+                if tokens >= 1:
+                    self._buckets[host] = (tokens - 1, now)
+                    return
+                self._buckets[host] = (tokens, now)
+                delay = (1 - tokens) / self.rate
+            time.sleep(delay)
+
+
+class OmdbFetcher:
+    """
+    Fetches OMDb responses over a pooled keep-alive session with per-host
+    rate limiting and retries with exponential backoff.
+
+    Args:
+        base_url (str): OMDb endpoint, overridable to point at a stub server.
+        api_key (str): OMDb API key.
+        pool_size (int): Maximum number of kept-alive connections.
+        rate (float): Requests per second per host, 0 for no limit.
+        retries (int): Retries after the first failed attempt.
+        backoff (float): Base delay in seconds, doubled on each retry.
+        timeout (float): Per-request timeout in seconds.
+        cache (ResponseCache, optional): Response cache consulted before
+            any request. Defaults to omdb_cache.get_cache(); pass False to
+            always go to the network.
+    """
+
+    def __init__(self, base_url=None, api_key=None, pool_size=8, rate=10,
+                 retries=3, backoff=0.5, timeout=10, cache=None):
+        self.base_url = base_url or movie_api.OMDB_API_URL
+        self.api_key = api_key if api_key is not None else movie_api.api_key
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.limiter = RateLimiter(rate, burst=pool_size)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                              pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._host = urlsplit(self.base_url).netloc
+        if cache is None:
+            cache = get_cache()
+        self.cache = None if cache is False else cache
+
+    def fetch(self, movie_name):
+        """
+        Fetch one title or IMDb ID.
+
+        Returns:
+            Movie or None: The movie as returned by
+            movie_omdb_api.parse_movie_info, or None if OMDb does not know
+            the movie or has no rating for it.
+
+        Raises:
+            requests.exceptions.RequestException: When all retries failed.
+        """
+        json_response = self.fetch_json(movie_name)
+        if json_response.get('Response') == 'False':
+            return None
+        try:
+            return movie_api.parse_movie_info(json_response)
+        except ValueError:
+            # Not rated yet, or no release year: nothing we could store
+            return None
+
+    def fetch_json(self, movie_name, max_age=None, year=None):
+        """
+        Fetch the raw OMDb response for one title or IMDb ID, from the
+        cache when it holds one younger than max_age seconds.
+
+        Args:
+            movie_name (str): Title or IMDb ID.
+            max_age (float, optional): Oldest cached response used, in seconds.
+            year (int, optional): Only match a title released that year.
+
+        Raises:
+            requests.exceptions.RequestException: When all retries failed.
+        """
+        json_response = (self.cache.get(movie_name, max_age, year)
+                         if self.cache is not None else None)
+        if json_response is None:
+            json_response = self.fetch_fresh(movie_name, year)
+        return json_response
+
+    def fetch_fresh(self, movie_name, year=None):
+        """
+        Fetch the raw OMDb response for one title or IMDb ID from the API,
+        without looking in the cache, and cache it.
+
+        Raises:
+            requests.exceptions.RequestException: When all retries failed.
+        """
+        json_response = self._request(movie_name, year)
+        if self.cache is not None:
+            self.cache.put(movie_name, json_response, year)
+        return json_response
+
+    @metrics.timed('omdb.request')
+    def _request(self, movie_name, year=None):
+        params = movie_api.build_query_params(movie_name, self.api_key, year)
+        attempt = 0
+        while True:
+            self.limiter.acquire(self._host)
+            try:
+                res = self.session.get(self.base_url, params=params,
+                                       timeout=self.timeout)
+                res.raise_for_status()
+                return res.json()
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout,
+                    requests.exceptions.HTTPError) as e:
+                status = getattr(e.response, 'status_code', None)
+                if status is not None and status not in RETRY_STATUS_CODES:
+                    raise
+                if attempt >= self.retries:
+                    raise
+            delay = self.backoff * (2 ** attempt)
+            time.sleep(delay + random.uniform(0, delay / 2))
+            attempt += 1
+
+    def close(self):
+        self.session.close()
+
+
+class ImportReport:
+    """Counters collected during a bulk import."""
+
+    def __init__(self):
+        self.requested = 0
+        self.stored = 0
+        self.not_found = []
+        self.failed = []
+        self.elapsed = 0.0
+
+    def __str__(self):
+        return (f'{self.requested} requested, {self.stored} stored, '
+                f'{len(self.not_found)} not found, {len(self.failed)} failed '
+                f'in {self.elapsed:.1f}s')
+
+
+@metrics.timed('omdb.bulk_import')
+def bulk_import(titles, fetcher=None, workers=8, batch_size=500):
+    """
+    Fetch movies concurrently and store them in batched transactions.
+
+    At most workers * 4 requests are in flight at any time, so the input
+    can be arbitrarily long without buffering it in memory.
+
+    Args:
+        titles (iterable of str): Titles or IMDb IDs.
+        fetcher (OmdbFetcher, optional): Defaults to a fetcher with a
+            connection pool sized to the number of workers.
+        workers (int): Number of concurrent requests.
+        batch_size (int): Movies stored per transaction.
+
+    Returns:
+        ImportReport: Summary of the import.
+    """
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        fetcher = OmdbFetcher(pool_size=workers)
+    report = ImportReport()
+    batch = []
+    start = time.perf_counter()
+
+    def flush():
+        if batch:
+            outcomes = storage.add_movies(batch, replace=False, fetched_at=time.time())
+            report.stored += outcomes.count(storage.ADDED)
+            batch.clear()
+
+    def collect(done):
+        for future in done:
+            name = pending.pop(future)
+            try:
+                movie_info = future.result()
+            except requests.exceptions.RequestException as e:
+                report.failed.append((name, str(e)))
+                continue
+            if movie_info is None:
+                report.not_found.append(name)
+                continue
+            batch.append(movie_info)
+            if len(batch) >= batch_size:
+                flush()
+
+    pending = {}
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for name in titles:
+                report.requested += 1
+                pending[executor.submit(fetcher.fetch, name)] = name
+                if len(pending) >= workers * 4:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        flush()
+    finally:
+        if own_fetcher:
+            fetcher.close()
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Bulk import movies from OMDb into the database.')
+    parser.add_argument('source',
+                        help="file with one title or IMDb ID per line, "
+                             "or '-' for stdin")
+    parser.add_argument('--workers', type=int, default=8,
+                        help='concurrent requests (default: 8)')
+    parser.add_argument('--rate', type=float, default=10,
+                        help='requests per second, 0 for no limit (default: 10)')
+    parser.add_argument('--batch-size', type=int, default=500,
+                        help='movies stored per transaction (default: 500)')
+    parser.add_argument('--retries', type=int, default=3,
+                        help='retries per title on transient errors (default: 3)')
+    parser.add_argument('--base-url', default=None,
+                        help='OMDb endpoint (default: OMDB_API_URL)')
+    args = parser.parse_args(argv)
+
+    fetcher = OmdbFetcher(base_url=args.base_url, pool_size=args.workers,
+                          rate=args.rate, retries=args.retries)
+    try:
+        report = bulk_import(read_titles(args.source), fetcher=fetcher,
+                             workers=args.workers, batch_size=args.batch_size)
+    finally:
+        fetcher.close()
+    print(report)
+    for name, error in report.failed:
+        print(f'Failed: {name}: {error}')
+
+
+if __name__ == '__main__':
+    main()
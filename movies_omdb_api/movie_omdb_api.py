@@ -3,19 +3,44 @@ import os
 import requests
 from dotenv import load_dotenv
 
-OMDB_MAIN_URL_LINK = ' http://www.omdbapi.com/?i=tt3896198&apikey='
+from instrumentation import metrics
+from movies_omdb_api.omdb_cache import IMDB_ID_PATTERN, get_cache
+from storage_api.movie_record import Movie
+
+OMDB_API_URL = os.getenv('OMDB_API_URL', 'http://www.omdbapi.com/')
 
 load_dotenv()
 api_key = os.getenv('API_KEY')
 
 movie_name = 'The Matrix'
-def get_json_response_using_api(movie_name):
-    movie_link = OMDB_MAIN_URL_LINK + api_key + '&t=' + movie_name
+@metrics.timed('omdb.get_json_response_using_api')
+def get_json_response_using_api(movie_name, cache=None):
+    """
+    Look up a title or IMDb ID on OMDb, serving repeated lookups
+    (including "Movie not found" answers) from the on-disk response cache.
+
+    Args:
+        movie_name (str): Movie title or IMDb ID.
+        cache (ResponseCache, optional): Defaults to the cache configured
+            by omdb_cache.get_cache().
+
+    Returns:
+        dict or None: The OMDb JSON response, or None if the movie was not
+        found or the request failed.
+    """
+    if cache is None:
+        cache = get_cache()
+    json_response = cache.get(movie_name) if cache is not None else None
 
     try:
-        res = requests.get(movie_link, timeout=10)
-        res.raise_for_status()  # Raises HTTPError for 4xx/5xx status codes
-        json_response = res.json()
+        if json_response is None:
+            with metrics.span('omdb.request'):
+                res = requests.get(OMDB_API_URL, params=build_query_params(movie_name),
+                                   timeout=10)
+            res.raise_for_status()  # Raises HTTPError for 4xx/5xx status codes
+            json_response = res.json()
+            if cache is not None:
+                cache.put(movie_name, json_response)
 
         # Check if movie was not found in the response
         if json_response.get("Response") == "False":
@@ -28,16 +53,49 @@ def get_json_response_using_api(movie_name):
         print(f"API request failed: {e}")
         return None
 
+def build_query_params(movie_name, key=None, year=None):
+    """
+    Build the OMDb query parameters for a title or an IMDb ID.
+
+    Args:
+        movie_name (str): Movie title, or an IMDb ID such as 'tt0133093'.
+        key (str, optional): API key. Defaults to the key from the environment.
+        year (int, optional): Only match a title released that year, so a
+            remake and its original aren't mistaken for each other.
+
+    Returns:
+        dict: Query parameters for a request to OMDB_API_URL.
+    """
+    movie_name = movie_name.strip()
+    if IMDB_ID_PATTERN.match(movie_name):
+        lookup, movie_name = 'i', movie_name.lower()
+    else:
+        lookup = 't'
+    params = {'apikey': key if key is not None else api_key, lookup: movie_name}
+    if year is not None and lookup == 't':
+        params['y'] = year
+    return params
+
+
+def parse_movie_info(json_response):
+    """
+    Extract the fields we store from a successful OMDb JSON response.
+
+    Returns:
+        Movie: The normalized movie.
+
+    Raises:
+        ValueError: When OMDb has no year or no rating for the movie yet.
+    """
+    return Movie.from_omdb(json_response)
+
+
 def get_movie_info(movie_name):
-    title = ''
-    year = ''
-    rating = ''
-    image_link = ''
     json_response = get_json_response_using_api(movie_name)
-    if json_response is not None:
-        title = json_response['Title']
-        year = json_response['Year']
-        rating = json_response['imdbRating']
-        img_link = json_response['Poster']
-        return {'title': title, 'year': year, 'rating': rating, 'image_link': img_link}
-    return None
+    if json_response is None:
+        return None
+    try:
+        return parse_movie_info(json_response)
+    except ValueError as e:
+        print(f"Movie can't be added: {e}")
+        return None
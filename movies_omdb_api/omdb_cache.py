@@ -0,0 +1,222 @@
+"""
+Persistent on-disk cache of raw OMDb JSON responses.
+
+Responses are stored in a small SQLite file keyed by the normalized title
+or IMDb ID. Found movies and "Movie not found" answers have separate
+TTLs, and the least recently used entries are evicted once the cache
+grows past its size cap.
+
+Configuration (environment variables):
+    OMDB_CACHE_PATH          cache file, '' disables the cache
+                             (default: database/omdb_cache.sqlite3)
+    OMDB_CACHE_TTL           seconds to keep found movies (default: 30 days)
+    OMDB_CACHE_NEGATIVE_TTL  seconds to keep "not found" answers (default: 1 day)
+    OMDB_CACHE_MAX_ENTRIES   size cap (default: 100000)
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from instrumentation import metrics
+
+DEFAULT_CACHE_PATH = 'database/omdb_cache.sqlite3'
+DEFAULT_TTL = 30 * 24 * 3600
+DEFAULT_NEGATIVE_TTL = 24 * 3600
+DEFAULT_MAX_ENTRIES = 100_000
+
+# IMDb IDs such as 'tt0133093', in any case; shared with the API client so
+# the cache and OMDb agree on what is an ID lookup
+IMDB_ID_PATTERN = re.compile(r'^tt\d{7,}$', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_key(movie_name, year=None):
+    """
+    Normalize a title or IMDb ID, and the year a title lookup was narrowed
+    to, into a cache key.
+
+    'The  Matrix ' and 'the matrix' share a key; IMDb IDs are kept apart
+    from titles so 'tt0133093' never collides with a movie of that name,
+    and a lookup of a title in one year from the lookup of the title alone.
+    """
+    name = _WHITESPACE.sub(' ', movie_name.strip())
+    if IMDB_ID_PATTERN.match(name):
+        return 'i:' + name.lower()
+    return 't:' + name.casefold() + (f'|y:{year}' if year is not None else '')
+
+
+class ResponseCache:
+    """
+    SQLite-backed cache of OMDb responses with TTL and LRU eviction.
+
+    The cache is safe to share between threads.
+
+    Args:
+        path (str): Cache file, or ':memory:' for a throwaway cache.
+        ttl (float): Seconds a found movie stays fresh.
+        negative_ttl (float): Seconds a "not found" answer stays fresh.
+        max_entries (int): Entries kept before the least recently used
+            ones are evicted.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL,
+                 negative_ttl=DEFAULT_NEGATIVE_TTL,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if path != ':memory:' and directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False,
+                                           isolation_level=None)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                found INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_responses_last_used
+                ON responses (last_used);
+        """)
+        self._size = self._connection.execute(
+            'SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def get(self, movie_name, max_age=None, year=None):
+        """
+        Return the cached JSON response for a title or IMDb ID; see lookup.
+
+        Returns:
+            dict or None: The raw OMDb response, or None on a miss.
+        """
+        entry = self.lookup(movie_name, max_age, year)
+        return entry[0] if entry is not None else None
+
+    def lookup(self, movie_name, max_age=None, year=None):
+        """
+        Return the cached JSON response for a title or IMDb ID and when it
+        was fetched.
+
+        Args:
+            movie_name (str): Title or IMDb ID.
+            max_age (float, optional): Also treat entries stored more than
+                this many seconds ago as expired.
+            year (int, optional): Release year the lookup was narrowed to.
+
+        Returns:
+            tuple or None: (response, stored_at): the raw OMDb response,
+            including negative '{"Response": "False", ...}' answers, and
+            the Unix time it was stored. None on a miss or when the entry
+            has expired.
+        """
+        key = normalize_key(movie_name, year)
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT response, found, stored_at FROM responses WHERE key = ?',
+                (key,)).fetchone()
+            if row is not None:
+                response, found, stored_at = row
+                ttl = self.ttl if found else self.negative_ttl
+                if max_age is not None:
+                    ttl = min(ttl, max_age)
+                if now - stored_at <= ttl:
+                    self._connection.execute(
+                        'UPDATE responses SET last_used = ? WHERE key = ?',
+                        (now, key))
+                    self.hits += 1
+                    metrics.count('omdb_cache.hits')
+                    return json.loads(response), stored_at
+            self.misses += 1
+            metrics.count('omdb_cache.misses')
+            return None
+
+    def put(self, movie_name, json_response, year=None):
+        """Store a raw OMDb response and evict old entries if needed."""
+        key = normalize_key(movie_name, year)
+        found = json_response.get('Response') != 'False'
+        now = time.time()
+        with self._lock:
+            existed = self._connection.execute(
+                'SELECT 1 FROM responses WHERE key = ?', (key,)).fetchone()
+            self._connection.execute(
+                'INSERT INTO responses (key, response, found, stored_at, last_used) '
+                'VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET response = excluded.response, '
+                'found = excluded.found, stored_at = excluded.stored_at, '
+                'last_used = excluded.last_used',
+                (key, json.dumps(json_response), int(found), now, now))
+            if existed is None:
+                self._size += 1
+            if self._size > self.max_entries:
+                self._evict(self._size - self.max_entries)
+
+    def _evict(self, count):
+        cursor = self._connection.execute(
+            'DELETE FROM responses WHERE key IN '
+            '(SELECT key FROM responses ORDER BY last_used LIMIT ?)', (count,))
+        self._size -= cursor.rowcount
+        self.evictions += cursor.rowcount
+
+    def purge_expired(self):
+        """Delete every expired entry. Returns the number removed."""
+        now = time.time()
+        with self._lock:
+            cursor = self._connection.execute(
+                'DELETE FROM responses WHERE (found AND stored_at < ?) '
+                'OR (NOT found AND stored_at < ?)',
+                (now - self.ttl, now - self.negative_ttl))
+            self._size -= cursor.rowcount
+            return cursor.rowcount
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute('DELETE FROM responses')
+            self._size = 0
+
+    def stats(self):
+        """Return the hit/miss counters and current size."""
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'size': self._size}
+
+    def __len__(self):
+        return self._size
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Return the process-wide cache configured from the environment, or
+    None when OMDB_CACHE_PATH is set to an empty string.
+    """
+    global _default_cache
+    path = os.getenv('OMDB_CACHE_PATH', DEFAULT_CACHE_PATH)
+    if not path:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache(
+                path,
+                ttl=float(os.getenv('OMDB_CACHE_TTL', DEFAULT_TTL)),
+                negative_ttl=float(os.getenv('OMDB_CACHE_NEGATIVE_TTL',
+                                             DEFAULT_NEGATIVE_TTL)),
+                max_entries=int(os.getenv('OMDB_CACHE_MAX_ENTRIES',
+                                          DEFAULT_MAX_ENTRIES)))
+        return _default_cache
@@ -0,0 +1,209 @@
+"""
+Re-sync stored ratings with OMDb, stalest (or most popular) movies first.
+
+Every movie records when it was last fetched (fetched_at), set when it is
+added from OMDb and on every refresh. Movies are looked up by title and
+stored year, so a remake and its original keep their own ratings. A refresh run
+walks the movies fetched more than --max-age ago, answers what it can from
+the OMDb response cache and fetches the rest concurrently until its
+request budget is spent. Results are written in batched transactions; a
+rating is only updated, and logged as a change, when it differs.
+
+A run can be interrupted at any point: completed fetches are flushed on
+the way out, and since refreshed movies are no longer stale, running the
+same command again picks up where it stopped.
+
+Usage:
+    python -m movies_omdb_api.refresh --budget 1000 --max-age-days 7
+"""
+import argparse
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+from instrumentation import metrics
+from movies_omdb_api.bulk_import import OmdbFetcher
+from storage_api import movie_query as query
+from storage_api import movie_storage_sql as storage
+from storage_api.movie_record import parse_rating, parse_votes, parse_year
+
+DAY = 24 * 3600
+DEFAULT_MAX_AGE = 7 * DAY
+DEFAULT_BUDGET = 1000
+
+
+class RefreshReport:
+    """Counters collected during a refresh run."""
+
+    def __init__(self):
+        self.checked = 0
+        self.requests = 0
+        self.cached = 0
+        self.changed = 0
+        self.not_found = 0
+        self.failed = []
+        self.elapsed = 0.0
+
+    def __str__(self):
+        return (f'{self.checked} checked ({self.requests} requested, {self.cached} '
+                f'from cache), {self.changed} ratings changed, {self.not_found} not '
+                f'found, {len(self.failed)} failed in {self.elapsed:.1f}s')
+
+
+def is_found(movie, json_response):
+    """
+    Return whether an OMDb response describes the stored movie. A response
+    for a film of another year (a remake, or the original) doesn't.
+    """
+    return (json_response.get('Response') != 'False'
+            and parse_year(json_response.get('Year')) in (None, movie['year']))
+
+
+def refresh_result(movie, json_response, fetched_at):
+    """
+    Turn an OMDb response for a stored movie into a record_refreshes row.
+    A response that isn't for the movie leaves its rating alone.
+    """
+    if not is_found(movie, json_response):
+        return {'id': movie['id'], 'rating': None, 'votes': None,
+                'fetched_at': fetched_at}
+    return {'id': movie['id'],
+            'rating': parse_rating(json_response.get('imdbRating')),
+            'votes': parse_votes(json_response.get('imdbVotes')),
+            'fetched_at': fetched_at}
+
+
+@metrics.timed('omdb.refresh')
+def refresh_ratings(budget=DEFAULT_BUDGET, max_age=DEFAULT_MAX_AGE, prioritize='stale',
+                    fetcher=None, workers=8, batch_size=500):
+    """
+    Refresh the ratings of stale movies.
+
+    Args:
+        budget (int): Most OMDb requests made; cached responses are free.
+        max_age (float): Seconds after which a movie counts as stale.
+        prioritize (str): One of movie_query.REFRESH_ORDERS.
+        fetcher (OmdbFetcher, optional): Defaults to a fetcher with a
+            connection pool sized to the number of workers.
+        workers (int): Number of concurrent requests.
+        batch_size (int): Movies stored per transaction.
+
+    Returns:
+        RefreshReport: Summary of the run.
+    """
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        fetcher = OmdbFetcher(pool_size=workers)
+    report = RefreshReport()
+    start = time.perf_counter()
+    batch = []
+
+    def flush():
+        if batch:
+            report.changed += storage.record_refreshes(batch)
+            batch.clear()
+
+    def add(movie, json_response, fetched_at):
+        if not is_found(movie, json_response):
+            report.not_found += 1
+        batch.append(refresh_result(movie, json_response, fetched_at))
+        if len(batch) >= batch_size:
+            flush()
+
+    def collect(done):
+        for future in done:
+            movie = pending.pop(future)
+            try:
+                add(movie, future.result(), time.time())
+            except requests.exceptions.RequestException as e:
+                report.failed.append((movie['title'], str(e)))
+
+    pending = {}
+    fetched_before = time.time() - max_age
+    # Failed movies stay stale, at the front of the order: skip past them
+    skipped = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                exhausted = False
+                while not exhausted:
+                    page = query.stale_movies(fetched_before, prioritize,
+                                              limit=batch_size, offset=skipped)
+                    if not page:
+                        break
+                    for movie in page:
+                        cached = (fetcher.cache.lookup(movie['title'], max_age,
+                                                       movie['year'])
+                                  if fetcher.cache is not None else None)
+                        if cached is not None:
+                            report.cached += 1
+                            report.checked += 1
+                            # Fresh as of when OMDb answered, not as of now
+                            add(movie, *cached)
+                            continue
+                        if report.requests >= budget:
+                            exhausted = True
+                            break
+                        report.checked += 1
+                        report.requests += 1
+                        # The cache was just checked: go straight to OMDb
+                        future = executor.submit(fetcher.fetch_fresh, movie['title'],
+                                                 movie['year'])
+                        pending[future] = movie
+                        if len(pending) >= workers * 4:
+                            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                            collect(done)
+                    # Store the page before asking for the next one, which
+                    # then no longer contains it
+                    failed = len(report.failed)
+                    collect(wait(pending).done)
+                    flush()
+                    skipped += len(report.failed) - failed
+            finally:
+                # On KeyboardInterrupt, keep what was already fetched
+                for future in pending:
+                    future.cancel()
+                collect([future for future in wait(pending).done
+                         if not future.cancelled()])
+    finally:
+        flush()
+        if own_fetcher:
+            fetcher.close()
+        report.elapsed = time.perf_counter() - start
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--budget', type=int, default=DEFAULT_BUDGET,
+                        help=f'most OMDb requests made (default: {DEFAULT_BUDGET})')
+    parser.add_argument('--max-age-days', type=float, default=DEFAULT_MAX_AGE / DAY,
+                        help='refresh movies fetched longer ago than this (default: 7)')
+    parser.add_argument('--prioritize', choices=sorted(query.REFRESH_ORDERS),
+                        default='stale')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='concurrent requests (default: 8)')
+    parser.add_argument('--rate', type=float, default=10,
+                        help='requests per second, 0 for no limit (default: 10)')
+    parser.add_argument('--batch-size', type=int, default=500,
+                        help='movies stored per transaction (default: 500)')
+    parser.add_argument('--base-url', default=None,
+                        help='OMDb endpoint (default: OMDB_API_URL)')
+    args = parser.parse_args(argv)
+
+    fetcher = OmdbFetcher(base_url=args.base_url, pool_size=args.workers,
+                          rate=args.rate)
+    try:
+        report = refresh_ratings(args.budget, args.max_age_days * DAY, args.prioritize,
+                                 fetcher=fetcher, workers=args.workers,
+                                 batch_size=args.batch_size)
+    finally:
+        fetcher.close()
+    print(report)
+    for name, error in report.failed:
+        print(f'Failed: {name}: {error}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Common storage protocol over the SQL and JSON-log backends.
+
+Both backends store the same movie records ('title', 'year', 'rating',
+'image_link', with titles matched ignoring case and extra spaces) and
+offer the same methods:
+
+    get_movie(title)                  -> Movie or None
+    iter_movies()                     -> iterator of Movie, oldest first
+    count_movies()                    -> int
+    add_movies(movies, replace=True, fetched_at=None)
+                                      -> list of outcomes
+    update_ratings(ratings)           -> list of outcomes
+    delete_movies(titles)             -> list of outcomes
+    close()
+
+MOVIES_STORAGE_BACKEND selects the backend open_store() returns: "sql"
+(the default; MOVIES_DB_URL picks the database) or "jsonlog"
+(MOVIES_JSON_LOG picks the log file). Search, filtered listings,
+statistics, the change feed and the website are built on the SQL
+indexes and triggers, so they need the SQL backend.
+"""
+import os
+
+from storage_api import movie_query as query
+from storage_api import movie_storage_sql as storage
+from storage_api.movie_record import Movie
+from storage_api.movie_storage import JsonLogStore
+
+SQL = "sql"
+JSON_LOG = "jsonlog"
+BACKENDS = (SQL, JSON_LOG)
+
+STORAGE_BACKEND = os.getenv("MOVIES_STORAGE_BACKEND", SQL)
+JSON_LOG_PATH = os.getenv("MOVIES_JSON_LOG", os.path.join("database", "movies.jsonl"))
+
+# Movies copied per write call by migrate
+MIGRATE_BATCH_SIZE = 5000
+
+
+class SqlStore:
+    """
+    The storage protocol over movie_storage_sql.
+
+    Args:
+        db_url (str, optional): Database to switch movie_storage_sql to.
+            The module has one engine per process, so this moves every
+            other user of it over as well.
+    """
+
+    def __init__(self, db_url=None):
+        if db_url is not None:
+            storage.configure(db_url)
+
+    def get_movie(self, title):
+        return storage.get_movie(title)
+
+    def iter_movies(self):
+        for movie in query.iter_movies():
+            yield Movie(movie["title"], movie["year"], movie["rating"], movie["image_link"])
+
+    def count_movies(self):
+        return query.count_movies()
+
+    def add_movies(self, movies, replace=True, fetched_at=None):
+        return storage.add_movies(movies, replace=replace, fetched_at=fetched_at)
+
+    def update_ratings(self, ratings):
+        return storage.update_ratings(ratings)
+
+    def delete_movies(self, titles):
+        return storage.delete_movies(titles)
+
+    def close(self):
+        pass
+
+
+def open_store(backend=None, location=None):
+    """
+    Open a storage backend.
+
+    Args:
+        backend (str, optional): One of BACKENDS; STORAGE_BACKEND by default.
+        location (str, optional): Database URL for "sql", log path for
+            "jsonlog"; the configured one by default.
+
+    Returns:
+        SqlStore or JsonLogStore: The opened store.
+    """
+    backend = backend or STORAGE_BACKEND
+    if backend == SQL:
+        return SqlStore(location)
+    if backend == JSON_LOG:
+        return JsonLogStore(location or JSON_LOG_PATH)
+    raise ValueError(f"unknown storage backend {backend!r}; use one of {', '.join(BACKENDS)}")
+
+
+def migrate(movies, target, batch_size=None):
+    """
+    Copy movies into a store, streaming them in batches so memory stays
+    bounded. Movies already in the target are replaced.
+
+    Args:
+        movies (iterable of Movie or dict): Movies to copy, such as
+            source.iter_movies() of another store.
+        target: Store to write.
+        batch_size (int, optional): Movies per write call.
+
+    Returns:
+        int: Number of movies copied.
+    """
+    batch_size = batch_size or MIGRATE_BATCH_SIZE
+    copied = 0
+    batch = []
+    for movie in movies:
+        batch.append(movie)
+        if len(batch) >= batch_size:
+            target.add_movies(batch, replace=True)
+            copied += len(batch)
+            batch = []
+    if batch:
+        target.add_movies(batch, replace=True)
+        copied += len(batch)
+    return copied
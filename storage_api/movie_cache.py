@@ -0,0 +1,233 @@
+"""
+Read-through cache of the catalog for one interactive session.
+
+The first listing loads the movies table once; later listings, sorted and
+filtered views, random picks and title lookups are answered from memory.
+Before every read the cache compares its version with
+storage.data_version(), a single-row query, so a write by another process
+is noticed and the table is loaded again on the next listing.
+
+Writes made through the cache go straight to SQLite. In the same
+transaction the cache checks that data_version moved by exactly the rows
+it changed: if so, it patches the changed movies in place and keeps its
+contents; if not, something else wrote in between and it drops them.
+Sorted views are derived from the cached movies and rebuilt after a write.
+"""
+import random
+from operator import attrgetter
+
+from sqlalchemy import bindparam, text
+
+from instrumentation import metrics
+from storage_api import movie_storage_sql as storage
+from storage_api.movie_record import Movie
+
+# Rows fetched per round trip while loading the catalog
+FETCH_SIZE = 10000
+
+
+def _load_rows(connection, keys=None):
+    """Return {title_key: Movie} of the given keys (all movies when None), in id order."""
+    sql = "SELECT title_key, title, year, rating, image_link FROM movies"
+    params = {}
+    if keys is not None:
+        sql += " WHERE title_key IN :keys"
+        params["keys"] = list(keys)
+    statement = text(sql + " ORDER BY id")
+    if keys is not None:
+        statement = statement.bindparams(bindparam("keys", expanding=True))
+    result = connection.execution_options(yield_per=FETCH_SIZE).execute(statement, params)
+    movies = {}
+    for title_key, title, year, rating, image_link in result:
+        movies[title_key] = Movie(title, year, rating, image_link)
+    metrics.count("movie_cache.rows_loaded", len(movies))
+    return movies
+
+
+def _matches(movie, min_rating, start_year, end_year):
+    return ((min_rating is None or movie.rating >= min_rating)
+            and (start_year is None or movie.year >= start_year)
+            and (end_year is None or movie.year <= end_year))
+
+
+class CatalogCache:
+    """
+    In-memory copy of the movies table, kept consistent with SQLite through
+    storage.data_version().
+
+    Attributes:
+        version (int): data_version the cached movies correspond to, or
+            None before the first load.
+    """
+
+    def __init__(self):
+        self.version = None
+        # title_key -> Movie, in id order like the table
+        self._movies = None
+        # (order_by, descending) -> sorted list of Movie
+        self._views = {}
+
+    def invalidate(self):
+        """Forget the cached movies; the next listing loads them again."""
+        self.version = None
+        self._movies = None
+        self._views = {}
+
+    def _current(self):
+        """Return the cached movies if they are still up to date, else None."""
+        if self._movies is not None and storage.data_version() != self.version:
+            self.invalidate()
+        if self._movies is not None:
+            metrics.count("movie_cache.hit")
+        return self._movies
+
+    @metrics.timed("movie_cache.load")
+    def _load(self):
+        with storage.get_engine().connect() as connection:
+            # Read the version first: a write during the load then leaves it
+            # behind, and the next read loads again
+            version = storage.data_version(connection)
+            self._movies = _load_rows(connection)
+        self.version = version
+        self._views = {}
+        metrics.count("movie_cache.miss")
+        return self._movies
+
+    def _all(self):
+        movies = self._current()
+        return movies if movies is not None else self._load()
+
+    # Reads
+
+    def get_movie(self, title):
+        """
+        Look up one movie by title, ignoring case and extra spaces.
+
+        Answered from memory once the catalog is loaded; before that a
+        lookup is a single indexed query and doesn't load the catalog.
+
+        Returns:
+            Movie: The movie, or None.
+        """
+        movies = self._current()
+        if movies is None:
+            return storage.get_movie(title)
+        return movies.get(storage.normalize_title(title))
+
+    def movies(self, order_by="id", descending=False, min_rating=None,
+               start_year=None, end_year=None):
+        """
+        Return the movies matching the filters, in the order of
+        movie_query.iter_movies: sorted by order_by, ties broken by id.
+
+        Args:
+            order_by (str): "id", "title", "rating" or "year".
+            descending (bool): Sort direction.
+            min_rating (float, optional): Inclusive lower rating bound.
+            start_year, end_year (int, optional): Inclusive year bounds.
+
+        Returns:
+            list of Movie: The movies; don't modify the list.
+        """
+        view = self._view(order_by, descending)
+        if min_rating is None and start_year is None and end_year is None:
+            return view
+        return [movie for movie in view
+                if _matches(movie, min_rating, start_year, end_year)]
+
+    def _view(self, order_by, descending):
+        movies = self._all()
+        view = self._views.get((order_by, descending))
+        if view is not None:
+            return view
+        # Titles are unique; for the other columns the stable sort keeps
+        # ties in the order of its input, which is id order reversed for
+        # descending views, like ORDER BY ... DESC, id DESC
+        if order_by == "id":
+            view = list(movies.values())
+        elif order_by == "title":
+            view = [movie for _, movie in sorted(movies.items())]
+        else:
+            ordered = reversed(movies.values()) if descending else movies.values()
+            view = sorted(ordered, key=attrgetter(order_by), reverse=descending)
+        if descending and order_by in ("id", "title"):
+            view.reverse()
+        self._views[(order_by, descending)] = view
+        return view
+
+    def count(self):
+        return len(self._all())
+
+    def random_movie(self, rng=random):
+        """Return a uniformly chosen movie, or None for an empty catalog."""
+        view = self._view("id", False)
+        return rng.choice(view) if view else None
+
+    # Writes
+
+    def _write(self, write, keys):
+        """
+        Run write(connection) in a transaction and patch the cached movies
+        with the rows of keys afterwards.
+
+        Returns:
+            list of str: The outcomes returned by write.
+        """
+        with storage.get_engine().begin() as connection:
+            before = storage.data_version(connection)
+            outcomes = write(connection)
+            changed = sum(outcome in (storage.ADDED, storage.UPDATED, storage.DELETED)
+                          for outcome in outcomes)
+            after = storage.data_version(connection)
+            patch = (self._movies is not None and before == self.version
+                     and after == before + changed)
+            rows = _load_rows(connection, keys) if patch and changed else None
+        if not patch:
+            self.invalidate()
+            return outcomes
+        if rows is not None:
+            for key in keys:
+                if key in rows:
+                    self._movies[key] = rows[key]
+                else:
+                    self._movies.pop(key, None)
+            self._views = {}
+        self.version = after
+        return outcomes
+
+    def add_movie(self, movie, replace=False, fetched_at=None):
+        """
+        Add one movie; see movie_storage_sql.add_movies.
+
+        Returns:
+            str: ADDED, UPDATED or SKIPPED.
+        """
+        movie = Movie.coerce(movie)
+        outcome, = self._write(
+            lambda connection: storage.add_movies([movie], replace, connection, fetched_at),
+            [storage.normalize_title(movie.title)])
+        return outcome
+
+    def update_rating(self, title, rating):
+        """
+        Update the rating of one movie; see movie_storage_sql.update_ratings.
+
+        Returns:
+            str: UPDATED or MISSING.
+        """
+        outcome, = self._write(
+            lambda connection: storage.update_ratings([(title, rating)], connection),
+            [storage.normalize_title(title)])
+        return outcome
+
+    def delete_movie(self, title):
+        """
+        Delete one movie; see movie_storage_sql.delete_movies.
+
+        Returns:
+            str: DELETED or MISSING.
+        """
+        outcome, = self._write(
+            lambda connection: storage.delete_movies([title], connection),
+            [storage.normalize_title(title)])
+        return outcome
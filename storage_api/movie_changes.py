@@ -0,0 +1,80 @@
+"""
+Change-data-capture feed over the movie_changes log.
+
+Triggers append one row to movie_changes for every insert, update and
+delete of a movie, numbered by a strictly increasing seq. A consumer keeps
+the seq of the last change it processed as its cursor and asks for the
+changes after it, instead of re-reading the whole movies table:
+
+    cursor = load_my_cursor()
+    for change in changes_since(cursor):
+        apply(change)
+        cursor = change["seq"]
+"""
+from sqlalchemy import text
+
+from storage_api import movie_storage_sql as storage
+
+# Changes fetched per round trip by changes_since
+PAGE_SIZE = 1000
+
+INSERT = "insert"
+UPDATE = "update"
+DELETE = "delete"
+
+
+def changes_since(cursor=0, limit=None, page_size=None):
+    """
+    Yield the changes made after a cursor, oldest first.
+
+    Changes are read one keyset page at a time, so the feed can be
+    consumed while it grows without holding a read transaction open.
+
+    Args:
+        cursor (int): seq of the last change already processed; 0 for the
+            whole log.
+        limit (int, optional): Maximum number of changes yielded.
+        page_size (int, optional): Changes per query, PAGE_SIZE by default.
+
+    Yields:
+        dict: 'seq', 'op' (INSERT, UPDATE or DELETE), 'movie_id', 'title',
+        'year', 'rating', 'image_link' (None for deletes) and 'changed_at'.
+    """
+    page_size = page_size or PAGE_SIZE
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        with storage.get_engine().connect() as connection:
+            rows = connection.execute(text(
+                "SELECT seq, op, movie_id, title, year, rating, image_link, changed_at "
+                "FROM movie_changes WHERE seq > :cursor ORDER BY seq LIMIT :limit"),
+                {"cursor": cursor, "limit": size}).fetchall()
+        for row in rows:
+            yield {"seq": row[0], "op": row[1], "movie_id": row[2], "title": row[3],
+                   "year": row[4], "rating": row[5], "image_link": row[6],
+                   "changed_at": row[7]}
+        if len(rows) < size:
+            return
+        cursor = rows[-1][0]
+        if remaining is not None:
+            remaining -= len(rows)
+
+
+def latest_cursor():
+    """Return the seq of the newest change, a cursor that skips all history."""
+    with storage.get_engine().connect() as connection:
+        return connection.execute(
+            text("SELECT COALESCE(MAX(seq), 0) FROM movie_changes")).scalar()
+
+
+def prune_changes(cursor):
+    """
+    Drop the changes up to and including a cursor, once every consumer has
+    processed them.
+
+    Returns:
+        int: Number of changes removed.
+    """
+    with storage.get_engine().begin() as connection:
+        return connection.execute(text("DELETE FROM movie_changes WHERE seq <= :cursor"),
+                                  {"cursor": cursor}).rowcount
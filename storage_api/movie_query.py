@@ -0,0 +1,317 @@
+"""
+Query API that pushes filtering, sorting and pagination down into SQLite.
+
+Every query is answered from the indexes on rating, year and title_key,
+so callers never have to load the whole movies table to show one page
+of it.
+"""
+from sqlalchemy import text
+
+from instrumentation import metrics
+from storage_api import movie_storage_sql as storage
+
+# Sort keys accepted by query_movies, mapped to their indexed columns
+SORT_COLUMNS = {
+    "id": "id",
+    "title": "title_key",
+    "rating": "rating",
+    "year": "year",
+}
+
+# Rows fetched per round trip by iter_movies
+PAGE_SIZE = 500
+
+
+def _escape_like(term):
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _where_clause(min_rating=None, max_rating=None, start_year=None, end_year=None,
+                  title_contains=None, rating_below=None):
+    conditions = []
+    params = {}
+    if min_rating is not None:
+        conditions.append("rating >= :min_rating")
+        params["min_rating"] = min_rating
+    if max_rating is not None:
+        conditions.append("rating <= :max_rating")
+        params["max_rating"] = max_rating
+    if rating_below is not None:
+        conditions.append("rating < :rating_below")
+        params["rating_below"] = rating_below
+    if start_year is not None:
+        conditions.append("year >= :start_year")
+        params["start_year"] = start_year
+    if end_year is not None:
+        conditions.append("year <= :end_year")
+        params["end_year"] = end_year
+    if title_contains:
+        conditions.append("title_key LIKE :title_pattern ESCAPE '\\'")
+        params["title_pattern"] = f"%{_escape_like(storage.normalize_title(title_contains))}%"
+    return conditions, params
+
+
+@metrics.timed('query.query_movies')
+def query_movies(min_rating=None, max_rating=None, start_year=None, end_year=None,
+                 title_contains=None, order_by="id", descending=False,
+                 limit=None, offset=0, after=None, rating_below=None):
+    """
+    Return the movies matching the given filters, sorted and paginated by
+    SQLite.
+
+    Args:
+        min_rating, max_rating (float, optional): Inclusive rating bounds.
+        rating_below (float, optional): Exclusive upper rating bound.
+        start_year, end_year (int, optional): Inclusive year bounds.
+        title_contains (str, optional): Case-insensitive title substring.
+        order_by (str): One of SORT_COLUMNS. Ties are broken by id.
+        descending (bool): Sort direction.
+        limit (int, optional): Maximum number of movies returned.
+        offset (int): Movies skipped before the first one returned.
+        after (tuple, optional): Keyset cursor from page_cursor(); only
+            movies sorting after it are returned. Prefer it over offset
+            for deep pages, since it does not rescan skipped rows.
+
+    Returns:
+        list of dict: Movies with 'id', 'title', 'year', 'rating' and
+        'image_link' keys.
+    """
+    column = SORT_COLUMNS[order_by]
+    conditions, params = _where_clause(min_rating, max_rating, start_year,
+                                       end_year, title_contains, rating_below)
+    if after is not None:
+        conditions.append(f"({column}, id) {'<' if descending else '>'} "
+                          f"(:after_value, :after_id)")
+        params["after_value"], params["after_id"] = after
+    direction = "DESC" if descending else "ASC"
+    sql = "SELECT id, title, year, rating, image_link, title_key FROM movies"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    if column == "id":
+        sql += f" ORDER BY id {direction}"
+    else:
+        sql += f" ORDER BY {column} {direction}, id {direction}"
+    if limit is not None or offset:
+        sql += " LIMIT :limit OFFSET :offset"
+        params["limit"] = -1 if limit is None else limit
+        params["offset"] = offset
+
+    with storage.get_engine().connect() as connection:
+        rows = connection.execute(text(sql), params).fetchall()
+    metrics.count('query.rows_read', len(rows))
+    return [{"id": row[0], "title": row[1], "year": row[2], "rating": row[3],
+             "image_link": row[4], "title_key": row[5]} for row in rows]
+
+
+@metrics.timed('query.movie_by_id')
+def movie_by_id(movie_id):
+    """Return the movie with the given id as a dict, or None."""
+    with storage.get_engine().connect() as connection:
+        row = connection.execute(
+            text("SELECT id, title, year, rating, image_link, title_key FROM movies "
+                 "WHERE id = :id"), {"id": movie_id}).fetchone()
+    if row is None:
+        return None
+    return {"id": row[0], "title": row[1], "year": row[2], "rating": row[3],
+            "image_link": row[4], "title_key": row[5]}
+
+
+def page_cursor(movie, order_by="id"):
+    """Return the keyset cursor that continues a query after the given movie."""
+    column = SORT_COLUMNS[order_by]
+    return movie[column], movie["id"]
+
+
+def iter_movies(order_by="id", descending=False, page_size=None, **filters):
+    """
+    Yield every movie matching the filters, one keyset page at a time, so
+    memory stays bounded however large the catalog is.
+
+    Takes the same filters as query_movies.
+    """
+    page_size = page_size or PAGE_SIZE
+    after = None
+    while True:
+        page = query_movies(order_by=order_by, descending=descending,
+                            limit=page_size, after=after, **filters)
+        yield from page
+        if len(page) < page_size:
+            return
+        after = page_cursor(page[-1], order_by)
+
+
+@metrics.timed('query.page_cursors')
+def page_cursors(per_page, order_by="id", descending=False, **filters):
+    """
+    Return the keyset cursor every page of a listing starts after, so the
+    pages can be fetched independently (and in parallel) with query_movies.
+
+    Only the sort key of every per_page-th row is read, from the index.
+
+    Returns:
+        list: None for the first page, then one cursor per following page.
+        An empty listing still has one (empty) page.
+    """
+    column = SORT_COLUMNS[order_by]
+    conditions, params = _where_clause(**filters)
+    direction = "DESC" if descending else "ASC"
+    order = f"id {direction}" if column == "id" else f"{column} {direction}, id {direction}"
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    params["per_page"] = per_page
+    sql = (f"SELECT value, id FROM (SELECT {column} AS value, id, "
+           f"ROW_NUMBER() OVER (ORDER BY {order}) AS n FROM movies{where}) "
+           f"WHERE n % :per_page = 0 ORDER BY n")
+    with storage.get_engine().connect() as connection:
+        ends = [tuple(row) for row in connection.execute(text(sql), params)]
+        total = connection.execute(text("SELECT COUNT(*) FROM movies" + where),
+                                   params).scalar()
+    pages = max(1, -(-total // per_page))
+    return [None] + ends[:pages - 1]
+
+
+# Orders in which stale_movies returns movies for a refresh. Never
+# fetched movies come first either way; "stale" then takes the oldest
+# fetch, breaking ties within a day by IMDb votes, and "popular" the most
+# voted movie.
+REFRESH_ORDERS = {
+    "stale": "fetched_at IS NOT NULL, CAST(fetched_at / 86400 AS INTEGER), "
+             "COALESCE(votes, 0) DESC, id",
+    "popular": "fetched_at IS NOT NULL, COALESCE(votes, 0) DESC, fetched_at, id",
+}
+
+
+@metrics.timed('query.stale_movies')
+def stale_movies(fetched_before, prioritize="stale", limit=PAGE_SIZE, offset=0):
+    """
+    Return the movies last fetched from OMDb before a time, or never, most
+    urgent first.
+
+    Args:
+        fetched_before (float): Unix time.
+        prioritize (str): One of REFRESH_ORDERS.
+        limit (int): Maximum number of movies returned.
+        offset (int): Movies skipped before the first one returned.
+
+    Returns:
+        list of dict: 'id', 'title', 'year', 'rating', 'votes' and
+        'fetched_at'.
+    """
+    sql = ("SELECT id, title, year, rating, votes, fetched_at FROM movies "
+           "WHERE fetched_at IS NULL OR fetched_at < :fetched_before "
+           f"ORDER BY {REFRESH_ORDERS[prioritize]} LIMIT :limit OFFSET :offset")
+    with storage.get_engine().connect() as connection:
+        rows = connection.execute(text(sql), {"fetched_before": fetched_before,
+                                              "limit": limit, "offset": offset}).fetchall()
+    metrics.count('query.rows_read', len(rows))
+    return [{"id": row[0], "title": row[1], "year": row[2], "rating": row[3],
+             "votes": row[4], "fetched_at": row[5]} for row in rows]
+
+
+@metrics.timed('query.count_movies')
+def count_movies(min_rating=None, max_rating=None, start_year=None, end_year=None,
+                 title_contains=None, rating_below=None):
+    """Return the number of movies matching the given filters."""
+    conditions, params = _where_clause(min_rating, max_rating, start_year,
+                                       end_year, title_contains, rating_below)
+    sql = "SELECT COUNT(*) FROM movies"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    with storage.get_engine().connect() as connection:
+        return connection.execute(text(sql), params).scalar()
+
+
+@metrics.timed('query.year_counts')
+def year_counts():
+    """Return (year, number of movies) pairs, oldest year first."""
+    with storage.get_engine().connect() as connection:
+        return connection.execute(text(
+            "SELECT year, COUNT(*) FROM movies GROUP BY year ORDER BY year")).fetchall()
+
+
+@metrics.timed('query.rating_bucket_counts')
+def rating_bucket_counts():
+    """
+    Return (bucket, number of movies) pairs for whole-number rating
+    buckets, best bucket first. Bucket 8 holds ratings from 8.0 up to,
+    but not including, 9.0.
+    """
+    with storage.get_engine().connect() as connection:
+        return connection.execute(text(
+            "SELECT CAST(rating AS INTEGER) AS bucket, SUM(movie_count) "
+            "FROM rating_histogram GROUP BY bucket ORDER BY bucket DESC")).fetchall()
+
+
+def _quantile(histogram, count, q):
+    # Linear interpolation between the two closest ranks, like numpy's
+    # default, so the 0.5 quantile of an even count is the mean of the two
+    # middle ratings
+    position = q * (count - 1)
+    lower = int(position)
+    fraction = position - lower
+    values = []
+    seen = 0
+    for rating, movies in histogram:
+        seen += movies
+        while len(values) < 2 and seen > lower + len(values):
+            values.append(rating)
+        if len(values) == 2:
+            break
+    if len(values) == 1:
+        return values[0]
+    return values[0] + fraction * (values[1] - values[0])
+
+
+def _extreme_movie(connection, direction):
+    row = connection.execute(text(
+        "SELECT id, title, year, rating FROM movies "
+        f"WHERE rating = (SELECT {direction}(rating) FROM movies) ORDER BY id LIMIT 1")
+    ).fetchone()
+    return {"id": row[0], "title": row[1], "year": row[2], "rating": row[3]}
+
+
+@metrics.timed('query.rating_stats')
+def rating_stats(quantiles=(0.25, 0.5, 0.75)):
+    """
+    Return rating statistics without scanning the movies table.
+
+    Count, mean and the histogram are read from the summary tables kept
+    up to date by triggers; quantiles are read off the histogram, which
+    has one row per distinct rating; the best and worst movies are single
+    lookups on the rating index.
+
+    Args:
+        quantiles (iterable of float): Quantiles to compute, between 0 and 1.
+
+    Returns:
+        dict or None: 'count', 'mean', 'median', 'quantiles' (a dict by
+        quantile), 'best' and 'worst' movie (the first one added on ties)
+        and 'histogram' as (rating, number of movies) pairs in rating
+        order, or None for an empty catalog.
+    """
+    with storage.get_engine().connect() as connection:
+        count, rating_sum = connection.execute(
+            text("SELECT movie_count, rating_sum FROM movie_summary")).fetchone()
+        if not count:
+            return None
+        histogram = [tuple(row) for row in connection.execute(text(
+            "SELECT rating, movie_count FROM rating_histogram ORDER BY rating"))]
+        best = _extreme_movie(connection, "MAX")
+        worst = _extreme_movie(connection, "MIN")
+    return {
+        "count": count,
+        "mean": rating_sum / count,
+        "median": _quantile(histogram, count, 0.5),
+        "quantiles": {q: _quantile(histogram, count, q) for q in quantiles},
+        "best": best,
+        "worst": worst,
+        "histogram": histogram,
+    }
+
+
+def iter_image_links():
+    """Yield every distinct poster URL in the catalog."""
+    with storage.get_engine().connect() as connection:
+        result = connection.execution_options(yield_per=PAGE_SIZE).execute(
+            text("SELECT DISTINCT image_link FROM movies"))
+        for row in result:
+            yield row[0]
@@ -0,0 +1,161 @@
+"""
+Typed movie record and the one place raw movie values are normalized.
+
+OMDb answers with strings: "Year" can be a range such as "2010–2014",
+"imdbRating" and "Poster" can be "N/A". Movie.from_omdb parses them once,
+at the boundary, into an int year, a float rating and either a poster URL
+or the NO_POSTER sentinel, so storage and every caller after it get typed
+values. Values from other sources (batch files, JSON logs, old data.json
+files) go through Movie.coerce, which applies the same rules.
+
+Movie keeps its fields in __slots__, so a record is a fraction of the size
+of the dict it replaces, and it still supports movie['title'] for code
+written against dicts.
+"""
+import re
+
+# Stored image_link of a movie without a poster, as OMDb spells it
+NO_POSTER = 'N/A'
+
+# Range of IMDb ratings; anything else can't be stored
+MIN_RATING = 0.0
+MAX_RATING = 10.0
+
+_YEAR = re.compile(r'\s*(\d{4})')
+_MISSING = ('', 'N/A')
+
+
+def parse_year(value):
+    """
+    Return the (first) year of an int or a string such as '1999',
+    '2010–2014' or '2019–'; None when there is none.
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    match = _YEAR.match(str(value)) if value is not None else None
+    return int(match.group(1)) if match else None
+
+
+def parse_rating(value):
+    """
+    Return a rating as a float, or None for 'N/A', other non-numbers and
+    numbers outside MIN_RATING to MAX_RATING ('nan' and 'inf' included).
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        rating = float(value)
+    except (TypeError, ValueError):
+        return None
+    # NaN fails both comparisons
+    return rating if MIN_RATING <= rating <= MAX_RATING else None
+
+
+def checked_rating(title, value):
+    """
+    Return parse_rating(value).
+
+    Raises:
+        ValueError: When value is not a rating.
+    """
+    rating = parse_rating(value)
+    if rating is None:
+        raise ValueError(f'{title!r} has no rating from {MIN_RATING:g} to '
+                         f'{MAX_RATING:g} ({value!r})')
+    return rating
+
+
+def parse_votes(value):
+    """Return an OMDb vote count such as '1,234,567' as an int, or None."""
+    try:
+        return int(str(value).replace(',', ''))
+    except ValueError:
+        return None
+
+
+def normalize_poster(value):
+    """Return a poster URL, or NO_POSTER when there is none."""
+    value = (value or '').strip()
+    return NO_POSTER if value in _MISSING else value
+
+
+class Movie:
+    """
+    One movie of the catalog with normalized, typed values.
+
+    Build it with Movie.from_omdb or Movie.coerce, which normalize their
+    input; the constructor stores its arguments as they are.
+
+    Attributes:
+        title (str): Title as displayed.
+        year (int): Release year (the first one of a series).
+        rating (float): IMDb rating.
+        image_link (str): Poster URL, or NO_POSTER.
+    """
+
+    __slots__ = ('title', 'year', 'rating', 'image_link')
+
+    def __init__(self, title, year, rating, image_link=NO_POSTER):
+        self.title = title
+        self.year = year
+        self.rating = rating
+        self.image_link = image_link
+
+    @classmethod
+    def parse(cls, title, year, rating, image_link=None):
+        """
+        Normalize raw values into a Movie.
+
+        Raises:
+            ValueError: When the title is empty, the year is missing or
+                not a number, or the rating is not a number from MIN_RATING
+                to MAX_RATING: the catalog has no use for a movie it can't
+                sort or rate.
+        """
+        title = (title or '').strip()
+        if not title:
+            raise ValueError('movie has no title')
+        parsed_year = parse_year(year)
+        if parsed_year is None:
+            raise ValueError(f'{title!r} has no release year ({year!r})')
+        return cls(title, parsed_year, checked_rating(title, rating),
+                   normalize_poster(image_link))
+
+    @classmethod
+    def from_omdb(cls, json_response):
+        """Build a Movie from a successful OMDb JSON response."""
+        return cls.parse(json_response.get('Title'), json_response.get('Year'),
+                         json_response.get('imdbRating'), json_response.get('Poster'))
+
+    @classmethod
+    def coerce(cls, movie):
+        """Return movie if it is a Movie, else parse a dict with the same keys."""
+        if isinstance(movie, cls):
+            return movie
+        return cls.parse(movie['title'], movie['year'], movie['rating'],
+                         movie.get('image_link'))
+
+    def to_dict(self):
+        return {'title': self.title, 'year': self.year, 'rating': self.rating,
+                'image_link': self.image_link}
+
+    def keys(self):
+        return self.__slots__
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def __eq__(self, other):
+        if not isinstance(other, Movie):
+            return NotImplemented
+        return (self.title, self.year, self.rating, self.image_link) == \
+            (other.title, other.year, other.rating, other.image_link)
+
+    def __repr__(self):
+        return (f'Movie({self.title!r}, {self.year!r}, {self.rating!r}, '
+                f'{self.image_link!r})')
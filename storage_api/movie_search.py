@@ -0,0 +1,145 @@
+"""
+Title search backed by the SQLite FTS5 indexes on the movies table.
+
+movies_fts tokenizes titles into words for ranked word and prefix search,
+movies_trigram indexes every three-character sequence for substring
+search and "did you mean" suggestions. Both are kept in sync with movies
+by triggers, so a query never scans the movies table.
+"""
+import difflib
+import re
+
+from sqlalchemy import text
+
+from instrumentation import metrics
+from storage_api import movie_query
+from storage_api import movie_storage_sql as storage
+
+# Results returned when no limit is given
+DEFAULT_LIMIT = 20
+
+# Trigram matches re-scored with difflib before picking suggestions
+SUGGESTION_CANDIDATES = 50
+
+# Rarest trigrams of a misspelled term used to look up candidates. Common
+# trigrams such as "the" match a large part of the catalog without telling
+# titles apart, so they are left out of the lookup.
+SUGGESTION_TRIGRAMS = 6
+
+_WORD = re.compile(r"\w+")
+
+
+def _quote(phrase):
+    """Quote a string as an FTS5 phrase, so its characters are taken literally."""
+    return '"' + phrase.replace('"', '""') + '"'
+
+
+def _fetch(sql, params):
+    with storage.get_engine().connect() as connection:
+        rows = connection.execute(text(sql), params).fetchall()
+    metrics.count('search.rows_read', len(rows))
+    return [{"id": row[0], "title": row[1], "year": row[2], "rating": row[3],
+             "image_link": row[4]} for row in rows]
+
+
+@metrics.timed('search.search_movies')
+def search_movies(term, limit=DEFAULT_LIMIT):
+    """
+    Return movies whose title matches the search term, best match first.
+
+    Titles containing every word of the term (the last one as a prefix)
+    are ranked first by bm25; titles that merely contain the term as a
+    case-insensitive substring follow.
+
+    Args:
+        term (str): Search term.
+        limit (int): Maximum number of movies returned.
+
+    Returns:
+        list of dict: Movies with 'id', 'title', 'year', 'rating' and
+        'image_link' keys.
+    """
+    words = _WORD.findall(term)
+    results = []
+    if words:
+        query = " ".join(_quote(word) for word in words) + "*"
+        results = _fetch(
+            "SELECT m.id, m.title, m.year, m.rating, m.image_link "
+            "FROM movies_fts JOIN movies m ON m.id = movies_fts.rowid "
+            "WHERE movies_fts MATCH :query ORDER BY movies_fts.rank LIMIT :limit",
+            {"query": query, "limit": limit})
+
+    term = " ".join(term.split())
+    if len(results) < limit and 0 < len(term) < 3:
+        # Too short for the trigram index; such terms are rare enough that
+        # a LIKE scan over title_key is acceptable
+        seen = {movie["id"] for movie in results}
+        matches = movie_query.query_movies(title_contains=term, limit=limit)
+        results += [movie for movie in matches
+                    if movie["id"] not in seen][:limit - len(results)]
+    elif len(results) < limit and len(term) >= 3:
+        exclude = ""
+        if results:
+            exclude = (" AND movies_trigram.rowid NOT IN ("
+                       + ", ".join(str(movie["id"]) for movie in results) + ")")
+        results += _fetch(
+            "SELECT m.id, m.title, m.year, m.rating, m.image_link "
+            "FROM movies_trigram JOIN movies m ON m.id = movies_trigram.rowid "
+            "WHERE movies_trigram MATCH :query" + exclude
+            + " ORDER BY movies_trigram.rank LIMIT :limit",
+            {"query": _quote(term), "limit": limit - len(results)})
+    return results
+
+
+@metrics.timed('search.suggest_titles')
+def suggest_titles(term, limit=1, cutoff=0.6):
+    """
+    Suggest stored movies whose title is close to a misspelled term.
+
+    Candidates sharing the most trigrams with the term are fetched from
+    the trigram index, then re-scored with difflib so the result matches
+    difflib.get_close_matches without comparing against every title.
+
+    Args:
+        term (str): The term that found nothing.
+        limit (int): Maximum number of suggestions.
+        cutoff (float): Minimum similarity between 0 and 1.
+
+    Returns:
+        list of dict: Suggested movies, closest first.
+    """
+    key = storage.normalize_title(term)
+    trigrams = {key[i:i + 3] for i in range(len(key) - 2)}
+    if not trigrams:
+        return []
+    # fts5vocab only turns equality constraints into index lookups, so the
+    # document frequencies are fetched with one equality per trigram
+    trigrams = sorted(trigrams)
+    lookups = " UNION ALL ".join(
+        f"SELECT term, doc FROM movies_trigram_vocab WHERE term = :t{i}"
+        for i in range(len(trigrams)))
+    with storage.get_engine().connect() as connection:
+        frequencies = dict(connection.execute(
+            text(lookups), {f"t{i}": t for i, t in enumerate(trigrams)}).fetchall())
+    # Trigrams no title contains can't find candidates either
+    trigrams = sorted((t for t in trigrams if t in frequencies),
+                      key=frequencies.get)[:SUGGESTION_TRIGRAMS]
+    if not trigrams:
+        return []
+    candidates = _fetch(
+        "SELECT m.id, m.title, m.year, m.rating, m.image_link "
+        "FROM movies_trigram JOIN movies m ON m.id = movies_trigram.rowid "
+        "WHERE movies_trigram MATCH :query ORDER BY movies_trigram.rank LIMIT :limit",
+        {"query": " OR ".join(_quote(trigram) for trigram in trigrams),
+         "limit": SUGGESTION_CANDIDATES})
+
+    scored = []
+    matcher = difflib.SequenceMatcher()
+    matcher.set_seq2(key)
+    for movie in candidates:
+        matcher.set_seq1(storage.normalize_title(movie["title"]))
+        if (matcher.real_quick_ratio() >= cutoff and matcher.quick_ratio() >= cutoff
+                and matcher.ratio() >= cutoff):
+            scored.append((matcher.ratio(), movie))
+    scored.sort(key=lambda pair: pair[0], reverse=True)
+    return [movie for _, movie in scored[:limit]]
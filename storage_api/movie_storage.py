@@ -1,95 +1,311 @@
-import json
-
 """
-def write_json():
-  movies = {
-      "The Shawshank Redemption": {"year": 1994, "rating": 9.5},
-      "Pulp Fiction": {"year": 1994, "rating": 8.8},
-      "The Room": {"year": 2003, "rating": 3.6},
-      "The Godfather": {"year": 1972, "rating": 9.2},
-      "The Dark Knight": {"year": 2008, "rating": 9.0},
-      "Forrest Gump": {"year": 1994, "rating": 8.8},
-      "Interstellar": {"year": 2014, "rating": 8.6},
-      "Inception": {"year": 2010, "rating": 8.8},
-      "Gladiator": {"year": 2000, "rating": 8.5},
-      "The Matrix": {"year": 1999, "rating": 8.7},
-}
-  with open("data.json", "w", encoding="utf-8") as f:
-    json.dump(movies, f, indent=2)
-
-
-write_json()
+JSON storage backend: an append-only log of movie records.
+
+Every mutation appends one JSON line to the log instead of rewriting the
+whole file:
+
+    {"op": "put", "key": "the matrix", "movie": {"title": ..., "year": ..., ...}}
+    {"op": "del", "key": "the matrix"}
+
+An in-memory index maps each stored title key to the offset and length of
+its latest "put" line, and reads slice that line out of a read-only mmap
+of the log, so looking a movie up never parses the rest of the file. The
+index is saved next to the log (path + '.idx') on close and compaction, so
+opening a store only has to scan what was appended since. The saved index
+records the log's inode and a hash of the start and end of the part it
+covers; a log that was replaced behind its back is scanned in full.
+
+Overwritten and deleted records stay in the log until it is compacted:
+once dead lines outnumber live ones (and there are at least
+COMPACT_MIN_DEAD of them) the live records are rewritten to a fresh log
+that atomically replaces the old one.
+
+A store is meant to be used by one process at a time.
 """
+import hashlib
+import json
+import mmap
+import os
+import threading
 
-def get_movies(json_path='data.json'):
-    """
-    Returns a dictionary of dictionaries that
-    contains the movies information in the database.
-
-    The function loads the information from the JSON
-    file and returns the data. 
-
-    For example, the function may return:
-    {
-      "Titanic": {
-        "rating": 9,
-        "year": 1999
-      },
-      "..." {
-        ...
-      },
-    }
-    Args:
-        json_path (str): Path to the JSON file. Defaults to 'data.json'.
+from storage_api.movie_record import NO_POSTER, Movie, checked_rating
+from storage_api.movie_storage_sql import (ADDED, DELETED, MISSING, SKIPPED,
+                                           UPDATED, normalize_title)
+from storage_api.movie_transfer import iter_json_object
 
-    Returns:
-        dict of dict: The loaded movie database.
-    """
-    with open(json_path, 'r', encoding='utf-8') as f:
-        movies = json.load(f)
-    return movies
+DEFAULT_LOG_PATH = os.path.join('database', 'movies.jsonl')
 
-def save_movies(movies):
-    """
-    Gets all your movies as an argument and saves them to the JSON file.
-    """
-    with open('../database/data.json', 'w', encoding='utf-8') as f:
-        json.dump(movies, f, indent=2)
-    return movies
+# Compaction runs once dead lines outnumber live ones by this factor...
+COMPACT_RATIO = 1.0
+# ...and there are at least this many of them
+COMPACT_MIN_DEAD = 1000
+
+INDEX_SUFFIX = '.idx'
+# Bytes hashed at each end of the indexed part of the log to recognize it
+FINGERPRINT_BYTES = 4096
 
 
-def add_movie(title, year, rating):
+def read_legacy_json(json_path):
     """
-    Adds a movie to the movies database.
-    Loads the information from the JSON file, add the movie,
-    and saves it. The function doesn't need to validate the input.
+    Yield the movies of an old data.json file, a dict of
+    {title: {"year": ..., "rating": ...}} dicts, decoding one movie at a
+    time so the file is never loaded whole.
     """
-    movies = get_movies('../database/data.json')
-    movies[title] = {'year': year, 'rating': rating}
-    save_movies(movies)
-    return movies
+    with open(json_path, 'r', encoding='utf-8') as f:
+        for title, movie in iter_json_object(f):
+            yield {'title': title, 'year': movie['year'], 'rating': movie['rating'],
+                   'image_link': movie.get('image_link', NO_POSTER)}
 
 
-def delete_movie(title):
+class JsonLogStore:
     """
-    Deletes a movie from the movies database.
-    Loads the information from the JSON file, deletes the movie,
-    and saves it. The function doesn't need to validate the input.
+    Movie store backed by an append-only JSON-lines log.
+
+    Args:
+        path (str): Log file, created if missing.
+        fsync (bool): fsync the log after every write call, so a batch
+            survives power loss once the call returns.
     """
-    movies = get_movies('../database/data.json')
-    del movies[title]
-    save_movies(movies)
-    return movies
 
+    def __init__(self, path=DEFAULT_LOG_PATH, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'ab+')
+        self._map = None
+        self.index = {}
+        self.dead = 0
+        self._load()
 
-def update_movie(title, rating):
-    """
-    Updates a movie from the movies database.
-    Loads the information from the JSON file, updates the movie,
-    and saves it. The function doesn't need to validate the input.
-    """
-    movies = get_movies('../database/data.json')
-    movies[title]['rating'] = rating
-    save_movies(movies)
-    return movies
-  
\ No newline at end of file
+    # Log reading
+
+    def _remap(self):
+        if self._map is not None:
+            self._map.close()
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) \
+            if size else None
+
+    def _load(self):
+        start = self._load_saved_index()
+        self._file.seek(0, os.SEEK_END)
+        size = self._file.tell()
+        self._remap()
+        offset = start
+        while offset < size:
+            end = self._map.find(b'\n', offset)
+            if end == -1:
+                # A write cut short by a crash; drop the partial line
+                self._map.close()
+                self._map = None
+                self._file.truncate(offset)
+                self._remap()
+                break
+            self._apply(json.loads(self._map[offset:end]), offset, end + 1 - offset)
+            offset = end + 1
+
+    def _load_saved_index(self):
+        """Load the saved index if it still matches the log; return where to scan from."""
+        try:
+            with open(self.path + INDEX_SUFFIX, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        size = os.fstat(self._file.fileno()).st_size
+        if saved.get('log_size', size + 1) > size \
+                or saved.get('log_id') != self._log_id(saved['log_size']):
+            return 0
+        self.index = {key: tuple(entry) for key, entry in saved['entries']}
+        self.dead = saved['dead']
+        return saved['log_size']
+
+    def _log_id(self, size):
+        """Identify the first size bytes of this log file, for the saved index."""
+        digest = hashlib.sha1()
+        for offset in sorted({0, max(0, size - FINGERPRINT_BYTES)}):
+            self._file.seek(offset)
+            digest.update(self._file.read(min(FINGERPRINT_BYTES, size - offset)))
+        return f'{os.fstat(self._file.fileno()).st_ino}:{digest.hexdigest()}'
+
+    def _save_index(self):
+        self._file.flush()
+        size = os.fstat(self._file.fileno()).st_size
+        saved = {'log_size': size, 'log_id': self._log_id(size), 'dead': self.dead,
+                 'entries': list(self.index.items())}
+        with open(self.path + INDEX_SUFFIX + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(saved, f)
+        os.replace(self.path + INDEX_SUFFIX + '.tmp', self.path + INDEX_SUFFIX)
+
+    def _apply(self, record, offset, length):
+        key = record['key']
+        if key in self.index:
+            self.dead += 1
+        if record['op'] == 'put':
+            self.index[key] = (offset, length)
+        else:
+            self.dead += 1
+            del self.index[key]
+
+    def _read(self, key):
+        offset, length = self.index[key]
+        if self._map is None or offset + length > len(self._map):
+            self._remap()
+        movie = json.loads(self._map[offset:offset + length])['movie']
+        return Movie(movie['title'], movie['year'], movie['rating'], movie['image_link'])
+
+    # Log writing
+
+    def _append(self, records):
+        """Append records as one write and update the index."""
+        self._file.seek(0, os.SEEK_END)
+        offset = self._file.tell()
+        lines = [json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n'
+                 for record in records]
+        self._file.write(b''.join(lines))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        for record, line in zip(records, lines):
+            self._apply(record, offset, len(line))
+            offset += len(line)
+        if self.dead >= COMPACT_MIN_DEAD and self.dead > COMPACT_RATIO * len(self.index):
+            self._compact()
+
+    def compact(self):
+        """Rewrite the log with only the live records."""
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        temp_path = self.path + '.compact'
+        index = {}
+        with open(temp_path, 'wb') as f:
+            for key in self.index:
+                line = json.dumps({'op': 'put', 'key': key,
+                                   'movie': self._read(key).to_dict()},
+                                  ensure_ascii=False).encode('utf-8') + b'\n'
+                index[key] = (f.tell(), len(line))
+                f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+        # The saved index points into the old log: drop it first, so a crash
+        # before the new one is saved leaves no index rather than a wrong one
+        try:
+            os.remove(self.path + INDEX_SUFFIX)
+        except FileNotFoundError:
+            pass
+        os.replace(temp_path, self.path)
+        self._file = open(self.path, 'ab+')
+        self.index = index
+        self.dead = 0
+        self._remap()
+        self._save_index()
+
+    # Storage protocol
+
+    def get_movie(self, title):
+        """Look up one movie by title, ignoring case and extra spaces."""
+        with self._lock:
+            key = normalize_title(title)
+            return self._read(key) if key in self.index else None
+
+    def iter_movies(self):
+        """Yield every movie, in the order they were first added."""
+        with self._lock:
+            keys = list(self.index)
+        for key in keys:
+            with self._lock:
+                if key in self.index:
+                    movie = self._read(key)
+                else:
+                    continue
+            yield movie
+
+    def count_movies(self):
+        return len(self.index)
+
+    def add_movies(self, movies, replace=True, fetched_at=None):
+        """
+        Add many movies; see movie_storage_sql.add_movies. The log keeps no
+        refresh times, so fetched_at is ignored.
+        """
+        outcomes = []
+        records = []
+        with self._lock:
+            pending = set()
+            for movie in movies:
+                movie = Movie.coerce(movie).to_dict()
+                key = normalize_title(movie['title'])
+                exists = key in self.index or key in pending
+                if exists and not replace:
+                    outcomes.append(SKIPPED)
+                    continue
+                if exists:
+                    # Like the SQL upsert, keep the stored spelling of the title
+                    movie['title'] = self._read(key).title if key in self.index else \
+                        next(r['movie']['title'] for r in reversed(records) if r['key'] == key)
+                outcomes.append(UPDATED if exists else ADDED)
+                pending.add(key)
+                records.append({'op': 'put', 'key': key, 'movie': movie})
+            if records:
+                self._append(records)
+        return outcomes
+
+    def update_ratings(self, ratings):
+        """Update many ratings; see movie_storage_sql.update_ratings."""
+        if isinstance(ratings, dict):
+            ratings = ratings.items()
+        outcomes = []
+        records = {}
+        with self._lock:
+            for title, rating in ratings:
+                rating = checked_rating(title, rating)
+                key = normalize_title(title)
+                if key in records:
+                    movie = records[key]['movie']
+                elif key in self.index:
+                    movie = self._read(key).to_dict()
+                else:
+                    outcomes.append(MISSING)
+                    continue
+                records[key] = {'op': 'put', 'key': key,
+                                'movie': dict(movie, rating=rating)}
+                outcomes.append(UPDATED)
+            if records:
+                self._append(list(records.values()))
+        return outcomes
+
+    def delete_movies(self, titles):
+        """Delete many movies; see movie_storage_sql.delete_movies."""
+        outcomes = []
+        records = []
+        with self._lock:
+            deleted = set()
+            for title in titles:
+                key = normalize_title(title)
+                if key in self.index and key not in deleted:
+                    deleted.add(key)
+                    records.append({'op': 'del', 'key': key})
+                    outcomes.append(DELETED)
+                else:
+                    outcomes.append(MISSING)
+            if records:
+                self._append(records)
+        return outcomes
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            self._save_index()
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self._file.close()
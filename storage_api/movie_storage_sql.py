@@ -1,13 +1,111 @@
-from sqlalchemy import create_engine, text
+import os
+import sys
+import time
+from contextlib import contextmanager
 
-# Define the database URL
-DB_URL = "sqlite:///database/movies.sqlite3"
+from sqlalchemy import bindparam, create_engine, event, text
 
-# Create the engine
-engine = create_engine(DB_URL, echo=True)
+from instrumentation import metrics
+from storage_api.movie_record import NO_POSTER, Movie, checked_rating, parse_rating
 
-# Create the movies table if it does not exist
-with engine.connect() as connection:
+# Define the database URL (MOVIES_DB_URL points the app at another database)
+DB_URL = os.getenv("MOVIES_DB_URL", "sqlite:///database/movies.sqlite3")
+
+# Engine profiles, selected with MOVIES_DB_PROFILE. "production" runs SQLite
+# in WAL mode so readers don't block the writer, "debug" adds statement
+# logging on top of it and "legacy" is the original untuned setup, kept for
+# benchmarks.
+ENGINE_PROFILES = {
+    "production": {
+        "echo": False,
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "mmap_size": 256 * 1024 * 1024,
+            "cache_size": -64 * 1024,  # negative means KiB, so 64 MiB
+            "busy_timeout": 5000,
+            "temp_store": "MEMORY",
+        },
+        "pool_size": 5,
+        "max_overflow": 10,
+        "query_cache_size": 1000,
+        "cached_statements": 256,
+    },
+    "legacy": {
+        "echo": True,
+        "pragmas": {},
+    },
+}
+ENGINE_PROFILES["debug"] = dict(ENGINE_PROFILES["production"], echo=True)
+
+DB_PROFILE = os.getenv("MOVIES_DB_PROFILE", "production")
+
+
+def build_engine(db_url=DB_URL, profile=DB_PROFILE):
+    """
+    Create an engine for the given database URL using one of the
+    ENGINE_PROFILES.
+
+    Args:
+        db_url (str): SQLAlchemy database URL.
+        profile (str): Name of the profile in ENGINE_PROFILES.
+
+    Returns:
+        Engine: The configured SQLAlchemy engine.
+    """
+    settings = ENGINE_PROFILES[profile]
+    options = {"echo": settings["echo"]}
+    if "query_cache_size" in settings:
+        options["query_cache_size"] = settings["query_cache_size"]
+    if "cached_statements" in settings:
+        options["connect_args"] = {"cached_statements": settings["cached_statements"]}
+    if "pool_size" in settings and ":memory:" not in db_url and db_url != "sqlite://":
+        options["pool_size"] = settings["pool_size"]
+        options["max_overflow"] = settings["max_overflow"]
+    new_engine = create_engine(db_url, **options)
+
+    pragmas = settings["pragmas"]
+    if pragmas:
+        @event.listens_for(new_engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+            cursor.close()
+
+    if metrics.ENABLED:
+        # Time every statement, so the metrics separate SQL from Python
+        # time; engines built before metrics were enabled skip this hook
+        @event.listens_for(new_engine, "before_cursor_execute")
+        def start_statement(connection, cursor, statement, parameters, context,
+                            executemany):
+            connection.info["statement_start"] = time.perf_counter()
+
+        @event.listens_for(new_engine, "after_cursor_execute")
+        def end_statement(connection, cursor, statement, parameters, context,
+                          executemany):
+            start = connection.info.pop("statement_start", None)
+            if start is not None:
+                metrics.record("sql.execute", time.perf_counter() - start)
+
+    return new_engine
+
+
+# The engine is created, and the schema checked, by the first get_engine()
+# call rather than on import, so commands that never touch the database
+# don't pay for it
+engine = None
+
+
+def normalize_title(title):
+    """
+    Return the case-folded key used to compare titles, so that
+    'the  matrix' and 'The Matrix' are the same movie.
+    """
+    return " ".join(title.split()).casefold()
+
+
+def _create_movies_table(connection):
     connection.execute(text("""
         CREATE TABLE IF NOT EXISTS movies (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -17,48 +115,626 @@ with engine.connect() as connection:
             image_link TEXT NOT NULL
         )
     """))
-    connection.commit()
 
 
+def _add_title_key_and_indexes(connection):
+    columns = {row[1] for row in connection.execute(text("PRAGMA table_info(movies)"))}
+    if "title_key" not in columns:
+        connection.execute(text("ALTER TABLE movies ADD COLUMN title_key TEXT"))
+    rows = connection.execute(
+        text("SELECT id, title FROM movies WHERE title_key IS NULL")).fetchall()
+    if rows:
+        connection.execute(text("UPDATE movies SET title_key = :title_key WHERE id = :id"),
+                           [{"id": row[0], "title_key": normalize_title(row[1])}
+                            for row in rows])
+    connection.execute(text("CREATE INDEX IF NOT EXISTS idx_movies_title_key ON movies (title_key)"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS idx_movies_rating ON movies (rating)"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS idx_movies_year ON movies (year)"))
+
+
+def _add_search_indexes(connection):
+    # Word index for ranked search and trigram index for substring search and
+    # "did you mean" suggestions. Both are external-content FTS5 tables that
+    # read titles from movies and are kept in sync by the triggers below.
+    connection.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5("
+        "title, content='movies', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')"))
+    connection.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS movies_trigram USING fts5("
+        "title, content='movies', content_rowid='id', tokenize='trigram')"))
+    connection.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS movies_trigram_vocab "
+        "USING fts5vocab(movies_trigram, 'row')"))
+    connection.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS movies_search_insert AFTER INSERT ON movies BEGIN
+            INSERT INTO movies_fts (rowid, title) VALUES (new.id, new.title);
+            INSERT INTO movies_trigram (rowid, title) VALUES (new.id, new.title);
+        END
+    """))
+    connection.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS movies_search_delete AFTER DELETE ON movies BEGIN
+            INSERT INTO movies_fts (movies_fts, rowid, title)
+                VALUES ('delete', old.id, old.title);
+            INSERT INTO movies_trigram (movies_trigram, rowid, title)
+                VALUES ('delete', old.id, old.title);
+        END
+    """))
+    connection.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS movies_search_update AFTER UPDATE OF title ON movies BEGIN
+            INSERT INTO movies_fts (movies_fts, rowid, title)
+                VALUES ('delete', old.id, old.title);
+            INSERT INTO movies_trigram (movies_trigram, rowid, title)
+                VALUES ('delete', old.id, old.title);
+            INSERT INTO movies_fts (rowid, title) VALUES (new.id, new.title);
+            INSERT INTO movies_trigram (rowid, title) VALUES (new.id, new.title);
+        END
+    """))
+    connection.execute(text("INSERT INTO movies_fts (movies_fts) VALUES ('rebuild')"))
+    connection.execute(text("INSERT INTO movies_trigram (movies_trigram) VALUES ('rebuild')"))
+
+
+def _make_title_key_unique(connection):
+    # Titles that differ only in case or spacing are the same movie. The CLI
+    # never let such duplicates in, but if an older database has some, the
+    # first one added is kept. The others are moved to
+    # dropped_duplicate_movies and reported, so nothing is lost silently.
+    duplicates = connection.execute(text("""
+        SELECT movies.id, movies.title, movies.year, movies.rating, kept.title
+        FROM movies JOIN (
+            SELECT title_key, MIN(id) AS id FROM movies GROUP BY title_key
+        ) AS first ON first.title_key = movies.title_key AND first.id != movies.id
+        JOIN movies AS kept ON kept.id = first.id
+        ORDER BY movies.id
+    """)).fetchall()
+    if duplicates:
+        connection.execute(text("""
+            CREATE TABLE IF NOT EXISTS dropped_duplicate_movies (
+                id INTEGER PRIMARY KEY,
+                title TEXT NOT NULL,
+                year INTEGER,
+                rating REAL,
+                image_link TEXT,
+                kept_title TEXT NOT NULL
+            )
+        """))
+        connection.execute(text(
+            "INSERT INTO dropped_duplicate_movies "
+            "(id, title, year, rating, image_link, kept_title) "
+            "SELECT id, title, year, rating, image_link, :kept_title "
+            "FROM movies WHERE id = :id"),
+            [{"id": row[0], "kept_title": row[4]} for row in duplicates])
+        connection.execute(text("DELETE FROM movies WHERE id = :id"),
+                           [{"id": row[0]} for row in duplicates])
+        for _, title, year, rating, kept_title in duplicates:
+            print(f"Dropped duplicate movie '{title}' ({year}, rating {rating}) "
+                  f"of '{kept_title}'; it is kept in the dropped_duplicate_movies "
+                  f"table", file=sys.stderr)
+    connection.execute(text("DROP INDEX IF EXISTS idx_movies_title_key"))
+    connection.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_movies_title_key ON movies (title_key)"))
+
+
+def _add_rating_summary(connection):
+    # Running totals and a histogram of exact ratings, kept up to date by
+    # triggers so statistics never scan the movies table. Ratings have one
+    # decimal, so the histogram holds at most about a hundred rows whatever
+    # the size of the catalog. data_version is bumped by every change to a
+    # movie, which lets callers cache anything derived from the catalog.
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS movie_summary (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            movie_count INTEGER NOT NULL,
+            rating_sum REAL NOT NULL,
+            data_version INTEGER NOT NULL
+        )
+    """))
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS rating_histogram (
+            rating REAL PRIMARY KEY,
+            movie_count INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """))
+    connection.execute(text("DELETE FROM movie_summary"))
+    connection.execute(text("DELETE FROM rating_histogram"))
+    connection.execute(text(
+        "INSERT INTO movie_summary (id, movie_count, rating_sum, data_version) "
+        "SELECT 1, COUNT(*), TOTAL(rating), 0 FROM movies"))
+    connection.execute(text(
+        "INSERT INTO rating_histogram (rating, movie_count) "
+        "SELECT rating, COUNT(*) FROM movies GROUP BY rating"))
+    connection.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS movies_summary_insert AFTER INSERT ON movies BEGIN
+            UPDATE movie_summary SET movie_count = movie_count + 1,
+                rating_sum = rating_sum + new.rating, data_version = data_version + 1;
+            INSERT INTO rating_histogram (rating, movie_count) VALUES (new.rating, 1)
+                ON CONFLICT (rating) DO UPDATE SET movie_count = movie_count + 1;
+        END
+    """))
+    connection.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS movies_summary_delete AFTER DELETE ON movies BEGIN
+            UPDATE movie_summary SET movie_count = movie_count - 1,
+                rating_sum = rating_sum - old.rating, data_version = data_version + 1;
+            UPDATE rating_histogram SET movie_count = movie_count - 1
+                WHERE rating = old.rating;
+            DELETE FROM rating_histogram WHERE rating = old.rating AND movie_count = 0;
+        END
+    """))
+    connection.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS movies_summary_update AFTER UPDATE ON movies BEGIN
+            UPDATE movie_summary SET rating_sum = rating_sum - old.rating + new.rating,
+                data_version = data_version + 1;
+            UPDATE rating_histogram SET movie_count = movie_count - 1
+                WHERE rating = old.rating AND old.rating IS NOT new.rating;
+            DELETE FROM rating_histogram WHERE rating = old.rating AND movie_count = 0;
+            INSERT INTO rating_histogram (rating, movie_count)
+                SELECT new.rating, 1 WHERE old.rating IS NOT new.rating
+                ON CONFLICT (rating) DO UPDATE SET movie_count = movie_count + 1;
+        END
+    """))
+
+
+def _add_change_log(connection):
+    # Every insert, update and delete of a movie appends a row here, in
+    # commit order. AUTOINCREMENT keeps seq strictly increasing even after
+    # old changes are pruned, so a consumer's cursor never sees a seq twice.
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS movie_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            op TEXT NOT NULL,
+            movie_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            year INTEGER,
+            rating REAL,
+            image_link TEXT,
+            changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+        )
+    """))
+    # Movies stored before the log existed are logged as inserts, so the
+    # changes since cursor 0 always add up to the whole catalog
+    connection.execute(text(
+        "INSERT INTO movie_changes (op, movie_id, title, year, rating, image_link) "
+        "SELECT 'insert', id, title, year, rating, image_link FROM movies ORDER BY id"))
+    connection.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS movies_change_insert AFTER INSERT ON movies BEGIN
+            INSERT INTO movie_changes (op, movie_id, title, year, rating, image_link)
+                VALUES ('insert', new.id, new.title, new.year, new.rating, new.image_link);
+        END
+    """))
+    connection.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS movies_change_update AFTER UPDATE ON movies BEGIN
+            INSERT INTO movie_changes (op, movie_id, title, year, rating, image_link)
+                VALUES ('update', new.id, new.title, new.year, new.rating, new.image_link);
+        END
+    """))
+    connection.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS movies_change_delete AFTER DELETE ON movies BEGIN
+            INSERT INTO movie_changes (op, movie_id, title) VALUES ('delete', old.id, old.title);
+        END
+    """))
+
+
+def _add_refresh_tracking(connection):
+    # fetched_at (Unix time of the last OMDb fetch, NULL for never) and the
+    # IMDb vote count let the refresh job pick the stalest or most popular
+    # movies. The update triggers are narrowed to the catalog columns, so
+    # recording a refresh that left the rating alone is not a change.
+    columns = {row[1] for row in connection.execute(text("PRAGMA table_info(movies)"))}
+    if "fetched_at" not in columns:
+        connection.execute(text("ALTER TABLE movies ADD COLUMN fetched_at REAL"))
+    if "votes" not in columns:
+        connection.execute(text("ALTER TABLE movies ADD COLUMN votes INTEGER"))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS idx_movies_fetched_at ON movies (fetched_at)"))
+    connection.execute(text("DROP TRIGGER IF EXISTS movies_summary_update"))
+    connection.execute(text("""
+        CREATE TRIGGER movies_summary_update
+        AFTER UPDATE OF title, year, rating, image_link ON movies BEGIN
+            UPDATE movie_summary SET rating_sum = rating_sum - old.rating + new.rating,
+                data_version = data_version + 1;
+            UPDATE rating_histogram SET movie_count = movie_count - 1
+                WHERE rating = old.rating AND old.rating IS NOT new.rating;
+            DELETE FROM rating_histogram WHERE rating = old.rating AND movie_count = 0;
+            INSERT INTO rating_histogram (rating, movie_count)
+                SELECT new.rating, 1 WHERE old.rating IS NOT new.rating
+                ON CONFLICT (rating) DO UPDATE SET movie_count = movie_count + 1;
+        END
+    """))
+    connection.execute(text("DROP TRIGGER IF EXISTS movies_change_update"))
+    connection.execute(text("""
+        CREATE TRIGGER movies_change_update
+        AFTER UPDATE OF title, year, rating, image_link ON movies BEGIN
+            INSERT INTO movie_changes (op, movie_id, title, year, rating, image_link)
+                VALUES ('update', new.id, new.title, new.year, new.rating, new.image_link);
+        END
+    """))
+
+
+def _normalize_stored_values(connection):
+    # Movies added before values were normalized at the OMDb boundary may
+    # hold OMDb's strings: a year such as '2010–2014' or a rating such as
+    # '8.7', which sort as text. Convert what parses; the update triggers
+    # move the ratings to their numeric histogram buckets.
+    connection.execute(text(
+        "UPDATE movies SET year = CAST(substr(ltrim(year), 1, 4) AS INTEGER) "
+        "WHERE typeof(year) = 'text' AND ltrim(year) GLOB '[0-9][0-9][0-9][0-9]*'"))
+    rows = connection.execute(text(
+        "SELECT id, rating FROM movies WHERE typeof(rating) = 'text'")).fetchall()
+    ratings = [{"id": movie_id, "rating": parse_rating(rating)} for movie_id, rating in rows]
+    ratings = [row for row in ratings if row["rating"] is not None]
+    if ratings:
+        connection.execute(text("UPDATE movies SET rating = :rating WHERE id = :id"), ratings)
+    connection.execute(text(
+        "UPDATE movies SET image_link = :no_poster WHERE trim(image_link) = ''"),
+        {"no_poster": NO_POSTER})
+
+
+def _add_database_id(connection):
+    # A random id telling this database apart from one created later at
+    # the same path, whose data_version starts over from zero. Caches kept
+    # outside the database, such as rendered charts, are keyed by it.
+    columns = {row[1] for row in connection.execute(text("PRAGMA table_info(movie_summary)"))}
+    if "database_id" not in columns:
+        connection.execute(text("ALTER TABLE movie_summary ADD COLUMN database_id TEXT"))
+    connection.execute(text(
+        "UPDATE movie_summary SET database_id = lower(hex(randomblob(8))) "
+        "WHERE database_id IS NULL"))
+
+
+# Schema migrations, applied in order. PRAGMA user_version records how many
+# of them a database has already been through.
+MIGRATIONS = [
+    _create_movies_table,
+    _add_title_key_and_indexes,
+    _add_search_indexes,
+    _make_title_key_unique,
+    _add_rating_summary,
+    _add_change_log,
+    _add_refresh_tracking,
+    _normalize_stored_values,
+    _add_database_id,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+@metrics.timed('storage.create_schema')
+def create_schema():
+    """
+    Create the movies table and bring the schema up to SCHEMA_VERSION.
+
+    An up-to-date database costs a single PRAGMA user_version read; no DDL
+    is run unless a migration is pending.
+    """
+    with engine.connect() as connection:
+        if connection.execute(text("PRAGMA user_version")).scalar() >= SCHEMA_VERSION:
+            return
+    with engine.begin() as connection:
+        version = connection.execute(text("PRAGMA user_version")).scalar()
+        for number in range(version, SCHEMA_VERSION):
+            MIGRATIONS[number](connection)
+            connection.execute(text(f"PRAGMA user_version = {number + 1}"))
+
+
+def get_engine():
+    """
+    Return the engine, creating it and bringing the schema up to date on
+    first use.
+    """
+    global engine
+    if engine is None:
+        engine = build_engine()
+        create_schema()
+    return engine
+
+
+def configure(db_url=DB_URL, profile=DB_PROFILE):
+    """
+    Switch the module to another database or engine profile and make sure
+    its schema is up to date.
+    """
+    global engine
+    if engine is not None:
+        engine.dispose()
+    engine = build_engine(db_url, profile)
+    create_schema()
+    return engine
+
+
+@metrics.timed('storage.list_movies')
 def list_movies():
     """Retrieve all movies from the database."""
-    with engine.connect() as connection:
+    with get_engine().connect() as connection:
         result = connection.execute(text("SELECT title, year, rating, image_link FROM movies"))
         movies = result.fetchall()
+    metrics.count('storage.rows_read', len(movies))
     return {row[0]: {"year": row[1], "rating": row[2], "image_link": row[3]} for row in movies}
 
 
+@metrics.timed('storage.get_movie')
+def get_movie(title):
+    """
+    Look up one movie by title, ignoring case and extra spaces.
+
+    Returns:
+        Movie or None: The stored movie, or None if it isn't in the
+        database.
+    """
+    with get_engine().connect() as connection:
+        row = connection.execute(
+            text("SELECT title, year, rating, image_link FROM movies "
+                 "WHERE title_key = :title_key"),
+            {"title_key": normalize_title(title)}).fetchone()
+    if row is None:
+        return None
+    return Movie(row[0], row[1], row[2], row[3])
+
+
+@metrics.timed('storage.data_version')
+def data_version(connection=None):
+    """
+    Return a counter that changes whenever a movie is added, updated or
+    deleted, so results derived from the catalog can be cached until then.
+    Every changed row bumps it by one.
+
+    Args:
+        connection (Connection, optional): Read it inside the caller's
+            transaction, so the caller's own uncommitted writes count.
+    """
+    if connection is not None:
+        return connection.execute(
+            text("SELECT data_version FROM movie_summary")).scalar()
+    with get_engine().connect() as connection:
+        return connection.execute(
+            text("SELECT data_version FROM movie_summary")).scalar()
+
+
+def database_id():
+    """
+    Return the random id of the database, which differs between databases
+    created at the same path, unlike data_version.
+    """
+    with get_engine().connect() as connection:
+        return connection.execute(
+            text("SELECT database_id FROM movie_summary")).scalar()
+
+
+# Per-row outcomes reported by the batched write functions
+ADDED = "added"
+UPDATED = "updated"
+SKIPPED = "skipped"
+DELETED = "deleted"
+MISSING = "missing"
+
+# Rows sent to the database per executemany call
+BATCH_SIZE = 1000
+
+
+def _chunks(rows, size=None):
+    """Yield lists of at most size (default BATCH_SIZE) items from any iterable."""
+    size = size or BATCH_SIZE
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _existing_keys(connection, keys):
+    """Return the subset of title keys that are stored in the movies table."""
+    result = connection.execute(
+        text("SELECT title_key FROM movies WHERE title_key IN :keys")
+        .bindparams(bindparam("keys", expanding=True)),
+        {"keys": list(set(keys))})
+    return {row[0] for row in result}
+
+
+@contextmanager
+def _transaction(connection=None):
+    """Use the caller's connection (and transaction) if given, else a new one."""
+    if connection is not None:
+        yield connection
+        return
+    with get_engine().begin() as connection:
+        yield connection
+
+
+@metrics.timed('storage.add_movies')
+def add_movies(movies, replace=True, connection=None, fetched_at=None):
+    """
+    Add many movies to the database in a single transaction.
+
+    Args:
+        movies (iterable of Movie or dict): Movies as returned by
+            get_movie_info, or dicts with 'title', 'year', 'rating' and
+            'image_link' keys, normalized with Movie.coerce.
+        replace (bool): Upsert movies whose title is already stored.
+            When False they are left untouched.
+        connection (Connection, optional): Run inside the caller's
+            transaction instead of a transaction of its own.
+        fetched_at (float, optional): Unix time the movies were fetched
+            from OMDb, so the refresh job knows they are fresh. None for
+            movies that didn't come straight from OMDb.
+
+    Returns:
+        list of str: One outcome per input movie, in input order:
+        ADDED, UPDATED or SKIPPED.
+
+    Raises:
+        ValueError: When a movie has no usable title, year or rating; the
+            whole transaction is rolled back.
+    """
+    statement = text(
+        "INSERT INTO movies (title, year, rating, image_link, title_key, fetched_at) "
+        "VALUES (:title, :year, :rating, :image_link, :title_key, :fetched_at) "
+        + ("ON CONFLICT(title_key) DO UPDATE SET year = excluded.year, "
+           "rating = excluded.rating, image_link = excluded.image_link, "
+           "fetched_at = COALESCE(excluded.fetched_at, fetched_at)"
+           if replace else "ON CONFLICT(title_key) DO NOTHING"))
+    outcomes = []
+    with _transaction(connection) as connection:
+        for chunk in _chunks(movies):
+            rows = []
+            for movie in chunk:
+                movie = Movie.coerce(movie)
+                rows.append({"title": movie.title, "year": movie.year,
+                             "rating": movie.rating, "image_link": movie.image_link,
+                             "title_key": normalize_title(movie.title),
+                             "fetched_at": fetched_at})
+            seen = _existing_keys(connection, [row["title_key"] for row in rows])
+            for row in rows:
+                if row["title_key"] not in seen:
+                    outcomes.append(ADDED)
+                    seen.add(row["title_key"])
+                else:
+                    outcomes.append(UPDATED if replace else SKIPPED)
+            connection.execute(statement, rows)
+            metrics.count('storage.rows_written', len(rows))
+    return outcomes
+
+
+@metrics.timed('storage.update_ratings')
+def update_ratings(ratings, connection=None):
+    """
+    Update the rating of many movies in a single transaction. Titles are
+    matched ignoring case and extra spaces.
+
+    Args:
+        ratings (dict or iterable of (title, rating) pairs): New ratings.
+        connection (Connection, optional): Run inside the caller's
+            transaction instead of a transaction of its own.
+
+    Returns:
+        list of str: One outcome per input pair, in input order:
+        UPDATED or MISSING.
+
+    Raises:
+        ValueError: When a rating is not a number from 0 to 10; the whole
+            transaction is rolled back.
+    """
+    if isinstance(ratings, dict):
+        ratings = ratings.items()
+    outcomes = []
+    with _transaction(connection) as connection:
+        for chunk in _chunks(ratings):
+            keyed = [(normalize_title(title), checked_rating(title, rating))
+                     for title, rating in chunk]
+            existing = _existing_keys(connection, [key for key, _ in keyed])
+            rows = [{"title_key": key, "rating": rating}
+                    for key, rating in keyed if key in existing]
+            outcomes.extend(UPDATED if key in existing else MISSING
+                            for key, _ in keyed)
+            if rows:
+                connection.execute(
+                    text("UPDATE movies SET rating = :rating WHERE title_key = :title_key"),
+                    rows)
+                metrics.count('storage.rows_written', len(rows))
+    return outcomes
+
+
+@metrics.timed('storage.delete_movies')
+def delete_movies(titles, connection=None):
+    """
+    Delete many movies in a single transaction. Titles are matched
+    ignoring case and extra spaces.
+
+    Args:
+        titles (iterable of str): Titles to delete.
+        connection (Connection, optional): Run inside the caller's
+            transaction instead of a transaction of its own.
+
+    Returns:
+        list of str: One outcome per input title, in input order:
+        DELETED or MISSING.
+    """
+    outcomes = []
+    with _transaction(connection) as connection:
+        for chunk in _chunks(titles):
+            keys = [normalize_title(title) for title in chunk]
+            existing = _existing_keys(connection, keys)
+            metrics.count('storage.rows_written', len(existing))
+            for key in keys:
+                outcomes.append(DELETED if key in existing else MISSING)
+                existing.discard(key)
+            connection.execute(text("DELETE FROM movies WHERE title_key = :title_key"),
+                               [{"title_key": key} for key in keys])
+    return outcomes
+
+
+@metrics.timed('storage.record_refreshes')
+def record_refreshes(refreshes, connection=None):
+    """
+    Store the results of re-fetching movies from OMDb in a single
+    transaction.
+
+    Args:
+        refreshes (iterable of dict): 'id', 'fetched_at' (Unix time) and
+            the new 'rating' and 'votes', either of which may be None when
+            OMDb had no value.
+        connection (Connection, optional): Run inside the caller's
+            transaction instead of a transaction of its own.
+
+    Returns:
+        int: Number of movies whose rating changed.
+    """
+    changed = 0
+    with _transaction(connection) as connection:
+        for chunk in _chunks(refreshes):
+            rows = [{"id": r["id"], "rating": r["rating"], "votes": r["votes"],
+                     "fetched_at": r["fetched_at"]} for r in chunk]
+            # Only a different rating is an update of the catalog
+            changed += connection.execute(
+                text("UPDATE movies SET rating = :rating "
+                     "WHERE id = :id AND :rating IS NOT NULL AND rating IS NOT :rating"),
+                rows).rowcount
+            connection.execute(
+                text("UPDATE movies SET fetched_at = :fetched_at, "
+                     "votes = COALESCE(:votes, votes) WHERE id = :id"),
+                rows)
+            metrics.count('storage.rows_written', len(rows))
+    return changed
+
+
+@metrics.timed('storage.add_movie')
 def add_movie(title, year, rating, image_link):
     """Add a new movie to the database."""
-    with engine.connect() as connection:
-        try:
-            connection.execute(text("INSERT INTO movies (title, year, rating, image_link) VALUES (:title, :year, :rating, :image_link)"),
-                               {"title": title, "year": year, "rating": rating, "image_link": image_link})
-            connection.commit()
-            print(f"Movie '{title}' added successfully.")
-        except Exception as e:
-            print(f"Error: {e}")
+    try:
+        outcome, = add_movies([{"title": title, "year": year, "rating": rating,
+                                "image_link": image_link}], replace=False)
+    except Exception as e:
+        print(f"Error: {e}")
+        return
+    if outcome == ADDED:
+        print(f"Movie '{title}' added successfully.")
+    else:
+        print(f"Error: Movie '{title}' already exists.")
 
 
+@metrics.timed('storage.delete_movie')
 def delete_movie(title):
     """Delete a movie from the database."""
-    with engine.connect() as connection:
-        try:
-            connection.execute(text("DELETE FROM movies WHERE title =:title"),
-                               {"title": title})
-            connection.commit()
-            print(f"Movie '{title}' deleted successfully.")
-        except Exception as e:
-            print(f"Error: {e}")
+    try:
+        outcome, = delete_movies([title])
+    except Exception as e:
+        print(f"Error: {e}")
+        return
+    if outcome == DELETED:
+        print(f"Movie '{title}' deleted successfully.")
+    else:
+        print(f"Error: Movie '{title}' doesn't exist.")
 
 
+@metrics.timed('storage.update_movie')
 def update_movie(title, rating):
     """Update a movie's rating in the database."""
-    with engine.connect() as connection:
-        try:
-            connection.execute(text("UPDATE movies SET rating = :rating WHERE title = :title"),
-                               {"title": title, "rating": rating})
-            connection.commit()
-            print(f"Movie '{title}' updated successfully.")
-        except Exception as e:
-            print(f"Error: {e}")
\ No newline at end of file
+    try:
+        outcome, = update_ratings([(title, rating)])
+    except Exception as e:
+        print(f"Error: {e}")
+        return
+    if outcome == UPDATED:
+        print(f"Movie '{title}' updated successfully.")
+    else:
+        print(f"Error: Movie '{title}' doesn't exist.")
@@ -0,0 +1,338 @@
+"""
+Streaming export and import of the catalog as CSV, JSON Lines or JSON.
+
+Formats:
+    csv    a header row (title, year, rating, image_link; other columns,
+           such as the id written by `movies.py list --format csv`, are
+           ignored) and one movie per row
+    jsonl  one {"title": ..., "year": ..., "rating": ..., "image_link": ...}
+           object per line
+    json   the dict-shaped data.json of the first versions of the app,
+           {"<title>": {"year": ..., "rating": ..., "image_link": ...}}
+
+Exports stream the movies table through one cursor, FETCH_SIZE rows per
+round trip, straight into the file. Imports read the file CHUNK_ROWS
+records at a time: CSV and JSON Lines chunks are parsed and normalized by
+a process pool, a few chunks ahead of the main process, which stores each
+chunk in a transaction of its own. The dict-shaped JSON is decoded one
+movie at a time with an incremental decoder, in the main process. Memory
+use therefore depends on the chunk size and the number of workers, not on
+the size of the catalog.
+
+Records that can't be normalized into a Movie are skipped and reported.
+"""
+import collections
+import csv
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import text
+
+from instrumentation import metrics
+from storage_api import movie_storage_sql as storage
+from storage_api.movie_record import Movie
+
+FORMATS = ("csv", "jsonl", "json")
+FIELDS = ("title", "year", "rating", "image_link")
+
+# Rows fetched per round trip while exporting
+FETCH_SIZE = 10000
+# Records parsed per worker task and stored per transaction while importing
+CHUNK_ROWS = 5000
+# Characters read at a time by the incremental JSON decoder
+READ_SIZE = 1 << 16
+# Invalid records listed in an ImportReport; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+_EXTENSIONS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".json": "json"}
+
+
+def format_of(path):
+    """Return the format of a file by its extension, or None."""
+    return _EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+# Export
+
+@metrics.timed("transfer.export")
+def export_movies(stream, file_format, fetch_size=FETCH_SIZE):
+    """
+    Write every movie, in id order, to an open text stream.
+
+    Args:
+        stream (file): Opened with newline='' for CSV.
+        file_format (str): One of FORMATS.
+        fetch_size (int): Rows fetched from SQLite per round trip.
+
+    Returns:
+        int: Number of movies written.
+    """
+    count = 0
+    with storage.get_engine().connect() as connection:
+        rows = connection.execution_options(yield_per=fetch_size).execute(
+            text("SELECT title, year, rating, image_link FROM movies ORDER BY id"))
+        if file_format == "csv":
+            writer = csv.writer(stream)
+            writer.writerow(FIELDS)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        elif file_format == "jsonl":
+            for title, year, rating, image_link in rows:
+                stream.write(json.dumps({"title": title, "year": year, "rating": rating,
+                                         "image_link": image_link},
+                                        ensure_ascii=False) + "\n")
+                count += 1
+        else:
+            separator = "{\n"
+            for title, year, rating, image_link in rows:
+                stream.write(f"{separator}{json.dumps(title, ensure_ascii=False)}: "
+                             + json.dumps({"year": year, "rating": rating,
+                                           "image_link": image_link},
+                                          ensure_ascii=False))
+                separator = ",\n"
+                count += 1
+            stream.write("{}\n" if separator == "{\n" else "\n}\n")
+    metrics.count("transfer.rows_exported", count)
+    return count
+
+
+# Import
+
+def iter_json_object(stream, read_size=READ_SIZE):
+    """
+    Yield the (key, value) pairs of the JSON object in stream, reading it
+    read_size characters at a time instead of loading it whole. Values
+    must be objects, as in the dict-shaped format.
+
+    Raises:
+        ValueError: When the stream doesn't hold such an object.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+
+    def read_more():
+        nonlocal buffer, position
+        more = stream.read(read_size)
+        buffer = buffer[position:] + more
+        position = 0
+        return bool(more)
+
+    def peek():
+        """Skip whitespace and return the next character, '' at the end."""
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n":
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            if not read_more():
+                return ""
+
+    def expect(characters):
+        nonlocal position
+        character = peek()
+        if not character or character not in characters:
+            raise ValueError(f"expected one of {characters!r} at "
+                             f"{character or 'the end of the file'!r}")
+        position += 1
+        return character
+
+    def decode(opening):
+        # Strings and objects can't be decoded from a truncated buffer, so
+        # a failure only means more input is needed, until the end
+        nonlocal position
+        if peek() != opening:
+            raise ValueError(f"expected {opening!r} at {peek() or 'the end of the file'!r}")
+        while True:
+            try:
+                value, position = decoder.raw_decode(buffer, position)
+                return value
+            except json.JSONDecodeError:
+                if not read_more():
+                    raise
+
+    expect("{")
+    if peek() == "}":
+        return
+    while True:
+        key = decode('"')
+        expect(":")
+        yield key, decode("{")
+        if expect(",}") == "}":
+            return
+
+
+def _line_chunks(stream, chunk_rows, first_line, quoted):
+    """
+    Yield (first line number, lines) chunks of about chunk_rows lines. With
+    quoted, chunks only end where the number of double quotes is even, so
+    a CSV field spanning several lines stays in one chunk.
+    """
+    chunk, quotes = [], 0
+    for line in stream:
+        chunk.append(line)
+        if quoted:
+            quotes += line.count('"')
+        if len(chunk) >= chunk_rows and quotes % 2 == 0:
+            yield first_line, chunk
+            first_line += len(chunk)
+            chunk, quotes = [], 0
+    if chunk:
+        yield first_line, chunk
+
+
+def read_chunks(stream, file_format, chunk_rows=CHUNK_ROWS):
+    """
+    Split an import file into chunks for parse_chunk.
+
+    Args:
+        stream (file): Opened with newline='' for CSV.
+        file_format (str): One of FORMATS.
+        chunk_rows (int): Records per chunk.
+
+    Yields:
+        tuple: parse_chunk arguments.
+
+    Raises:
+        ValueError: When a CSV file has no title, year and rating header.
+    """
+    if file_format == "json":
+        pairs = iter_json_object(stream)
+        while True:
+            chunk = list(itertools.islice(pairs, chunk_rows))
+            if not chunk:
+                return
+            yield file_format, chunk
+    elif file_format == "csv":
+        fieldnames = next(csv.reader([stream.readline()]), [])
+        fieldnames = [name.strip().lower() for name in fieldnames]
+        missing = [name for name in ("title", "year", "rating") if name not in fieldnames]
+        if missing:
+            raise ValueError(f"the CSV header has no {', '.join(missing)} column")
+        for first_line, lines in _line_chunks(stream, chunk_rows, 2, quoted=True):
+            yield file_format, lines, first_line, fieldnames
+    else:
+        for first_line, lines in _line_chunks(stream, chunk_rows, 1, quoted=False):
+            yield file_format, lines, first_line
+
+
+def parse_chunk(file_format, items, first_line=1, fieldnames=None):
+    """
+    Normalize one chunk of an import file; runs in the worker processes.
+
+    Args:
+        file_format (str): One of FORMATS.
+        items (list): Lines of a CSV or JSON Lines file, or (title, movie)
+            pairs of a dict-shaped JSON file.
+        first_line (int): Line number of the first line.
+        fieldnames (list of str): CSV header.
+
+    Returns:
+        tuple: (rows, errors): (title, year, rating, image_link) tuples of
+        the valid records and 'line N: reason' messages for the others.
+    """
+    if file_format == "csv":
+        reader = csv.DictReader(items, fieldnames=fieldnames)
+        records = ((f"line {first_line + reader.line_num - 1}", record)
+                   for record in reader if any(record.values()))
+    elif file_format == "jsonl":
+        records = ((f"line {number}", line)
+                   for number, line in enumerate(items, start=first_line) if line.strip())
+    else:
+        records = ((f"movie {title!r}", dict(movie, title=title)) for title, movie in items)
+    rows = []
+    errors = []
+    for location, record in records:
+        try:
+            if isinstance(record, str):
+                record = json.loads(record)
+                if not isinstance(record, dict):
+                    raise ValueError("not a JSON object")
+            movie = Movie.parse(record.get("title"), record.get("year"),
+                                record.get("rating"), record.get("image_link"))
+        except (ValueError, TypeError, AttributeError) as e:
+            errors.append(f"{location}: {e}")
+            continue
+        rows.append((movie.title, movie.year, movie.rating, movie.image_link))
+    return rows, errors
+
+
+def parse_chunks(chunks, workers=1):
+    """
+    Yield the parse_chunk results of chunks in order. With more than one
+    worker, chunks are parsed by a process pool, at most two per worker
+    ahead of the caller.
+    """
+    if workers <= 1:
+        for chunk in chunks:
+            yield parse_chunk(*chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(executor.submit(parse_chunk, *chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class ImportReport:
+    """Counters collected during an import."""
+
+    def __init__(self):
+        self.outcomes = collections.Counter()
+        self.invalid = 0
+        self.errors = []
+        self.elapsed = 0.0
+
+    def __str__(self):
+        stored = ", ".join(f"{count} {outcome}"
+                           for outcome, count in sorted(self.outcomes.items()))
+        return (f"{stored or 'nothing stored'}, {self.invalid} invalid "
+                f"in {self.elapsed:.1f}s")
+
+
+@metrics.timed("transfer.import")
+def import_movies(stream, file_format, replace=True, chunk_rows=CHUNK_ROWS, workers=1):
+    """
+    Add the movies of an import file, one transaction per chunk.
+
+    An interrupted import keeps the chunks already committed; importing
+    the same file again with replace stores the same result.
+
+    Args:
+        stream (file): Opened with newline='' for CSV.
+        file_format (str): One of FORMATS.
+        replace (bool): Upsert movies whose title is already stored; when
+            False they are left untouched.
+        chunk_rows (int): Records parsed per task and stored per transaction.
+        workers (int): Processes parsing CSV and JSON Lines chunks.
+
+    Returns:
+        ImportReport: Outcomes of the stored movies and the invalid records.
+
+    Raises:
+        ValueError: When the file as a whole can't be read in file_format.
+    """
+    report = ImportReport()
+    start = time.perf_counter()
+    if file_format == "json":
+        workers = 1
+    try:
+        for rows, errors in parse_chunks(read_chunks(stream, file_format, chunk_rows),
+                                         workers):
+            report.invalid += len(errors)
+            report.errors.extend(errors[:max(0, MAX_REPORTED_ERRORS - len(report.errors))])
+            if rows:
+                report.outcomes.update(storage.add_movies(
+                    [Movie(*row) for row in rows], replace=replace))
+    finally:
+        report.elapsed = time.perf_counter() - start
+    metrics.count("transfer.rows_imported", sum(report.outcomes.values()))
+    return report
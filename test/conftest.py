@@ -0,0 +1,23 @@
+import os
+import tempfile
+
+# Keep the test session away from database/movies.sqlite3 and the OMDb
+# response cache: this has to be set before storage_api.movie_storage_sql is imported.
+os.environ.setdefault(
+    'MOVIES_DB_URL',
+    'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'movies.sqlite3'))
+os.environ.setdefault('OMDB_CACHE_PATH', '')
+
+import pytest
+
+from storage_api import movie_storage_sql as storage
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """Point movie_storage_sql at an empty database file for one test."""
+    engine = storage.build_engine(f"sqlite:///{tmp_path / 'movies.sqlite3'}")
+    monkeypatch.setattr(storage, 'engine', engine)
+    storage.create_schema()
+    yield storage
+    engine.dispose()
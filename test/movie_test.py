@@ -1,21 +1,22 @@
-from storage_api.movie_storage_sql import add_movie, list_movies, delete_movie, update_movie
+from storage_api.movie_storage_sql import (add_movie, delete_movie, get_movie,
+                                           list_movies, update_movie)
 
-# Test adding a movie
-add_movie("Inception", 2010, 8.8)
-add_movie("Avengers Endgame", 2015, 8.4)
-add_movie("The Matrix", 1997, 7.8)
-add_movie("My Girl", 1994, 8.6)
-add_movie("Deep Impact", 1999, 9.0)
-add_movie("There is no Tomorrow", 2027, 9.5)
 
-# Test listing movies
-movies = list_movies()
-print(movies)
+def test_add_update_and_delete_movies(temp_db, capsys):
+    add_movie("Inception", 2010, 8.8, "N/A")
+    add_movie("The Matrix", 1999, 8.7, "N/A")
+    add_movie("inception", 2010, 8.8, "N/A")
+    assert capsys.readouterr().out.splitlines() == [
+        "Movie 'Inception' added successfully.",
+        "Movie 'The Matrix' added successfully.",
+        "Error: Movie 'inception' already exists."]
+    assert list(list_movies()) == ["Inception", "The Matrix"]
 
-# Test updating a movie's rating
-update_movie("Inception", 9.0)
-print(list_movies())
+    update_movie("Inception", 9.0)
+    assert get_movie("Inception")['rating'] == 9.0
 
-# Test deleting a movie
-delete_movie("Inception")
-print(list_movies())
\ No newline at end of file
+    delete_movie("Inception")
+    delete_movie("Inception")
+    assert capsys.readouterr().out.splitlines()[-1] == \
+        "Error: Movie 'Inception' doesn't exist."
+    assert list(list_movies()) == ["The Matrix"]
@@ -0,0 +1,26 @@
+from benchmarks import bench_suite
+from benchmarks.synthetic_catalog import SyntheticOmdb, synthetic_movies
+
+
+def test_synthetic_catalogs_are_deterministic_and_unique():
+    movies = list(synthetic_movies(500))
+    assert movies == list(synthetic_movies(500))
+    assert len({movie['title'] for movie in movies}) == 500
+    assert SyntheticOmdb().fetch('Heat') == SyntheticOmdb().fetch('Heat')
+
+
+def test_suite_reports_every_operation(monkeypatch):
+    previous = bench_suite.storage.engine
+    try:
+        report = bench_suite.run_suite([200], ops=3, site_max_rows=100)
+    finally:
+        monkeypatch.setattr(bench_suite.storage, 'engine', previous)
+    size, = report['sizes']
+    assert size['omdb_import']['stored'] == 20
+    assert size['list']['seconds'] > 0
+    assert set(size['search']) == {'mean_ms', 'p50_ms', 'p99_ms'}
+    assert size['site_build'] is None
+
+    slower = dict(size, stats=dict(size['stats'], p50_ms=size['stats']['p50_ms'] * 2))
+    assert bench_suite.regressions(report, {'sizes': [slower]}) == [
+        (200, 'stats', size['stats']['p50_ms'], slower['stats']['p50_ms'])]
@@ -0,0 +1,123 @@
+import io
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from movies_omdb_api.bulk_import import OmdbFetcher, bulk_import, read_titles
+from movies_omdb_api.omdb_cache import ResponseCache
+
+MOVIES = {
+    'the matrix': {'Title': 'The Matrix', 'Year': '1999',
+                   'imdbRating': '8.7', 'Poster': 'http://img/matrix.jpg'},
+    'tt0172495': {'Title': 'Gladiator', 'Year': '2000',
+                  'imdbRating': '8.5', 'Poster': 'http://img/gladiator.jpg'},
+    'scream': {'Title': 'Scream', 'Year': '1996',
+               'imdbRating': '7.4', 'Poster': 'http://img/scream.jpg'},
+}
+
+
+class StubOmdbHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        query = parse_qs(urlsplit(self.path).query)
+        key = (query.get('i') or query.get('t'))[0].lower()
+        self.server.calls[key] = self.server.calls.get(key, 0) + 1
+        if key == 'flaky' and self.server.calls[key] < 3:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if key == 'flaky':
+            movie = {'Title': 'Flaky', 'Year': '2001', 'imdbRating': '5.0',
+                     'Poster': 'N/A'}
+        else:
+            movie = MOVIES.get(key)
+        if movie is None:
+            body = {'Response': 'False', 'Error': 'Movie not found!'}
+        else:
+            body = dict(movie, Response='True')
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def omdb_stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubOmdbHandler)
+    server.calls = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_fetcher(server, **kwargs):
+    host, port = server.server_address
+    kwargs.setdefault('rate', 0)
+    return OmdbFetcher(base_url=f'http://{host}:{port}/', api_key='test',
+                       backoff=0.01, **kwargs)
+
+
+def test_read_titles_skips_blank_lines_and_comments():
+    stream = io.StringIO('The Matrix\n\n# comment\n  tt0172495  \n')
+    assert list(read_titles(stream)) == ['The Matrix', 'tt0172495']
+
+
+def test_bulk_import_stores_found_movies_in_batches(temp_db, omdb_stub):
+    fetcher = make_fetcher(omdb_stub, pool_size=4)
+    titles = ['The Matrix', 'tt0172495', 'Scream', 'Nope', 'flaky']
+    report = bulk_import(titles, fetcher=fetcher, workers=4, batch_size=2)
+    fetcher.close()
+
+    assert report.requested == 5
+    assert report.stored == 4
+    assert report.not_found == ['Nope']
+    assert report.failed == []
+    assert omdb_stub.calls['flaky'] == 3
+    movies = temp_db.list_movies()
+    assert sorted(movies) == ['Flaky', 'Gladiator', 'Scream', 'The Matrix']
+    assert movies['Gladiator']['image_link'] == 'http://img/gladiator.jpg'
+
+
+def test_bulk_import_skips_movies_already_stored(temp_db, omdb_stub):
+    fetcher = make_fetcher(omdb_stub)
+    bulk_import(['The Matrix'], fetcher=fetcher, workers=2)
+    report = bulk_import(['The Matrix', 'Scream'], fetcher=fetcher, workers=2)
+    fetcher.close()
+
+    assert report.stored == 1
+    assert sorted(temp_db.list_movies()) == ['Scream', 'The Matrix']
+
+
+def test_fetch_gives_up_after_retries(omdb_stub):
+    omdb_stub.calls['flaky'] = -10
+    fetcher = make_fetcher(omdb_stub, retries=1)
+    report = bulk_import(['flaky'], fetcher=fetcher, workers=1)
+    fetcher.close()
+
+    assert [name for name, _ in report.failed] == ['flaky']
+    assert omdb_stub.calls['flaky'] == -8
+
+
+def test_fetcher_serves_repeated_lookups_from_cache(omdb_stub):
+    cache = ResponseCache(':memory:')
+    fetcher = make_fetcher(omdb_stub, cache=cache)
+    assert fetcher.fetch('The Matrix')['title'] == 'The Matrix'
+    assert fetcher.fetch('the  matrix')['title'] == 'The Matrix'
+    assert fetcher.fetch('Nope') is None
+    assert fetcher.fetch('NOPE') is None
+    fetcher.close()
+
+    assert omdb_stub.calls == {'the matrix': 1, 'nope': 1}
+    assert cache.stats()['hits'] == 2
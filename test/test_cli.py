@@ -0,0 +1,109 @@
+import io
+import json
+
+import pytest
+
+import movies
+
+
+@pytest.fixture
+def catalog(temp_db):
+    temp_db.add_movies([
+        {'title': 'The Matrix', 'year': 1999, 'rating': 8.7, 'image_link': 'N/A'},
+        {'title': 'Scream', 'year': 1996, 'rating': 7.4, 'image_link': 'N/A'},
+    ])
+    return temp_db
+
+
+def test_listing_commands_write_json_and_csv(catalog, capsys):
+    assert movies.main(['filter', '--min-rating', '8', '--format', 'json']) == 0
+    assert [m['title'] for m in json.loads(capsys.readouterr().out)] == ['The Matrix']
+
+    movies.main(['list', '--sort', 'year', '--format', 'csv'])
+    assert capsys.readouterr().out.splitlines() == [
+        'id,title,year,rating,image_link', '2,Scream,1996,7.4,N/A',
+        '1,The Matrix,1999,8.7,N/A']
+
+    movies.main(['stats', '--format', 'json'])
+    assert json.loads(capsys.readouterr().out)[0]['best'] == 'The Matrix'
+
+
+def test_update_and_delete_report_outcomes(catalog, capsys):
+    assert movies.main(['update', 'scream', '9']) == 0
+    assert movies.main(['delete', 'The Matrix', 'Missing']) == 1
+    assert capsys.readouterr().out.splitlines() == [
+        'update scream: updated', 'delete The Matrix: deleted',
+        'delete Missing: missing']
+    assert catalog.get_movie('Scream')['rating'] == 9
+
+
+def test_batch_runs_grouped_transactions(catalog, monkeypatch, capsys):
+    lines = [json.dumps({'op': 'add', 'title': f'Movie {i}', 'year': 2000,
+                         'rating': 5}) for i in range(5)]
+    lines += ['# comment', '',
+              json.dumps({'op': 'update', 'title': 'movie 1', 'rating': 6}),
+              json.dumps({'op': 'upsert', 'title': 'Scream', 'year': 1996, 'rating': 1}),
+              json.dumps({'op': 'delete', 'title': 'Movie 2'})]
+    monkeypatch.setattr('sys.stdin', io.StringIO('\n'.join(lines)))
+    assert movies.main(['batch', '-', '--group-size', '3', '--quiet']) == 0
+    assert capsys.readouterr().err.strip() == '5 added, 1 deleted, 2 updated'
+    assert catalog.get_movie('Movie 1')['rating'] == 6
+    assert catalog.get_movie('Scream')['rating'] == 1
+    assert catalog.get_movie('Movie 2') is None
+
+
+def test_batch_stops_before_the_group_with_an_invalid_line(catalog, monkeypatch, capsys):
+    lines = [json.dumps({'op': 'delete', 'title': 'Scream'}),
+             json.dumps({'op': 'delete', 'title': 'The Matrix'}),
+             json.dumps({'op': 'update', 'title': 'The Matrix'})]
+    monkeypatch.setattr('sys.stdin', io.StringIO('\n'.join(lines)))
+    assert movies.main(['batch', '-', '--group-size', '2']) == 2
+    assert "line 3: 'rating'" in capsys.readouterr().err
+    assert catalog.get_movie('Scream') is None
+    assert catalog.get_movie('The Matrix') is None
+
+
+@pytest.mark.parametrize('rating', ['nan', 'inf', '-42', '1e300'])
+def test_invalid_ratings_are_argument_errors(catalog, monkeypatch, capsys, rating):
+    with pytest.raises(SystemExit) as exit_info:
+        movies.main(['update', 'Scream', rating])
+    assert exit_info.value.code == 2
+    assert 'is not a rating from 0 to 10' in capsys.readouterr().err
+
+    monkeypatch.setattr('sys.stdin', io.StringIO(
+        '{"op": "update", "title": "Scream", "rating": "%s"}\n' % rating))
+    assert movies.main(['batch', '-']) == 2
+    assert 'line 1: ' in capsys.readouterr().err
+    assert catalog.get_movie('Scream')['rating'] == 7.4
+
+
+def test_file_and_parse_errors_are_reported_without_a_traceback(catalog, monkeypatch,
+                                                               capsys, tmp_path):
+    missing = str(tmp_path / 'missing.jsonl')
+    for argv in (['batch', missing], ['import', missing],
+                 ['export', str(tmp_path / 'no' / 'dir.csv')]):
+        assert movies.main(argv) == 2
+        assert capsys.readouterr().err.startswith('Error: cannot open ')
+
+    monkeypatch.setattr('sys.stdin', io.StringIO(json.dumps(
+        {'op': 'add', 'title': 'Heat', 'year': 1995, 'rating': 8.3, 'image_link': 5})))
+    assert movies.main(['batch', '-']) == 2
+    assert 'Error: line 1: ' in capsys.readouterr().err
+    assert catalog.get_movie('Heat') is None
+
+
+def test_menu_website_can_skip_or_survive_poster_mirroring(catalog, monkeypatch, capsys):
+    from website_generator import site_builder
+
+    builds = []
+    monkeypatch.setattr(site_builder, 'build_site',
+                        lambda posters=None: builds.append(posters) or 'built')
+
+    def offline():
+        raise OSError('network is unreachable')
+    monkeypatch.setattr(site_builder, 'mirror_posters', offline)
+
+    movies.generate_website('n')
+    movies.generate_website('Y')
+    assert builds == [None, None]
+    assert 'linking the remote posters instead' in capsys.readouterr().out
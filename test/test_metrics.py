@@ -0,0 +1,51 @@
+import pstats
+
+import pytest
+
+import movies
+from instrumentation import metrics
+
+
+@pytest.fixture
+def collecting():
+    metrics.reset()
+    metrics.enable()
+    yield metrics
+    metrics.disable()
+    metrics.reset()
+
+
+def test_nothing_is_collected_while_disabled():
+    metrics.reset()
+    with metrics.span('idle'):
+        metrics.count('idle')
+    assert metrics.snapshot() == {'spans': {}, 'counters': {}}
+
+
+def test_spans_and_counters(collecting):
+    @metrics.timed('work')
+    def work(fail=False):
+        if fail:
+            raise ValueError
+        return 42
+
+    assert work() == 42
+    with pytest.raises(ValueError):
+        work(fail=True)
+    metrics.count('rows', 3)
+    metrics.count('rows')
+    collected = metrics.snapshot()
+    assert collected['spans']['work']['calls'] == 2
+    assert collected['counters'] == {'rows': 4}
+    assert 'work' in metrics.format_summary()
+
+
+def test_commands_report_their_layers(collecting, temp_db, tmp_path, capsys):
+    temp_db.add_movies([{'title': 'Heat', 'year': 1995, 'rating': 8.3,
+                         'image_link': 'N/A'}])
+    profile = tmp_path / 'list.prof'
+    assert movies.main(['--profile', str(profile), 'list']) == 0
+    spans = metrics.snapshot()['spans']
+    assert {'command.list', 'query.query_movies'} <= set(spans)
+    assert metrics.snapshot()['counters']['query.rows_read'] == 1
+    assert pstats.Stats(str(profile)).total_calls > 0
@@ -0,0 +1,65 @@
+import random
+
+from storage_api import movie_query as query
+from storage_api.movie_cache import CatalogCache
+from storage_api.movie_record import Movie
+
+
+def seed(storage, count=60):
+    rng = random.Random(3)
+    storage.add_movies([{'title': f'Movie {i}', 'year': 1990 + rng.randrange(5),
+                         'rating': rng.choice([6.5, 7.0, 8.0]), 'image_link': 'N/A'}
+                        for i in range(count)])
+
+
+def titles(movies):
+    return [movie['title'] for movie in movies]
+
+
+def test_views_match_the_database_order(temp_db):
+    seed(temp_db)
+    cache = CatalogCache()
+    for order_by in ('id', 'title', 'rating', 'year'):
+        for descending in (False, True):
+            assert titles(cache.movies(order_by, descending)) == \
+                titles(query.iter_movies(order_by=order_by, descending=descending))
+    assert titles(cache.movies('rating', True, min_rating=7, start_year=1991,
+                               end_year=1993)) == \
+        titles(query.iter_movies(order_by='rating', descending=True, min_rating=7,
+                                 start_year=1991, end_year=1993))
+
+
+def test_writes_patch_the_cache_without_reloading(temp_db):
+    seed(temp_db, 3)
+    cache = CatalogCache()
+    movies = cache.movies()
+    cached = cache._movies
+
+    assert cache.add_movie(Movie('Heat', 1995, 8.3)) == temp_db.ADDED
+    assert cache.add_movie(Movie('heat', 1995, 8.3)) == temp_db.SKIPPED
+    assert cache.update_rating('movie 1', 9.5) == temp_db.UPDATED
+    assert cache.delete_movie('Movie 0') == temp_db.DELETED
+    assert cache.delete_movie('Movie 0') == temp_db.MISSING
+
+    assert cache._movies is cached
+    assert cache.version == temp_db.data_version()
+    assert titles(cache.movies()) == ['Movie 1', 'Movie 2', 'Heat']
+    assert cache.get_movie(' HEAT ') == Movie('Heat', 1995, 8.3)
+    assert cache.movies('rating', True)[0] == Movie('Movie 1', movies[1].year, 9.5)
+    assert titles(cache.movies()) == titles(query.iter_movies())
+
+
+def test_writes_by_others_invalidate_the_cache(temp_db):
+    seed(temp_db, 3)
+    cache = CatalogCache()
+    assert cache.count() == 3
+    temp_db.add_movies([Movie('Heat', 1995, 8.3)])
+    assert cache.get_movie('heat') == Movie('Heat', 1995, 8.3)
+    assert cache.count() == 4
+    # A write behind its back is not patched in, but picked up on the next read
+    cached = cache._movies
+    temp_db.delete_movies(['Movie 2'])
+    assert cache.update_rating('Heat', 7.0) == temp_db.UPDATED
+    assert cache._movies is None
+    assert titles(cache.movies()) == ['Movie 0', 'Movie 1', 'Heat']
+    assert cache._movies is not cached
@@ -0,0 +1,44 @@
+from sqlalchemy import text
+
+from storage_api import movie_changes
+
+
+def movie(title, rating=7.0):
+    return {'title': title, 'year': 2000, 'rating': rating, 'image_link': 'N/A'}
+
+
+def test_every_mutation_is_logged_in_order(temp_db):
+    temp_db.add_movies([movie('Scream'), movie('Gladiator')])
+    cursor = movie_changes.latest_cursor()
+    temp_db.add_movies([movie('scream', 8.0)])
+    temp_db.update_ratings({'Gladiator': 9.0, 'Missing': 1.0})
+    temp_db.delete_movies(['Scream'])
+
+    changes = list(movie_changes.changes_since(cursor, page_size=2))
+    assert [(c['op'], c['title'], c['rating']) for c in changes] == [
+        ('update', 'Scream', 8.0), ('update', 'Gladiator', 9.0),
+        ('delete', 'Scream', None)]
+    assert [c['seq'] for c in changes] == sorted({c['seq'] for c in changes})
+    assert changes[-1]['seq'] == movie_changes.latest_cursor()
+    assert len(list(movie_changes.changes_since(0, limit=3, page_size=2))) == 3
+
+
+def test_pruned_sequence_numbers_are_not_reused(temp_db):
+    temp_db.add_movies([movie('Scream')])
+    cursor = movie_changes.latest_cursor()
+    assert movie_changes.prune_changes(cursor) == 1
+    temp_db.delete_movies(['Scream'])
+    assert [c['seq'] for c in movie_changes.changes_since(0)] == [cursor + 1]
+
+
+def test_migration_logs_existing_movies_as_inserts(temp_db):
+    temp_db.add_movies([movie('Scream'), movie('Gladiator')])
+    with temp_db.engine.begin() as connection:
+        connection.execute(text('DROP TABLE movie_changes'))
+        for trigger in ('insert', 'update', 'delete'):
+            connection.execute(text(f'DROP TRIGGER movies_change_{trigger}'))
+        version = temp_db.MIGRATIONS.index(temp_db._add_change_log)
+        connection.execute(text(f'PRAGMA user_version = {version}'))
+    temp_db.create_schema()
+    assert [(c['op'], c['title']) for c in movie_changes.changes_since()] == [
+        ('insert', 'Scream'), ('insert', 'Gladiator')]
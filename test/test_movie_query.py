@@ -0,0 +1,90 @@
+import random
+import statistics
+
+import pytest
+
+from storage_api import movie_query as query
+
+MOVIES = [
+    ('The Matrix', 1999, 8.7), ('Gladiator', 2000, 8.5), ('Scream', 1996, 7.4),
+    ('My Girl', 1991, 6.9), ('Amélie', 2001, 8.3), ('100% Wolf', 2020, 5.5),
+]
+
+
+@pytest.fixture
+def catalog(temp_db):
+    temp_db.add_movies({'title': t, 'year': y, 'rating': r, 'image_link': 'N/A'}
+                       for t, y, r in MOVIES)
+    return temp_db
+
+
+def titles(movies):
+    return [movie['title'] for movie in movies]
+
+
+def test_filters_and_sorting_run_in_sql(catalog):
+    movies = query.query_movies(min_rating=7, start_year=1995, end_year=2000,
+                                order_by='rating', descending=True)
+    assert titles(movies) == ['The Matrix', 'Gladiator', 'Scream']
+    assert titles(query.query_movies(order_by='title', limit=2)) == \
+        ['100% Wolf', 'Amélie']
+    assert query.count_movies(min_rating=8) == 3
+
+
+def test_title_search_is_case_insensitive_and_escapes_wildcards(catalog):
+    assert titles(query.query_movies(title_contains='AMÉLIE')) == ['Amélie']
+    assert titles(query.query_movies(title_contains='100%')) == ['100% Wolf']
+    assert query.query_movies(title_contains='0%W') == []
+
+
+def test_keyset_pages_match_offset_pages(catalog):
+    pages = []
+    after = None
+    while True:
+        page = query.query_movies(order_by='year', descending=True, limit=4,
+                                  after=after)
+        pages.append(titles(page))
+        if len(page) < 4:
+            break
+        after = query.page_cursor(page[-1], 'year')
+
+    assert pages == [
+        titles(query.query_movies(order_by='year', descending=True, limit=4)),
+        titles(query.query_movies(order_by='year', descending=True, limit=4,
+                                  offset=4)),
+    ]
+
+
+def test_iter_movies_streams_every_match(catalog):
+    assert titles(query.iter_movies(order_by='title', page_size=2)) == sorted(
+        titles(query.iter_movies()), key=str.casefold)
+    assert len(list(query.iter_movies(page_size=1, max_rating=7))) == 2
+
+
+def test_rating_stats_follow_every_write(catalog):
+    rng = random.Random(7)
+    catalog.add_movies({'title': f'Movie {i}', 'year': 2000, 'image_link': 'N/A',
+                        'rating': rng.choice([1.0, 5.5, 7.4, 9.9])} for i in range(50))
+    catalog.update_ratings({f'Movie {i}': 3.3 for i in range(0, 50, 3)})
+    catalog.delete_movies([f'Movie {i}' for i in range(0, 50, 4)])
+    version = catalog.data_version()
+    ratings = [m['rating'] for m in query.iter_movies()]
+
+    summary = query.rating_stats(quantiles=(0, 0.25, 1))
+    assert summary['count'] == len(ratings)
+    assert summary['mean'] == pytest.approx(statistics.fmean(ratings))
+    assert summary['median'] == pytest.approx(statistics.median(ratings))
+    assert summary['quantiles'][0.25] == pytest.approx(
+        statistics.quantiles(ratings, n=4, method='inclusive')[0])
+    assert summary['quantiles'][0] == min(ratings)
+    assert summary['quantiles'][1] == summary['best']['rating'] == max(ratings)
+    assert dict(summary['histogram']) == {r: ratings.count(r) for r in set(ratings)}
+    assert query.rating_bucket_counts()[0] == (9, ratings.count(9.9))
+
+    catalog.update_ratings({'Scream': 0.5})
+    assert catalog.data_version() > version
+    assert query.rating_stats()['worst']['title'] == 'Scream'
+
+
+def test_rating_stats_of_empty_catalog(temp_db):
+    assert query.rating_stats() is None
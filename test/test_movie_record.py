@@ -0,0 +1,77 @@
+import pytest
+from sqlalchemy import text
+
+from movies_omdb_api.movie_omdb_api import parse_movie_info
+from storage_api.movie_record import NO_POSTER, Movie, parse_rating
+from storage_api.movie_storage import JsonLogStore
+
+
+def test_omdb_values_are_parsed_once():
+    movie = parse_movie_info({'Title': ' Sherlock ', 'Year': '2010–2017',
+                              'imdbRating': '9.1', 'Poster': 'N/A'})
+    assert movie == Movie('Sherlock', 2010, 9.1, NO_POSTER)
+    assert dict(movie) == movie.to_dict()
+    assert movie['year'] == 2010
+    with pytest.raises(ValueError, match='no rating'):
+        parse_movie_info({'Title': 'Upcoming', 'Year': '2027', 'imdbRating': 'N/A',
+                          'Poster': 'N/A'})
+
+
+def test_coerce_normalizes_dicts():
+    assert Movie.coerce({'title': 'Heat', 'year': '1995', 'rating': '8.3',
+                         'image_link': ''}) == Movie('Heat', 1995, 8.3, NO_POSTER)
+    with pytest.raises(ValueError, match='no release year'):
+        Movie.coerce({'title': 'Heat', 'year': 'N/A', 'rating': 8.3})
+
+
+def test_storage_stores_typed_values(temp_db):
+    temp_db.add_movies([{'title': 'Heat', 'year': '1995', 'rating': '8.3',
+                         'image_link': 'N/A'}])
+    with pytest.raises(ValueError):
+        temp_db.add_movies([{'title': 'Bad', 'year': 2000, 'rating': 'N/A',
+                             'image_link': 'N/A'}])
+    assert temp_db.get_movie('heat') == Movie('Heat', 1995, 8.3, NO_POSTER)
+    assert temp_db.get_movie('bad') is None
+
+
+def test_migration_converts_stored_strings(temp_db):
+    with temp_db.engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO movies (title, year, rating, image_link, title_key) "
+            "VALUES ('Sherlock', '2010–2017', '9.1', ' ', 'sherlock')"))
+        version = temp_db.MIGRATIONS.index(temp_db._normalize_stored_values)
+        connection.execute(text(f'PRAGMA user_version = {version}'))
+    temp_db.create_schema()
+    with temp_db.engine.connect() as connection:
+        row = connection.execute(text(
+            "SELECT typeof(year), typeof(rating), image_link FROM movies")).one()
+        histogram = connection.execute(text("SELECT * FROM rating_histogram")).all()
+    assert tuple(row) == ('integer', 'real', NO_POSTER)
+    assert [tuple(bucket) for bucket in histogram] == [(9.1, 1)]
+
+
+INVALID_RATINGS = ['nan', 'inf', float('-inf'), -42, 1e300, 10.5, 'N/A', None]
+
+
+@pytest.mark.parametrize('rating', INVALID_RATINGS)
+def test_invalid_ratings_are_rejected(temp_db, tmp_path, rating):
+    assert parse_rating(rating) is None
+    with pytest.raises(ValueError, match='no rating from 0 to 10'):
+        Movie.parse('Heat', 1995, rating)
+
+    temp_db.add_movies([Movie('Heat', 1995, 8.3)])
+    with pytest.raises(ValueError):
+        temp_db.update_ratings([('Alien', 8.4), ('Heat', rating)])
+    assert temp_db.get_movie('heat').rating == 8.3
+
+    log = JsonLogStore(str(tmp_path / 'movies.jsonl'), fsync=False)
+    log.add_movies([Movie('Heat', 1995, 8.3)])
+    with pytest.raises(ValueError):
+        log.update_ratings([('Heat', rating)])
+    assert log.get_movie('heat').rating == 8.3
+    log.close()
+
+
+def test_rating_bounds_are_inclusive():
+    assert parse_rating('0') == 0.0
+    assert parse_rating(10) == 10.0
@@ -0,0 +1,48 @@
+import pytest
+
+from storage_api import movie_search as search
+
+MOVIES = ['The Matrix', 'The Matrix Reloaded', 'Gladiator', 'Amélie',
+          'Scream', 'Screamers', 'Avengers: Endgame', 'My Girl']
+
+
+@pytest.fixture
+def catalog(temp_db):
+    temp_db.add_movies({'title': title, 'year': 2000, 'rating': 7.0,
+                        'image_link': 'N/A'} for title in MOVIES)
+    return temp_db
+
+
+def titles(movies):
+    return [movie['title'] for movie in movies]
+
+
+def test_word_matches_rank_before_substring_matches(catalog):
+    assert titles(search.search_movies('scream')) == ['Scream', 'Screamers']
+    assert titles(search.search_movies('matrix rel')) == ['The Matrix Reloaded']
+    assert titles(search.search_movies('atrix')) == ['The Matrix',
+                                                     'The Matrix Reloaded']
+    assert titles(search.search_movies('amelie')) == ['Amélie']
+    assert titles(search.search_movies('ENDGAME')) == ['Avengers: Endgame']
+
+
+def test_search_respects_limit_and_short_terms(catalog):
+    assert len(search.search_movies('the', limit=1)) == 1
+    assert titles(search.search_movies('ir')) == ['My Girl']
+    assert search.search_movies('"') == []
+
+
+def test_search_index_follows_writes(catalog):
+    catalog.delete_movies(['Scream'])
+    catalog.add_movies([{'title': 'Scream 2', 'year': 1997, 'rating': 6.3,
+                         'image_link': 'N/A'}])
+    assert sorted(titles(search.search_movies('scream'))) == ['Scream 2',
+                                                              'Screamers']
+
+
+def test_suggest_titles_finds_close_matches(catalog):
+    assert titles(search.suggest_titles('Gladiatr')) == ['Gladiator']
+    assert titles(search.suggest_titles('the matirx', limit=2)) == [
+        'The Matrix', 'The Matrix Reloaded']
+    assert search.suggest_titles('zzzzzz') == []
+    assert search.suggest_titles('ab') == []
@@ -0,0 +1,144 @@
+import json
+
+from storage_api import backends
+from storage_api import movie_storage
+from storage_api.movie_record import Movie
+from storage_api.movie_storage import JsonLogStore
+
+import movies
+
+
+def movie(title, year=2000, rating=7.0):
+    return Movie(title, year, rating)
+
+
+def test_json_log_store_matches_sql_outcomes(tmp_path):
+    store = JsonLogStore(str(tmp_path / 'movies.jsonl'), fsync=False)
+    assert store.add_movies([movie('The Matrix'), movie('Heat')]) == ['added', 'added']
+    assert store.add_movies([movie('the  MATRIX', rating=9.0)]) == ['updated']
+    assert store.add_movies([movie('Heat', rating=1.0)], replace=False) == ['skipped']
+    assert store.get_movie('THE MATRIX') == movie('The Matrix', rating=9.0)
+
+    assert store.update_ratings([('heat', 8.3), ('Missing', 5)]) == ['updated', 'missing']
+    assert store.delete_movies(['The Matrix', 'The Matrix']) == ['deleted', 'missing']
+    assert list(store.iter_movies()) == [movie('Heat', rating=8.3)]
+    assert store.count_movies() == 1
+    store.close()
+
+
+def test_reopen_scans_only_the_tail_and_drops_a_torn_line(tmp_path):
+    path = str(tmp_path / 'movies.jsonl')
+    store = JsonLogStore(path, fsync=False)
+    store.add_movies([movie('Alien'), movie('Heat')])
+    store.close()
+
+    store = JsonLogStore(path, fsync=False)
+    store.add_movies([movie('Fargo')])
+    # Not closed: the saved index is behind the log, and a crash cut a write short
+    store._file.write(b'{"op": "put", "key": "se')
+    store._file.flush()
+
+    reopened = JsonLogStore(path, fsync=False)
+    assert [m['title'] for m in reopened.iter_movies()] == ['Alien', 'Heat', 'Fargo']
+    with open(path, 'rb') as f:
+        assert f.read().endswith(b'\n')
+    reopened.close()
+
+
+def test_compaction_keeps_only_live_records(tmp_path, monkeypatch):
+    monkeypatch.setattr(movie_storage, 'COMPACT_MIN_DEAD', 10)
+    path = tmp_path / 'movies.jsonl'
+    store = JsonLogStore(str(path), fsync=False)
+    store.add_movies([movie('Alien'), movie('Heat')])
+    for rating in range(12):
+        store.update_ratings([('Heat', rating / 2)])
+
+    assert store.dead < 10
+    assert len(path.read_bytes().splitlines()) == store.dead + 2
+    assert store.get_movie('heat')['rating'] == 5.5
+    store.close()
+    assert JsonLogStore(str(path)).get_movie('Alien') == movie('Alien')
+
+
+def test_crash_during_compaction_leaves_no_stale_index(tmp_path, monkeypatch):
+    path = str(tmp_path / 'movies.jsonl')
+    store = JsonLogStore(path, fsync=False)
+    store.add_movies([movie('Alien'), movie('Heat')])
+    store.close()
+
+    store = JsonLogStore(path, fsync=False)
+    store.add_movies([movie('Fargo'), movie('Brazil')])
+    store.delete_movies(['Alien'])
+    # The process dies after the new log is in place, before its index is saved
+    monkeypatch.setattr(store, '_save_index', lambda: 1 / 0)
+    try:
+        store.compact()
+    except ZeroDivisionError:
+        pass
+
+    reopened = JsonLogStore(path, fsync=False)
+    assert [m['title'] for m in reopened.iter_movies()] == ['Heat', 'Fargo', 'Brazil']
+    reopened.close()
+
+
+def test_saved_index_of_a_replaced_log_is_ignored(tmp_path):
+    path = tmp_path / 'movies.jsonl'
+    store = JsonLogStore(str(path), fsync=False)
+    store.add_movies([movie('Alien'), movie('Heat')])
+    store.close()
+
+    # The log is deleted but its index is left behind, and a new log grows
+    # past the size the index covers
+    path.unlink()
+    store = JsonLogStore(str(path), fsync=False)
+    store.add_movies([movie('Brazil'), movie('Fargo'), movie('Memento')])
+    store._file.flush()
+
+    reopened = JsonLogStore(str(path), fsync=False)
+    assert [m['title'] for m in reopened.iter_movies()] == ['Brazil', 'Fargo', 'Memento']
+    reopened.close()
+
+
+def test_interactive_menu_needs_the_sql_backend(monkeypatch, capsys):
+    monkeypatch.setattr(backends, 'STORAGE_BACKEND', backends.JSON_LOG)
+    assert movies.main([]) == 2
+    assert 'needs the sql storage backend' in capsys.readouterr().err
+
+
+def test_migrate_between_backends(temp_db, tmp_path):
+    temp_db.add_movies([movie('The Matrix', 1999, 8.7), movie('Scream', 1996, 7.4)])
+    log = JsonLogStore(str(tmp_path / 'movies.jsonl'), fsync=False)
+    assert backends.migrate(backends.SqlStore().iter_movies(), log, batch_size=1) == 2
+    assert list(log.iter_movies()) == [movie('The Matrix', 1999, 8.7),
+                                       movie('Scream', 1996, 7.4)]
+
+    log.update_ratings([('Scream', 9.1)])
+    assert backends.migrate(log.iter_movies(), backends.SqlStore()) == 2
+    assert temp_db.get_movie('scream')['rating'] == 9.1
+    log.close()
+
+
+def test_migrate_command_reads_legacy_json(tmp_path, capsys):
+    legacy = tmp_path / 'data.json'
+    legacy.write_text(json.dumps({'Heat': {'year': 1995, 'rating': 8.3}}))
+    log = str(tmp_path / 'movies.jsonl')
+    assert movies.main(['migrate', '--from', 'legacy-json', '--from-location',
+                        str(legacy), '--to', 'jsonlog', '--to-location', log]) == 0
+    assert 'Copied 1 movies' in capsys.readouterr().err
+    assert JsonLogStore(log).get_movie('heat') == movie('Heat', 1995, 8.3)
+
+
+def test_list_command_on_the_json_log_backend(tmp_path, monkeypatch, capsys):
+    log = str(tmp_path / 'movies.jsonl')
+    store = JsonLogStore(log, fsync=False)
+    store.add_movies([movie('Heat', 1995, 8.3)])
+    store.close()
+    monkeypatch.setattr(backends, 'STORAGE_BACKEND', backends.JSON_LOG)
+    monkeypatch.setattr(backends, 'JSON_LOG_PATH', log)
+
+    assert movies.main(['list', '--format', 'json']) == 0
+    assert json.loads(capsys.readouterr().out) == [
+        {'title': 'Heat', 'year': 1995, 'rating': 8.3, 'image_link': 'N/A'}]
+    assert movies.main(['list', '--format', 'csv']) == 0
+    assert capsys.readouterr().out.splitlines() == [
+        'title,year,rating,image_link', 'Heat,1995,8.3,N/A']
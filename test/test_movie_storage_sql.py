@@ -0,0 +1,105 @@
+from storage_api.movie_storage_sql import (ADDED, DELETED, MISSING, SKIPPED,
+                                           UPDATED)
+
+
+def movie(title, year=2000, rating=7.0, image_link='N/A'):
+    return {'title': title, 'year': year, 'rating': rating,
+            'image_link': image_link}
+
+
+def test_add_movies_upserts_and_reports_outcomes(temp_db):
+    assert temp_db.add_movies([movie('A'), movie('B')]) == [ADDED, ADDED]
+    outcomes = temp_db.add_movies([movie('B', rating=9.1), movie('C'),
+                                   movie('C', year=2001)])
+
+    assert outcomes == [UPDATED, ADDED, UPDATED]
+    movies = temp_db.list_movies()
+    assert movies['B']['rating'] == 9.1
+    assert movies['C']['year'] == 2001
+
+
+def test_add_movies_without_replace_keeps_stored_rows(temp_db):
+    temp_db.add_movies([movie('A', rating=5.0)])
+    assert temp_db.add_movies([movie('A', rating=9.0), movie('B')],
+                              replace=False) == [SKIPPED, ADDED]
+    assert temp_db.list_movies()['A']['rating'] == 5.0
+
+
+def test_update_ratings_and_delete_movies(temp_db):
+    temp_db.add_movies(movie(title) for title in 'ABC')
+
+    assert temp_db.update_ratings({'A': 1.5, 'Z': 2.0}) == [UPDATED, MISSING]
+    assert temp_db.delete_movies(['B', 'Z', 'B']) == [DELETED, MISSING, MISSING]
+    movies = temp_db.list_movies()
+    assert sorted(movies) == ['A', 'C']
+    assert movies['A']['rating'] == 1.5
+
+
+def test_batches_span_several_chunks(temp_db, monkeypatch):
+    monkeypatch.setattr(temp_db, 'BATCH_SIZE', 3)
+    titles = [f'Movie {i}' for i in range(10)]
+    assert temp_db.add_movies(movie(t) for t in titles) == [ADDED] * 10
+    assert temp_db.delete_movies(titles[::2]) == [DELETED] * 5
+    assert len(temp_db.list_movies()) == 5
+
+
+def test_single_row_wrappers_print_outcome(temp_db, capsys):
+    temp_db.add_movie('A', 2000, 7.0, 'N/A')
+    temp_db.add_movie('A', 2000, 7.0, 'N/A')
+    temp_db.update_movie('Z', 1.0)
+    temp_db.delete_movie('A')
+    out = capsys.readouterr().out
+
+    assert "Movie 'A' added successfully." in out
+    assert "Movie 'A' already exists." in out
+    assert "Movie 'Z' doesn't exist." in out
+    assert "Movie 'A' deleted successfully." in out
+
+
+def test_titles_are_matched_ignoring_case_and_spacing(temp_db):
+    temp_db.add_movies([movie('The Matrix', rating=8.7)])
+
+    assert temp_db.get_movie('the  MATRIX ')['title'] == 'The Matrix'
+    assert temp_db.get_movie('Matrix') is None
+    assert temp_db.add_movies([movie('THE MATRIX')], replace=False) == [SKIPPED]
+    assert temp_db.add_movies([movie('The Matrix', rating=9.0)]) == [UPDATED]
+    assert temp_db.update_ratings([('the matrix', 8.0)]) == [UPDATED]
+    assert temp_db.list_movies() == {
+        'The Matrix': {'year': 2000, 'rating': 8.0, 'image_link': 'N/A'}}
+    assert temp_db.delete_movies(['THE MATRIX']) == [DELETED]
+    assert temp_db.list_movies() == {}
+
+
+def test_migration_drops_case_insensitive_duplicates(temp_db, capsys):
+    from sqlalchemy import text
+
+    with temp_db.engine.begin() as connection:
+        connection.execute(text('DROP INDEX idx_movies_title_key'))
+        connection.execute(text(
+            "INSERT INTO movies (title, year, rating, image_link, title_key) "
+            "VALUES ('Scream', 1996, 7.4, 'N/A', 'scream'), "
+            "('SCREAM', 1996, 1.0, 'N/A', 'scream')"))
+        connection.execute(text(
+            'PRAGMA user_version = '
+            f'{temp_db.MIGRATIONS.index(temp_db._make_title_key_unique)}'))
+    temp_db.create_schema()
+
+    assert temp_db.list_movies() == {
+        'Scream': {'year': 1996, 'rating': 7.4, 'image_link': 'N/A'}}
+    assert temp_db.add_movies([movie('scream')], replace=False) == [SKIPPED]
+    # The dropped row is reported and can be recovered
+    assert "'SCREAM' (1996, rating 1.0) of 'Scream'" in capsys.readouterr().err
+    with temp_db.engine.connect() as connection:
+        assert connection.execute(text(
+            'SELECT title, rating, kept_title FROM dropped_duplicate_movies')).fetchall() \
+            == [('SCREAM', 1.0, 'Scream')]
+
+
+def test_current_schema_is_checked_without_ddl(temp_db):
+    from sqlalchemy import event
+
+    statements = []
+    event.listen(temp_db.engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    temp_db.create_schema()
+    assert statements == ['PRAGMA user_version']
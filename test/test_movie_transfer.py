@@ -0,0 +1,79 @@
+import io
+import json
+
+import pytest
+
+from storage_api import movie_query as query
+from storage_api import movie_transfer as transfer
+from storage_api.movie_record import Movie
+
+MOVIES = [Movie('Heat', 1995, 8.3, 'https://img.example/heat.jpg'),
+          Movie('Say "Anything", Again', 1989, 7.3),
+          Movie('Line\nBreak', 2001, 6.1),
+          Movie('Amélie', 2001, 8.3)]
+
+
+def catalog():
+    return [(m['title'], m['year'], m['rating'], m['image_link'])
+            for m in query.iter_movies()]
+
+
+@pytest.mark.parametrize('file_format', transfer.FORMATS)
+def test_round_trip(temp_db, file_format):
+    temp_db.add_movies(MOVIES)
+    expected = catalog()
+    dump = io.StringIO(newline='')
+    assert transfer.export_movies(dump, file_format, fetch_size=2) == len(MOVIES)
+
+    temp_db.delete_movies([movie.title for movie in MOVIES])
+    dump.seek(0)
+    report = transfer.import_movies(dump, file_format, chunk_rows=1, workers=2)
+    assert dict(report.outcomes) == {temp_db.ADDED: len(MOVIES)}
+    assert report.invalid == 0
+    assert catalog() == expected
+
+
+def test_invalid_records_are_skipped_and_reported(temp_db):
+    lines = io.StringIO(
+        'id,title,year,rating\n'
+        '1,Heat,1995,8.3\n'
+        '2,Upcoming,2027,N/A\n'
+        '3,"Two\nLines",1999,"7.5"\n'
+        '4,,2000,5\n')
+    report = transfer.import_movies(lines, 'csv', chunk_rows=2)
+    assert report.outcomes[temp_db.ADDED] == 2
+    assert report.errors == ["line 3: 'Upcoming' has no rating from 0 to 10 ('N/A')",
+                             'line 6: movie has no title']
+    assert temp_db.get_movie('two\nlines') == Movie('Two\nLines', 1999, 7.5)
+
+    report = transfer.import_movies(io.StringIO('{"title": "Heat"}\n[1]\n'), 'jsonl')
+    assert report.invalid == 2
+    with pytest.raises(ValueError, match='no rating'):
+        list(transfer.read_chunks(io.StringIO('title,year\n'), 'csv'))
+
+
+def test_json_object_is_decoded_incrementally():
+    movies = {f'Movie {i}': {'year': 2000 + i, 'rating': i / 2} for i in range(50)}
+    pairs = list(transfer.iter_json_object(io.StringIO(json.dumps(movies, indent=1)),
+                                           read_size=7))
+    assert pairs == list(movies.items())
+    assert list(transfer.iter_json_object(io.StringIO(' {} '))) == []
+    with pytest.raises(ValueError):
+        list(transfer.iter_json_object(io.StringIO('{"Heat": {"year": 1995}'), read_size=4))
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_invalid_ratings_skip_only_their_rows(temp_db, workers):
+    lines = io.StringIO('title,year,rating\n'
+                        'Heat,1995,8.3\n'
+                        'Bad,2001,nan\n'
+                        'Worse,2002,inf\n'
+                        'Negative,2003,-42\n'
+                        'Huge,2004,1e300\n'
+                        'Alien,1979,8.5\n')
+    report = transfer.import_movies(lines, 'csv', chunk_rows=10, workers=workers)
+    assert dict(report.outcomes) == {temp_db.ADDED: 2}
+    assert report.invalid == 4
+    assert [error.split(':')[0] for error in report.errors] == \
+        ['line 3', 'line 4', 'line 5', 'line 6']
+    assert [movie['title'] for movie in query.iter_movies()] == ['Heat', 'Alien']
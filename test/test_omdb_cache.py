@@ -0,0 +1,63 @@
+from movies_omdb_api.movie_omdb_api import build_query_params
+from movies_omdb_api.omdb_cache import ResponseCache, normalize_key
+
+MATRIX = {'Title': 'The Matrix', 'Year': '1999', 'imdbRating': '8.7',
+          'Poster': 'N/A', 'Response': 'True'}
+NOT_FOUND = {'Response': 'False', 'Error': 'Movie not found!'}
+
+
+def test_normalize_key_folds_case_and_whitespace():
+    assert normalize_key('  The   MATRIX ') == normalize_key('the matrix')
+    assert normalize_key('TT0133093') == 'i:tt0133093'
+    assert normalize_key('tt0133093') != normalize_key('tt 0133093')
+
+
+def test_cache_and_api_agree_on_imdb_ids():
+    for name in ('tt0133093', ' TT0133093 '):
+        assert normalize_key(name).startswith('i:')
+        assert build_query_params(name, 'key')['i'] == 'tt0133093'
+    assert 't' in build_query_params('tt 0133093', 'key')
+
+
+def test_cache_persists_between_instances(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    cache = ResponseCache(path)
+    cache.put('The Matrix', MATRIX)
+    cache.close()
+
+    cache = ResponseCache(path)
+    assert cache.get('the matrix') == MATRIX
+    assert cache.get('Gladiator') is None
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'evictions': 0, 'size': 1}
+
+
+def test_negative_entries_use_their_own_ttl(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite3'), ttl=100,
+                          negative_ttl=10)
+    clock = [1000.0]
+    monkeypatch.setattr('movies_omdb_api.omdb_cache.time.time', lambda: clock[0])
+    cache.put('The Matrix', MATRIX)
+    cache.put('No Such Movie', NOT_FOUND)
+
+    clock[0] += 50
+    assert cache.get('No Such Movie') is None
+    assert cache.get('The Matrix') == MATRIX
+    assert cache.purge_expired() == 1
+    assert len(cache) == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite3'), max_entries=2)
+    clock = [1000.0]
+    monkeypatch.setattr('movies_omdb_api.omdb_cache.time.time', lambda: clock[0])
+    for title in ('A', 'B'):
+        cache.put(title, dict(MATRIX, Title=title))
+        clock[0] += 1
+    cache.get('A')
+    clock[0] += 1
+    cache.put('C', dict(MATRIX, Title='C'))
+
+    assert cache.get('B') is None
+    assert cache.get('A')['Title'] == 'A'
+    assert cache.get('C')['Title'] == 'C'
+    assert cache.stats()['evictions'] == 1
@@ -0,0 +1,104 @@
+import io
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from website_generator import site_builder
+from website_generator.posters import PosterMirror
+
+
+def png(color):
+    Image = pytest.importorskip('PIL.Image')
+    buffer = io.BytesIO()
+    Image.new('RGB', (300, 450), color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class StubImageHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.calls.append(self.path)
+        if self.path not in self.server.images:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body, etag = self.server.images[self.path]
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def image_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubImageHandler)
+    red, blue = png('red'), png('blue')
+    server.images = {'/red.png': (red, '"r1"'), '/red-again.png': (red, '"r1"'),
+                     '/blue.png': (blue, '"b1"')}
+    server.calls = []
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_sync_deduplicates_and_only_fetches_new_urls(tmp_path, image_server):
+    url = image_server.url
+    mirror = PosterMirror(str(tmp_path), workers=4)
+    report = mirror.sync([f'{url}/red.png', f'{url}/red-again.png', 'N/A'])
+    assert report.downloaded == 2 and report.deduplicated == 1
+    red, red_again = mirror.index[f'{url}/red.png'], mirror.index[f'{url}/red-again.png']
+    assert red['poster'] == red_again['poster']
+    assert (tmp_path / red['poster']).read_bytes() == image_server.images['/red.png'][0]
+    assert (tmp_path / red['thumbnail']).exists()
+    mirror.close()
+
+    image_server.calls.clear()
+    mirror = PosterMirror(str(tmp_path))
+    report = mirror.sync([f'{url}/red.png', f'{url}/blue.png'])
+    assert image_server.calls == ['/blue.png']
+    assert report.skipped == 1 and report.downloaded == 1
+
+    image_server.images['/blue.png'] = (png('green'), '"b2"')
+    report = mirror.sync([f'{url}/red.png', f'{url}/blue.png'], refresh=True)
+    assert report.not_modified == 1 and report.downloaded == 1
+    assert (tmp_path / mirror.index[f'{url}/blue.png']['poster']).read_bytes() \
+        == image_server.images['/blue.png'][0]
+    mirror.close()
+
+
+def test_pages_link_to_mirrored_posters(tmp_path, temp_db, image_server):
+    template_path = tmp_path / 'template.html'
+    template_path.write_text('<ol>__TEMPLATE_MOVIE_GRID__</ol>')
+    temp_db.add_movies([
+        {'title': 'Mirrored', 'year': 2000, 'rating': 7.0,
+         'image_link': f'{image_server.url}/red.png'},
+        {'title': 'Broken', 'year': 2001, 'rating': 6.0,
+         'image_link': f'{image_server.url}/missing.png'},
+    ])
+    posters, report = site_builder.mirror_posters(str(tmp_path))
+    assert report.downloaded == 1 and len(report.failed) == 1
+    site_builder.build_site(str(tmp_path), str(template_path), workers=1,
+                            posters=posters)
+
+    entry = posters[f'{image_server.url}/red.png']
+    index = (tmp_path / 'index.html').read_text()
+    assert f'src="{entry["thumbnail"]}"' in index
+    assert f'src="{image_server.url}/missing.png"' in index
+    assert f'src="{entry["poster"]}"' in (tmp_path / 'movie-1.html').read_text()
@@ -0,0 +1,65 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from charts import rating_histogram
+from storage_api import movie_query as query
+
+
+def test_bin_ratings_matches_numpy_on_individual_ratings(temp_db):
+    ratings = [1.0, 2.5, 2.5, 7.4, 8.7, 8.7, 8.7, 10.0]
+    temp_db.add_movies({'title': f'Movie {i}', 'year': 2000, 'rating': rating,
+                        'image_link': 'N/A'} for i, rating in enumerate(ratings))
+    counts, edges = rating_histogram.bin_ratings(query.rating_stats()['histogram'], 4)
+    expected_counts, expected_edges = np.histogram(ratings, bins=4)
+    assert counts.tolist() == expected_counts.tolist()
+    assert edges == pytest.approx(expected_edges)
+
+
+def test_rendered_chart_is_cached_per_data_version(temp_db, tmp_path):
+    pytest.importorskip('matplotlib')
+    cache_dir = str(tmp_path / 'cache')
+    target = tmp_path / 'ratings.png'
+    assert rating_histogram.render_rating_histogram(str(target), cache_dir=cache_dir) is None
+
+    temp_db.add_movies([{'title': 'Scream', 'year': 1996, 'rating': 7.4,
+                         'image_link': 'N/A'}])
+    assert rating_histogram.render_rating_histogram(str(target), cache_dir=cache_dir) is False
+    assert target.read_bytes().startswith(b'\x89PNG')
+    assert rating_histogram.render_rating_histogram(str(target), cache_dir=cache_dir) is True
+
+    temp_db.update_ratings({'Scream': 8.0})
+    assert rating_histogram.render_rating_histogram(str(target), cache_dir=cache_dir) is False
+    assert len(list((tmp_path / 'cache').iterdir())) == 1
+
+
+def test_recreated_database_does_not_reuse_cached_charts(tmp_path, monkeypatch):
+    pytest.importorskip('matplotlib')
+    from storage_api import movie_storage_sql as storage
+
+    cache_dir = str(tmp_path / 'cache')
+    target = tmp_path / 'ratings.png'
+    url = f"sqlite:///{tmp_path / 'movies.sqlite3'}"
+    for rating in (7.4, 2.0):
+        # Same path and data_version, different movies
+        engine = storage.build_engine(url)
+        monkeypatch.setattr(storage, 'engine', engine)
+        storage.create_schema()
+        storage.add_movies([{'title': 'Scream', 'year': 1996, 'rating': rating,
+                             'image_link': 'N/A'}])
+        assert rating_histogram.render_rating_histogram(
+            str(target), cache_dir=cache_dir) is False
+        engine.dispose()
+        for path in tmp_path.glob('movies.sqlite3*'):
+            path.unlink()
+
+
+def test_menu_explains_missing_chart_dependencies(monkeypatch, capsys):
+    import movies
+
+    def render(filename):
+        raise ImportError("No module named 'matplotlib'")
+    monkeypatch.setattr(rating_histogram, 'render_rating_histogram', render)
+    monkeypatch.setattr('builtins.input', lambda prompt: 'ratings.png')
+    movies.create_rating_histogram()
+    assert 'pip install numpy matplotlib' in capsys.readouterr().out
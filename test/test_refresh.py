@@ -0,0 +1,115 @@
+import time
+
+import requests
+
+from movies_omdb_api.movie_omdb_api import build_query_params
+from movies_omdb_api.omdb_cache import ResponseCache
+from movies_omdb_api.refresh import refresh_ratings
+from storage_api import movie_changes
+from storage_api import movie_query as query
+from sqlalchemy import text
+
+
+class FakeOmdb:
+    def __init__(self, ratings, cache=None):
+        self.ratings = ratings
+        self.cache = cache
+        self.calls = []
+
+    def fetch_fresh(self, title, year=None):
+        self.calls.append(title)
+        rating = self.ratings.get(title)
+        if rating is None:
+            return {'Response': 'False', 'Error': 'Movie not found!'}
+        if rating == 'fail':
+            raise requests.exceptions.ConnectionError('down')
+        if isinstance(rating, tuple):
+            rating, year = rating
+        return {'Response': 'True', 'Title': title, 'Year': str(year),
+                'imdbRating': rating, 'imdbVotes': '1,234'}
+
+
+def seed(storage, fetched_at):
+    storage.add_movies([{'title': title, 'year': 2000, 'rating': 5.0, 'image_link': 'N/A'}
+                        for title in fetched_at])
+    with storage.get_engine().begin() as connection:
+        connection.execute(text("UPDATE movies SET fetched_at = :at WHERE title = :title"),
+                           [{'title': title, 'at': at} for title, at in fetched_at.items()])
+
+
+def test_refresh_updates_the_stalest_movies_within_budget(temp_db):
+    now = time.time()
+    seed(temp_db, {'Fresh': now, 'Old': now - 30 * 86400, 'Older': now - 60 * 86400,
+                   'Never': None})
+    cursor = movie_changes.latest_cursor()
+    omdb = FakeOmdb({'Old': '5.0', 'Older': '7.5', 'Never': '8.1'})
+
+    report = refresh_ratings(budget=2, fetcher=omdb, workers=2)
+    assert omdb.calls == ['Never', 'Older']
+    assert (report.requests, report.changed) == (2, 2)
+    assert temp_db.get_movie('Never')['rating'] == 8.1
+
+    # Resuming skips what was refreshed; an unchanged rating is not a change
+    report = refresh_ratings(budget=10, fetcher=omdb, workers=2)
+    assert omdb.calls[2:] == ['Old']
+    assert report.changed == 0
+    assert sorted(c['title'] for c in movie_changes.changes_since(cursor)) == ['Never', 'Older']
+    assert query.stale_movies(now - 7 * 86400) == []
+
+
+def test_refresh_uses_cached_responses_and_skips_failures(temp_db):
+    seed(temp_db, {'Cached': None, 'Broken': None, 'Gone': None, 'Fine': None})
+    cache = ResponseCache(':memory:')
+    cache.put('Cached', {'Response': 'True', 'imdbRating': '6.6', 'imdbVotes': 'N/A'}, 2000)
+    cache.put('Cached', {'Response': 'True', 'imdbRating': '1.0', 'imdbVotes': 'N/A'})
+    omdb = FakeOmdb({'Broken': 'fail', 'Fine': '9.0'}, cache=cache)
+
+    report = refresh_ratings(budget=3, fetcher=omdb, workers=1, batch_size=1)
+    assert sorted(omdb.calls) == ['Broken', 'Fine', 'Gone']
+    assert (report.cached, report.not_found, len(report.failed)) == (1, 1, 1)
+    # A miss is looked up once, not again by the fetch
+    assert cache.misses == 3
+    assert temp_db.get_movie('Cached')['rating'] == 6.6
+    assert [m['title'] for m in query.stale_movies(time.time() - 60)] == ['Broken']
+
+
+def test_refresh_ignores_a_film_of_another_year(temp_db):
+    seed(temp_db, {'Remade': None, 'Kept': None})
+    omdb = FakeOmdb({'Remade': ('9.9', 2019), 'Kept': '6.0'})
+
+    report = refresh_ratings(fetcher=omdb, workers=1)
+    assert (report.checked, report.changed, report.not_found) == (2, 1, 1)
+    assert temp_db.get_movie('Remade')['rating'] == 5.0
+    assert temp_db.get_movie('Kept')['rating'] == 6.0
+
+
+def test_lookups_by_title_are_qualified_by_year():
+    assert build_query_params('Dune', 'key', 1984)['y'] == 1984
+    assert 'y' not in build_query_params('Dune', 'key')
+    cache = ResponseCache(':memory:')
+    cache.put('Dune', {'Response': 'True', 'Year': '1984'}, 1984)
+    assert cache.get('dune', year=1984) == {'Response': 'True', 'Year': '1984'}
+    assert cache.get('Dune', year=2021) is None
+    assert cache.get('Dune') is None
+
+
+def test_movies_added_from_omdb_are_not_stale(temp_db):
+    temp_db.add_movies([{'title': 'Fetched', 'year': 2000, 'rating': 5.0,
+                         'image_link': 'N/A'}], fetched_at=time.time())
+    temp_db.add_movies([{'title': 'Typed', 'year': 2000, 'rating': 5.0,
+                         'image_link': 'N/A'}])
+    assert [m['title'] for m in query.stale_movies(time.time() - 60)] == ['Typed']
+
+
+def test_cached_responses_keep_their_fetch_time(temp_db):
+    seed(temp_db, {'Cached': None})
+    cache = ResponseCache(':memory:')
+    cache.put('Cached', {'Response': 'True', 'imdbRating': '6.6', 'imdbVotes': 'N/A'}, 2000)
+    stored_at = time.time() - 5 * 86400
+    cache._connection.execute('UPDATE responses SET stored_at = ?', (stored_at,))
+
+    refresh_ratings(max_age=7 * 86400, fetcher=FakeOmdb({}, cache=cache))
+    with temp_db.get_engine().connect() as connection:
+        assert connection.execute(text('SELECT fetched_at FROM movies')).scalar() == stored_at
+    # Stale again once the response itself is older than max_age
+    assert [m['title'] for m in query.stale_movies(time.time() - 3 * 86400)] == ['Cached']
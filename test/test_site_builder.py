@@ -0,0 +1,120 @@
+import os
+
+import pytest
+
+from website_generator import site_builder
+from website_generator.template import compile_template
+
+TEMPLATE = ('<html><body><ol>__TEMPLATE_MOVIE_GRID__</ol>'
+            '__TEMPLATE_PAGINATION__</body></html>')
+
+
+@pytest.fixture
+def site(tmp_path, temp_db):
+    template_path = tmp_path / 'template.html'
+    template_path.write_text(TEMPLATE)
+    output_dir = tmp_path / 'site'
+    output_dir.mkdir()
+
+    def build(per_page=2, workers=1):
+        return site_builder.build_site(str(output_dir), str(template_path),
+                                       per_page=per_page, workers=workers)
+    build.output_dir = output_dir
+    return build
+
+
+def add(storage, *movies):
+    storage.add_movies({'title': title, 'year': year, 'rating': rating,
+                        'image_link': 'N/A'} for title, year, rating in movies)
+
+
+def listing_pages(names):
+    return sorted(name for name in names if not name.startswith('movie-'))
+
+
+def test_compiled_template_streams_slots():
+    render = compile_template('<p>__TEMPLATE_A__|__TEMPLATE_B__|__TEMPLATE_C__</p>')
+    assert render.slots == ('a', 'b', 'c')
+    assert ''.join(render(a='x', b=(part for part in ['y', 'z']))) == '<p>x|yz|</p>'
+
+
+def test_build_writes_paginated_index_and_detail_pages(site, temp_db):
+    add(temp_db, ('The Matrix', 1999, 8.7), ('Gladiator', 2000, 8.5),
+        ('Scream', 1996, 7.4))
+    report = site()
+
+    assert listing_pages(report.written) == sorted([
+        'index.html', 'page-2.html', 'years.html', 'year-1996.html',
+        'year-1999.html', 'year-2000.html', 'ratings.html', 'rating-8.html',
+        'rating-7.html'])
+    assert len(report.written) == 12
+    assert set(report.page_times) == set(report.written)
+    index = (site.output_dir / 'index.html').read_text()
+    assert 'The Matrix' in index and 'Gladiator' in index
+    assert 'Scream' not in index
+    assert 'href="page-2.html">Next' in index
+    assert 'href="year-1999.html">1999 (1)' in (site.output_dir / 'years.html').read_text()
+    assert 'Rated 8.7' in (site.output_dir / 'movie-1.html').read_text()
+
+
+def test_titles_and_poster_links_are_escaped(site, temp_db):
+    temp_db.add_movies([{'title': '<script>alert(1)</script>', 'year': 2000,
+                         'rating': 5.0, 'image_link': 'x" onerror="alert(1)'}])
+    site()
+    index = (site.output_dir / 'index.html').read_text()
+    assert '<script>' not in index
+    assert '&lt;script&gt;' in index
+    assert 'src="x&quot; onerror=&quot;alert(1)"' in index
+
+
+def test_rebuild_only_rewrites_changed_pages(site, temp_db):
+    add(temp_db, ('The Matrix', 1999, 8.7), ('Gladiator', 2000, 8.5),
+        ('Scream', 1996, 7.4))
+    site()
+    mtime = os.stat(site.output_dir / 'index.html').st_mtime_ns
+
+    temp_db.update_ratings([('Scream', 7.9)])
+    assert site().written == ['movie-3.html']
+
+    temp_db.update_ratings([('Scream', 8.0)])
+    report = site()
+    assert listing_pages(report.written) == [
+        'rating-8-page-2.html', 'rating-8.html', 'ratings.html']
+    assert report.removed == ['rating-7.html']
+    assert os.stat(site.output_dir / 'index.html').st_mtime_ns == mtime
+
+    temp_db.delete_movies(['Scream'])
+    report = site()
+    assert sorted(report.removed) == ['movie-3.html', 'page-2.html',
+                                      'rating-8-page-2.html', 'year-1996.html']
+    assert not (site.output_dir / 'page-2.html').exists()
+
+
+def test_unchanged_pages_are_not_written(site, temp_db, monkeypatch):
+    add(temp_db, ('The Matrix', 1999, 8.7), ('Gladiator', 2000, 8.5))
+    site()
+    opened = []
+
+    def spy(path, *args, **kwargs):
+        opened.append(os.path.basename(path))
+        return open(path, *args, **kwargs)
+    monkeypatch.setattr(site_builder, 'open', spy, raising=False)
+
+    temp_db.update_ratings([('Gladiator', 8.0)])
+    site()
+    assert [name for name in opened if name.endswith('.html.tmp')] == ['movie-2.html.tmp']
+
+
+def test_process_pool_build_matches_in_process_build(site, temp_db, monkeypatch):
+    add(temp_db, *((f'Movie {i}', 1990 + i % 7, 1 + i % 9) for i in range(40)))
+    site(workers=1)
+    pages = {path.name: path.read_bytes() for path in site.output_dir.iterdir()}
+    for path in site.output_dir.glob('*.html'):
+        path.unlink()
+
+    monkeypatch.setattr(site_builder, 'MIN_TASKS_FOR_POOL', 0)
+    report = site(workers=2)
+
+    assert report.unchanged == 0
+    assert {path.name: path.read_bytes()
+            for path in site.output_dir.iterdir()} == pages
@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+
+# Cumulative time allowed for `import movies`, which only sets up the
+# menu; it is a few milliseconds when no subsystem is loaded eagerly
+STARTUP_BUDGET_MS = 100
+
+HEAVY_MODULES = ['sqlalchemy', 'requests', 'dotenv', 'numpy', 'matplotlib']
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(code, tmp_path):
+    env = dict(os.environ, MOVIES_DB_URL=f"sqlite:///{tmp_path / 'movies.sqlite3'}")
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            cwd=ROOT, env=env, capture_output=True, text=True,
+                            check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative) / 1000
+    return times
+
+
+def test_cli_startup_loads_no_subsystem(tmp_path):
+    # Best of three runs, to keep a busy machine from failing the budget
+    runs = [import_times('import movies', tmp_path) for _ in range(3)]
+    assert not [name for name in runs[0] if name.split('.')[0] in HEAVY_MODULES]
+    assert min(times['movies'] for times in runs) < STARTUP_BUDGET_MS
+    assert not (tmp_path / 'movies.sqlite3').exists()
+
+
+def test_storage_connects_on_first_use(tmp_path):
+    import_times('from storage_api import movie_storage_sql', tmp_path)
+    assert not (tmp_path / 'movies.sqlite3').exists()
+    import_times('from storage_api import movie_query; movie_query.count_movies()',
+                 tmp_path)
+    assert (tmp_path / 'movies.sqlite3').exists()
@@ -0,0 +1,111 @@
+import asyncio
+import http.client
+import json
+import threading
+
+import pytest
+
+from web_api import server as web_server
+from web_api.server import CatalogServer
+
+
+@pytest.fixture
+def api(temp_db):
+    temp_db.add_movies({'title': title, 'year': year, 'rating': rating,
+                        'image_link': 'N/A'}
+                       for title, year, rating in [('The Matrix', 1999, 8.7),
+                                                   ('Gladiator', 2000, 8.5),
+                                                   ('Scream', 1996, 7.4)])
+    loop = asyncio.new_event_loop()
+    server = CatalogServer(cache_size=8, threads=2)
+    listener = loop.run_until_complete(server.start('127.0.0.1', 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    connection = http.client.HTTPConnection('127.0.0.1',
+                                            listener.sockets[0].getsockname()[1])
+
+    def get(path, headers=None):
+        connection.request('GET', path, headers=headers or {})
+        response = connection.getresponse()
+        body = response.read()
+        return response.status, response.headers, json.loads(body) if body else None
+    get.server = server
+    get.server_port = listener.sockets[0].getsockname()[1]
+    yield get
+    connection.close()
+
+    async def shutdown():
+        listener.close()
+        # Let the connection handlers see the closed socket and finish
+        others = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        if others:
+            await asyncio.wait(others, timeout=5)
+
+    asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+    server.close()
+
+
+def test_keyset_pagination_over_keep_alive(api):
+    status, _, page = api('/movies?sort=rating&desc=1&limit=2')
+    assert status == 200
+    assert [m['title'] for m in page['movies']] == ['The Matrix', 'Gladiator']
+    _, _, page = api(f"/movies?sort=rating&desc=1&limit=2&after={page['next']}")
+    assert [m['title'] for m in page['movies']] == ['Scream']
+    assert page['next'] is None
+
+    assert api('/movies/2')[2]['title'] == 'Gladiator'
+    assert api('/movies/99')[0] == 404
+    assert api('/movies?after=garbage')[0] == 400
+    assert api('/search?q=matr')[2]['movies'][0]['title'] == 'The Matrix'
+    assert api('/stats')[2]['median'] == 8.5
+
+
+def test_etags_and_cache_follow_writes(api, temp_db):
+    status, headers, _ = api('/stats')
+    etag = headers['ETag']
+    status, headers, body = api('/stats', {'If-None-Match': etag})
+    assert status == 304 and body is None
+    assert api.server.cache.hits == 1
+
+    temp_db.update_ratings({'Scream': 1.0})
+    status, headers, body = api('/stats', {'If-None-Match': etag})
+    assert status == 200 and headers['ETag'] != etag
+    assert body['worst']['title'] == 'Scream'
+
+
+@pytest.mark.parametrize('length', ['abc', '-5', '1.5'])
+def test_invalid_content_length_is_a_bad_request(api, length):
+    port = api.server_port
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    connection.putrequest('GET', '/stats')
+    connection.putheader('Content-Length', length)
+    connection.endheaders()
+    response = connection.getresponse()
+    assert response.status == 400
+    assert json.loads(response.read()) == {'error': 'invalid Content-Length'}
+    assert response.getheader('Connection') == 'close'
+    connection.close()
+    # The server keeps serving other connections
+    assert api('/stats')[0] == 200
+
+
+def test_cache_keys_do_not_alias_escaped_params(api):
+    # Decoded, the first query looks like the second one joined back together
+    status, _, body = api('/movies?min_rating=8%26sort%3Drating')
+    assert status == 400 and body == {'error': 'min_rating must be a number'}
+    status, _, body = api('/movies?min_rating=8&sort=rating')
+    assert status == 200
+    assert [m['title'] for m in body['movies']] == ['Gladiator', 'The Matrix']
+
+
+def test_internal_errors_are_not_sent_to_the_client(api, monkeypatch, capsys):
+    def broken(path, params):
+        raise RuntimeError('database password is hunter2')
+    monkeypatch.setattr(web_server, 'route', broken)
+
+    status, _, body = api('/stats')
+    assert status == 500 and body == {'error': 'internal server error'}
+    assert 'hunter2' in capsys.readouterr().err
@@ -0,0 +1,342 @@
+"""
+Read-only JSON API over the movie catalog, served with asyncio.
+
+Endpoints (all GET):
+    /movies          list and filter movies, keyset paginated
+    /movies/<id>     one movie
+    /search?q=...    ranked title search
+    /stats           rating statistics
+
+/movies takes sort (id, title, rating, year), desc=1, limit, min_rating,
+max_rating, start_year, end_year and title filters. Its response holds a
+'next' cursor; pass it back as after=<cursor> for the following page.
+
+Queries run on a small thread pool so the event loop keeps serving
+connections while SQLite works. Responses are kept in an LRU cache tagged
+with storage.data_version(): the first request after any write, by this
+process or another one, finds a new version and drops the cache. Every
+response carries an ETag, and a request whose If-None-Match still matches
+a cached response is answered with 304 without running its query.
+
+Usage:
+    python -m web_api.server --port 8000
+"""
+import argparse
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+from instrumentation import metrics
+from storage_api import movie_query as query
+from storage_api import movie_search as search
+from storage_api import movie_storage_sql as storage
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+CACHE_SIZE = 1024
+QUERY_THREADS = 4
+MAX_HEADER_LINES = 100
+
+REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+def _content_length(headers):
+    """Return the Content-Length of a request, 0 without one, None when invalid."""
+    value = headers.get('content-length', '0').strip() or '0'
+    if not value.isdigit() or not value.isascii():
+        return None
+    return int(value)
+
+
+class HTTPError(Exception):
+    """An error answered with the given status and message."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def encode_cursor(cursor):
+    """Turn a page_cursor() tuple into an opaque URL-safe string."""
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode().rstrip('=')
+
+
+def decode_cursor(value):
+    try:
+        padded = value + '=' * (-len(value) % 4)
+        sort_value, movie_id = json.loads(base64.urlsafe_b64decode(padded))
+        return sort_value, int(movie_id)
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPError(400, 'invalid cursor') from None
+
+
+def _number(params, name, kind):
+    if name not in params:
+        return None
+    try:
+        return kind(params[name])
+    except ValueError:
+        raise HTTPError(400, f'{name} must be a number') from None
+
+
+def _public(movie):
+    return {key: movie[key] for key in ('id', 'title', 'year', 'rating', 'image_link')}
+
+
+def list_movies(params):
+    order_by = params.get('sort', 'id')
+    if order_by not in query.SORT_COLUMNS:
+        raise HTTPError(400, f'sort must be one of {", ".join(query.SORT_COLUMNS)}')
+    descending = params.get('desc', '0') not in ('0', 'false', '')
+    limit = _number(params, 'limit', int) or DEFAULT_PAGE_SIZE
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    after = decode_cursor(params['after']) if 'after' in params else None
+    movies = query.query_movies(
+        min_rating=_number(params, 'min_rating', float),
+        max_rating=_number(params, 'max_rating', float),
+        start_year=_number(params, 'start_year', int),
+        end_year=_number(params, 'end_year', int),
+        title_contains=params.get('title'),
+        order_by=order_by, descending=descending, limit=limit, after=after)
+    next_cursor = None
+    if len(movies) == limit:
+        next_cursor = encode_cursor(query.page_cursor(movies[-1], order_by))
+    return {'movies': [_public(movie) for movie in movies], 'next': next_cursor}
+
+
+def get_movie(movie_id):
+    movie = query.movie_by_id(movie_id)
+    if movie is None:
+        raise HTTPError(404, 'no such movie')
+    return _public(movie)
+
+
+def search_titles(params):
+    term = params.get('q', '').strip()
+    if not term:
+        raise HTTPError(400, 'q is required')
+    limit = max(1, min(_number(params, 'limit', int) or search.DEFAULT_LIMIT,
+                       MAX_PAGE_SIZE))
+    return {'movies': [_public(movie) for movie in search.search_movies(term, limit)]}
+
+
+def rating_stats(params):
+    summary = query.rating_stats()
+    if summary is None:
+        return {'count': 0}
+    # JSON object keys must be strings
+    summary['quantiles'] = {str(q): value for q, value in summary['quantiles'].items()}
+    return summary
+
+
+ROUTES = {
+    '/movies': list_movies,
+    '/search': search_titles,
+    '/stats': rating_stats,
+}
+
+
+def route(path, params):
+    """Run the endpoint for a path and return its JSON-serializable result."""
+    if path in ROUTES:
+        return ROUTES[path](params)
+    prefix, _, movie_id = path.rpartition('/')
+    if prefix == '/movies' and movie_id.isdigit():
+        return get_movie(int(movie_id))
+    raise HTTPError(404, 'not found')
+
+
+class LRUResponseCache:
+    """
+    Rendered responses by (path, sorted decoded params), valid for one
+    data version.
+
+    Args:
+        max_entries (int): Responses kept before the least recently used
+            one is dropped.
+    """
+
+    def __init__(self, max_entries=CACHE_SIZE):
+        self.max_entries = max_entries
+        self.version = None
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        """Return the cached (status, etag, body) for key at version, or None."""
+        if version != self.version:
+            # The catalog changed since these responses were rendered
+            self.entries.clear()
+            self.version = version
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            metrics.count('api_cache.misses')
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        metrics.count('api_cache.hits')
+        return entry
+
+    def put(self, key, version, entry):
+        if version != self.version:
+            return
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+class CatalogServer:
+    """
+    asyncio HTTP/1.1 server for the catalog API, with keep-alive.
+
+    Args:
+        cache_size (int): Responses kept in the LRU cache.
+        threads (int): Threads running database queries.
+    """
+
+    def __init__(self, cache_size=CACHE_SIZE, threads=QUERY_THREADS):
+        self.cache = LRUResponseCache(cache_size)
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor,
+                                                                function, *args)
+
+    def _render(self, path, params):
+        endpoint = path if path in ROUTES else '/movies/<id>'
+        with metrics.span('api.' + endpoint):
+            try:
+                status, payload = 200, route(path, params)
+            except HTTPError as e:
+                status, payload = e.status, {'error': str(e)}
+            body = json.dumps(payload).encode()
+        return status, '"' + hashlib.sha1(body).hexdigest() + '"', body
+
+    async def respond(self, method, target, headers):
+        """
+        Answer one request.
+
+        Returns:
+            tuple: (status, extra headers, body bytes).
+        """
+        if method not in ('GET', 'HEAD'):
+            return 405, {'Allow': 'GET, HEAD'}, b'{"error": "method not allowed"}'
+        url = urlsplit(target)
+        params = dict(parse_qsl(url.query))
+        # The decoded params themselves, not a query string rebuilt from
+        # them: '&' or '=' inside a value must not alias another request
+        key = (url.path, tuple(sorted(params.items())))
+        version = await self._run(storage.data_version)
+        cached = self.cache.get(key, version)
+        if cached is None:
+            cached = await self._run(self._render, url.path, params)
+            self.cache.put(key, version, cached)
+        status, etag, body = cached
+        if status == 200 and etag in headers.get('if-none-match', '').replace(' ', '').split(','):
+            return 304, {'ETag': etag}, b''
+        return status, {'ETag': etag} if status == 200 else {}, body
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+                headers = {}
+                for _ in range(MAX_HEADER_LINES):
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = _content_length(headers)
+                if length:
+                    await reader.readexactly(length)
+
+                if length is None:
+                    # Without a valid length the body can't be skipped to
+                    # reach the next request: answer and close
+                    status, extra, body = 400, {}, b'{"error": "invalid Content-Length"}'
+                else:
+                    try:
+                        status, extra, body = await self.respond(method, target, headers)
+                    except Exception:  # keep serving other requests
+                        # The details are for the server log, not the client
+                        traceback.print_exc()
+                        status, extra, body = 500, {}, b'{"error": "internal server error"}'
+                keep_alive = (headers.get('connection', '').lower() != 'close'
+                              and version == 'HTTP/1.1' and length is not None)
+                head = [f'HTTP/1.1 {status} {REASONS[status]}',
+                        'Content-Type: application/json',
+                        f'Content-Length: {len(body)}',
+                        'Cache-Control: no-cache',
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+                head += [f'{name}: {value}' for name, value in extra.items()]
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+                if method != 'HEAD':
+                    writer.write(body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=8000):
+        """Start listening and return the asyncio.Server."""
+        # Open the database and migrate it before the first request
+        await self._run(storage.get_engine)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+async def serve(host, port, cache_size=CACHE_SIZE, threads=QUERY_THREADS):
+    server = CatalogServer(cache_size, threads)
+    listener = await server.start(host, port)
+    print(f'Serving the movie API on http://{host}:{listener.sockets[0].getsockname()[1]}',
+          flush=True)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE,
+                        help='responses kept in the LRU cache')
+    parser.add_argument('--threads', type=int, default=QUERY_THREADS,
+                        help='threads running database queries')
+    parser.add_argument('--metrics', action='store_true',
+                        help='print timing spans and counters on shutdown')
+    args = parser.parse_args(argv)
+    if args.metrics:
+        metrics.enable(summary_at_exit=True)
+    try:
+        asyncio.run(serve(args.host, args.port, args.cache_size, args.threads))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""
+Local mirror of the poster images OMDb links to.
+
+Posters are downloaded concurrently over one pooled keep-alive session and
+stored content-addressed under static/posters/, so the same image behind
+several URLs is kept once and every file name changes with its content
+(which makes the paths safe to cache forever). A thumbnail sized for the
+movie grid is generated next to each poster when Pillow is installed.
+
+An index maps every poster URL to its stored file together with the
+ETag/Last-Modified validators it was served with. Later runs only fetch
+URLs missing from the index; with refresh=True known URLs are revalidated
+with conditional requests and only changed posters are downloaded again.
+"""
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+POSTERS_DIR = 'posters'
+INDEX_NAME = 'index.json'
+THUMBNAIL_SIZE = (128, 193)
+CONTENT_TYPE_EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+}
+
+
+def is_remote(image_link):
+    return isinstance(image_link, str) and image_link.startswith(('http://', 'https://'))
+
+
+def _extension(image_link, content_type):
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in CONTENT_TYPE_EXTENSIONS:
+        return CONTENT_TYPE_EXTENSIONS[content_type]
+    extension = os.path.splitext(urlsplit(image_link).path)[1].lower()
+    return extension if extension in mimetypes.types_map else '.img'
+
+
+def _make_thumbnail(source, target, size):
+    """Write a thumbnail of source to target. Returns False without Pillow."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return False
+    with Image.open(source) as image:
+        image.thumbnail(size)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.save(target + '.tmp', format='JPEG', quality=85)
+    os.replace(target + '.tmp', target)
+    return True
+
+
+class PosterSyncReport:
+    """Counters collected during a poster sync."""
+
+    def __init__(self):
+        self.downloaded = 0
+        self.deduplicated = 0
+        self.not_modified = 0
+        self.skipped = 0
+        self.failed = []
+        self.elapsed = 0.0
+
+    def __str__(self):
+        return (f'{self.downloaded} posters downloaded ({self.deduplicated} duplicates), '
+                f'{self.not_modified} not modified, {self.skipped} already mirrored, '
+                f'{len(self.failed)} failed in {self.elapsed:.1f}s')
+
+
+class PosterMirror:
+    """
+    Content-addressed poster store inside the website's output directory.
+
+    Args:
+        output_dir (str): Website output directory; posters go to its
+            posters/ subdirectory.
+        workers (int): Concurrent downloads, and size of the connection pool.
+        timeout (float): Per-request timeout in seconds.
+        thumbnail_size (tuple): Maximum (width, height) of thumbnails.
+        session (requests.Session, optional): Session to download with.
+    """
+
+    def __init__(self, output_dir='static', workers=8, timeout=10,
+                 thumbnail_size=THUMBNAIL_SIZE, session=None):
+        self.output_dir = output_dir
+        self.root = os.path.join(output_dir, POSTERS_DIR)
+        self.workers = workers
+        self.timeout = timeout
+        self.thumbnail_size = thumbnail_size
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+        self.index = self._load_index()
+        # Downloads run concurrently; storing is serialized so two URLs
+        # serving the same image don't write the same files at once
+        self._store_lock = threading.Lock()
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.root, INDEX_NAME), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self):
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, INDEX_NAME)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, indent=1, sort_keys=True)
+        os.replace(path + '.tmp', path)
+
+    def _relative(self, *parts):
+        return '/'.join((POSTERS_DIR,) + parts)
+
+    def _fetch(self, image_link, entry):
+        """
+        Download one poster, revalidating it if it was mirrored before.
+
+        Returns:
+            tuple: (status, entry) where status is 'downloaded',
+            'duplicate' or 'not_modified'.
+        """
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        res = self.session.get(image_link, headers=headers, timeout=self.timeout)
+        if res.status_code == 304 and entry:
+            return 'not_modified', entry
+        res.raise_for_status()
+
+        content = res.content
+        digest = hashlib.sha256(content).hexdigest()
+        extension = _extension(image_link, res.headers.get('Content-Type'))
+        with self._store_lock:
+            return self._store(content, digest, extension, res.headers)
+
+    def _store(self, content, digest, extension, headers):
+        directory = os.path.join(self.root, digest[:2])
+        path = os.path.join(directory, digest + extension)
+        status = 'duplicate' if os.path.exists(path) else 'downloaded'
+        if status == 'downloaded':
+            os.makedirs(directory, exist_ok=True)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(content)
+            os.replace(path + '.tmp', path)
+
+        new_entry = {
+            'poster': self._relative(digest[:2], digest + extension),
+            'thumbnail': None,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+        }
+        width, height = self.thumbnail_size
+        thumb_name = f'{digest}-{width}x{height}.jpg'
+        thumb_path = os.path.join(self.root, 'thumbs', thumb_name)
+        if os.path.exists(thumb_path):
+            new_entry['thumbnail'] = self._relative('thumbs', thumb_name)
+        else:
+            os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+            try:
+                if _make_thumbnail(path, thumb_path, self.thumbnail_size):
+                    new_entry['thumbnail'] = self._relative('thumbs', thumb_name)
+            except OSError:
+                # Not an image Pillow can read; the page uses the full poster
+                pass
+        return status, new_entry
+
+    def sync(self, image_links, refresh=False):
+        """
+        Mirror the given poster URLs.
+
+        Args:
+            image_links (iterable of str): Poster URLs; values that aren't
+                http(s) URLs, such as OMDb's 'N/A', are ignored.
+            refresh (bool): Revalidate posters that were mirrored before.
+
+        Returns:
+            PosterSyncReport: What the sync did.
+        """
+        start = time.perf_counter()
+        report = PosterSyncReport()
+        todo = []
+        for image_link in dict.fromkeys(image_links):
+            if not is_remote(image_link):
+                continue
+            if image_link in self.index and not refresh:
+                report.skipped += 1
+            else:
+                todo.append(image_link)
+
+        def fetch(image_link):
+            try:
+                return image_link, self._fetch(image_link, self.index.get(image_link)), None
+            except (requests.exceptions.RequestException, OSError) as e:
+                return image_link, None, e
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for image_link, result, error in executor.map(fetch, todo):
+                if error is not None:
+                    report.failed.append((image_link, str(error)))
+                    continue
+                status, entry = result
+                self.index[image_link] = entry
+                if status == 'not_modified':
+                    report.not_modified += 1
+                else:
+                    report.downloaded += 1
+                    report.deduplicated += status == 'duplicate'
+        self._save_index()
+        report.elapsed = time.perf_counter() - start
+        return report
+
+    def close(self):
+        self.session.close()
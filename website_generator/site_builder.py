@@ -0,0 +1,368 @@
+"""
+Streaming, incremental, parallel static site generator.
+
+The catalog is split into numbered listing pages, per-year and per-rating
+listings with their index pages, and one detail page per movie. Each page
+is an independent task: listings are cut into pages up front with keyset
+cursors, so a worker can fetch and render any page on its own. Tasks are
+sharded across a process pool; every worker streams its movies from the
+database through the compiled page template into memory (a page holds at
+most one listing page of movies) and hashes it.
+
+Posters mirrored by website_generator.posters are linked from their local,
+content-addressed copies.
+
+A manifest of content hashes from the previous build, handed to every
+worker, decides which pages are written: a page whose hash is unchanged
+is never opened, so it keeps its file (and mtime) untouched and costs no
+disk write.
+
+Usage:
+    python -m website_generator.site_builder --workers 4 --timings --mirror-posters
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from instrumentation import metrics
+from storage_api import movie_query as query
+from storage_api import movie_storage_sql as storage
+from website_generator.posters import PosterMirror
+from website_generator.template import escape, load_template
+
+STATIC_DIR = 'static'
+TEMPLATE_PATH = os.path.join(STATIC_DIR, 'index_template.html')
+MANIFEST_NAME = '.site_manifest.json'
+MOVIES_PER_PAGE = 100
+
+# Movie detail pages rendered by one task
+DETAILS_PER_TASK = 200
+
+# Below this many tasks a process pool costs more than it saves
+MIN_TASKS_FOR_POOL = 32
+
+# Mirrored posters by original URL, as in PosterMirror.index
+_posters = {}
+# Content hashes of the previous build by page name, as in the manifest
+_previous = {}
+
+
+def page_name(prefix, number):
+    """Return the file name of a listing page, e.g. 'year-1999-page-2.html'."""
+    if prefix == 'index':
+        return 'index.html' if number == 1 else f'page-{number}.html'
+    return f'{prefix}.html' if number == 1 else f'{prefix}-page-{number}.html'
+
+
+def detail_page_name(movie):
+    """Return the file name of a movie's detail page."""
+    return f'movie-{movie["id"]}.html'
+
+
+def poster_src(image_link, thumbnail=False):
+    """Return the local mirror of a poster if there is one, else its URL."""
+    entry = _posters.get(image_link)
+    if entry is None:
+        return image_link
+    return (thumbnail and entry.get('thumbnail')) or entry['poster']
+
+
+def serialize_movie(movie):
+    """ Yields the HTML of one movie's grid item """
+    yield '<li>\n'
+    yield '<div class ="movie" >\n'
+    yield f'<a href="{detail_page_name(movie)}">'
+    yield f'<img class ="movie-poster" src="{escape(poster_src(movie["image_link"], True))}"/></a>\n'
+    yield f'<div class ="movie-title"> {escape(movie["title"])}</div>\n'
+    yield f'<div class ="movie-year"> {escape(movie["year"])} </div>\n'
+    yield '</div>\n'
+    yield '</li>\n'
+
+
+def serialize_movie_details(movie):
+    """ Yields the HTML of a movie's detail page body """
+    yield '<li>\n'
+    yield '<div class ="movie movie-details" >\n'
+    yield f'<img class ="movie-poster" src="{escape(poster_src(movie["image_link"]))}"/>\n'
+    yield f'<div class ="movie-title"> {escape(movie["title"])}</div>\n'
+    yield f'<div class ="movie-year"> {escape(movie["year"])} </div>\n'
+    yield f'<div class ="movie-rating"> Rated {escape(movie["rating"])} </div>\n'
+    yield '</div>\n'
+    yield '</li>\n'
+
+
+def serialize_link(href, label):
+    """ Yields the HTML of one entry on an index page """
+    yield f'<li class="index-link"><a href="{escape(href)}">{escape(label)}</a></li>\n'
+
+
+def serialize_pagination(heading, prefix=None, number=1, pages=1):
+    """ Yields the navigation shown under the grid """
+    yield '<nav class="pagination">\n'
+    yield ('<p><a href="index.html">All movies</a><a href="years.html">By year</a>'
+           '<a href="ratings.html">By rating</a></p>\n')
+    yield f'<p>{escape(heading)}'
+    if pages > 1:
+        yield f' &middot; page {number} of {pages}'
+    yield '</p>\n<p>'
+    if number > 1:
+        yield f'<a href="{page_name(prefix, number - 1)}">Previous</a>'
+    if number < pages:
+        yield f'<a href="{page_name(prefix, number + 1)}">Next</a>'
+    yield '</p>\n</nav>\n'
+
+
+class BuildReport:
+    """Counters and render timings collected during a site build."""
+
+    def __init__(self):
+        self.written = []
+        self.unchanged = 0
+        self.removed = []
+        self.page_times = {}
+        self.elapsed = 0.0
+
+    def slowest(self, count=5):
+        """Return the (page, seconds) pairs that took longest to render."""
+        return sorted(self.page_times.items(), key=lambda item: item[1],
+                      reverse=True)[:count]
+
+    def __str__(self):
+        render_time = sum(self.page_times.values())
+        return (f'{len(self.written)} pages written, {self.unchanged} unchanged, '
+                f'{len(self.removed)} removed in {self.elapsed:.2f}s; '
+                f'{render_time:.2f}s spent rendering {len(self.page_times)} pages')
+
+
+def listing_tasks(prefix, heading, per_page, order_by='id', descending=False,
+                  **filters):
+    """ Yields one render task per page of a listing """
+    cursors = query.page_cursors(per_page, order_by=order_by,
+                                 descending=descending, **filters)
+    for number, after in enumerate(cursors, start=1):
+        yield ('listing', prefix, heading, filters, order_by, descending, after,
+               number, len(cursors), per_page)
+
+
+def plan_tasks(per_page=MOVIES_PER_PAGE):
+    """ Yields a render task for every page of the site """
+    yield from listing_tasks('index', 'All movies', per_page)
+
+    years = query.year_counts()
+    yield ('index_page', 'years.html', 'Movies by year',
+           [(page_name(f'year-{year}', 1), f'{year} ({count})') for year, count in years])
+    for year, _ in years:
+        yield from listing_tasks(f'year-{year}', f'Movies from {year}', per_page,
+                                 start_year=year, end_year=year)
+
+    buckets = query.rating_bucket_counts()
+    yield ('index_page', 'ratings.html', 'Movies by rating',
+           [(page_name(f'rating-{bucket}', 1), f'Rated {bucket} to {bucket + 1} ({count})')
+            for bucket, count in buckets])
+    for bucket, _ in buckets:
+        yield from listing_tasks(f'rating-{bucket}', f'Rated {bucket} to {bucket + 1}',
+                                 per_page, order_by='rating', descending=True,
+                                 min_rating=bucket, rating_below=bucket + 1)
+
+    for after in query.page_cursors(DETAILS_PER_TASK):
+        yield ('details', after)
+
+
+def task_pages(task):
+    """ Yields (file name, grid items, pagination) for the pages of one task """
+    kind = task[0]
+    if kind == 'listing':
+        _, prefix, heading, filters, order_by, descending, after, number, pages, \
+            per_page = task
+        movies = query.query_movies(order_by=order_by, descending=descending,
+                                    after=after, limit=per_page, **filters)
+        yield (page_name(prefix, number), map(serialize_movie, movies),
+               serialize_pagination(heading, prefix, number, pages))
+    elif kind == 'index_page':
+        _, name, heading, links = task
+        yield (name, (serialize_link(href, label) for href, label in links),
+               serialize_pagination(heading))
+    elif kind == 'details':
+        for movie in query.query_movies(after=task[1], limit=DETAILS_PER_TASK):
+            yield (detail_page_name(movie), [serialize_movie_details(movie)],
+                   serialize_pagination(movie['title']))
+
+
+def write_page(path, chunks, previous_hash=None):
+    """
+    Render chunks in memory and write them to path, unless their hash is
+    previous_hash and path still exists.
+
+    Returns:
+        tuple: (content hash, whether the file was written).
+    """
+    data = ''.join(chunks).encode('utf-8')
+    content_hash = hashlib.sha256(data).hexdigest()
+    if content_hash == previous_hash and os.path.exists(path):
+        return content_hash, False
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+    return content_hash, True
+
+
+def render_task(task, output_dir, template_path):
+    """
+    Render the pages of one task and write the ones that changed.
+
+    Returns:
+        list of tuple: (file name, content hash, written, render seconds)
+        per page.
+    """
+    render = load_template(template_path)
+    results = []
+    start = time.perf_counter()
+    for name, items, pagination in task_pages(task):
+        content_hash, written = write_page(
+            os.path.join(output_dir, name),
+            render(movie_grid=(chunk for item in items for chunk in item),
+                   pagination=pagination),
+            _previous.get(name))
+        now = time.perf_counter()
+        results.append((name, content_hash, written, now - start))
+        start = now
+    return results
+
+
+def _init_worker(db_url, posters, previous):
+    global _posters, _previous
+    # A forked worker must not reuse the parent's pooled connections
+    if storage.engine is not None:
+        storage.engine.dispose(close=False)
+    storage.engine = storage.build_engine(db_url)
+    _posters = posters
+    _previous = previous
+
+
+def load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+@metrics.timed('site.build_site')
+def build_site(output_dir=STATIC_DIR, template_path=TEMPLATE_PATH,
+               per_page=MOVIES_PER_PAGE, workers=None, posters=None):
+    """
+    Build every page of the website, rewriting only the pages whose content
+    changed since the last build and removing pages that no longer exist.
+
+    Args:
+        output_dir (str): Directory the pages are written to.
+        template_path (str): Page template with the __TEMPLATE_MOVIE_GRID__
+            and __TEMPLATE_PAGINATION__ placeholders.
+        per_page (int): Movies per listing page.
+        workers (int, optional): Rendering processes. Defaults to the number
+            of CPUs; small sites are always rendered in-process.
+        posters (dict, optional): PosterMirror.index of mirrored posters;
+            pages link to those local copies instead of the remote URLs.
+
+    Returns:
+        BuildReport: What the build did, with per-page render times.
+    """
+    global _posters, _previous
+    start = time.perf_counter()
+    report = BuildReport()
+    _posters = posters or {}
+    _previous = previous = load_manifest(output_dir)
+    manifest = {}
+    with metrics.span('site.plan_tasks'):
+        tasks = list(plan_tasks(per_page))
+    render = partial(render_task, output_dir=output_dir, template_path=template_path)
+    workers = workers or os.cpu_count() or 1
+
+    def collect(results):
+        for page_results in results:
+            for name, content_hash, written, seconds in page_results:
+                manifest[name] = content_hash
+                report.page_times[name] = seconds
+                # Timed here because pooled workers don't share our metrics
+                metrics.record('site.render_page', seconds)
+                if written:
+                    report.written.append(name)
+                    metrics.count('site.pages_written')
+                else:
+                    report.unchanged += 1
+                    metrics.count('site.pages_unchanged')
+
+    if workers == 1 or len(tasks) < MIN_TASKS_FOR_POOL:
+        collect(map(render, tasks))
+    else:
+        db_url = storage.get_engine().url.render_as_string(hide_password=False)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(db_url, _posters, previous)) as executor:
+            collect(executor.map(render, tasks, chunksize=4))
+
+    for name in previous.keys() - manifest.keys():
+        path = os.path.join(output_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+        report.removed.append(name)
+    save_manifest(output_dir, manifest)
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+@metrics.timed('site.mirror_posters')
+def mirror_posters(output_dir=STATIC_DIR, refresh=False):
+    """
+    Mirror every poster in the catalog into output_dir.
+
+    Returns:
+        tuple: (PosterMirror.index, PosterSyncReport)
+    """
+    mirror = PosterMirror(output_dir)
+    try:
+        report = mirror.sync(query.iter_image_links(), refresh=refresh)
+    finally:
+        mirror.close()
+    return mirror.index, report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the static movie website.')
+    parser.add_argument('--output-dir', default=STATIC_DIR)
+    parser.add_argument('--template', default=TEMPLATE_PATH)
+    parser.add_argument('--per-page', type=int, default=MOVIES_PER_PAGE)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='rendering processes (default: number of CPUs)')
+    parser.add_argument('--timings', action='store_true',
+                        help='print the slowest pages and their render times')
+    parser.add_argument('--mirror-posters', action='store_true',
+                        help='download posters and serve them locally')
+    parser.add_argument('--refresh-posters', action='store_true',
+                        help='revalidate posters that were mirrored before')
+    args = parser.parse_args(argv)
+
+    posters = None
+    if args.mirror_posters or args.refresh_posters:
+        posters, poster_report = mirror_posters(args.output_dir, args.refresh_posters)
+        print(poster_report)
+    report = build_site(args.output_dir, args.template, args.per_page, args.workers,
+                        posters=posters)
+    print(report)
+    if args.timings:
+        for name, seconds in report.slowest(10):
+            print(f'{seconds * 1000:10.2f} ms  {name}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Minimal compiled template engine for the website pages.
+
+A template is plain HTML with __TEMPLATE_NAME__ placeholders. It is parsed
+once into a list of literal chunks and slot names; rendering then only
+walks that list, so filling the same template thousands of times costs no
+string searching or copying of the template text.
+"""
+import html
+import os
+import re
+from functools import lru_cache
+
+PLACEHOLDER = re.compile(r'__TEMPLATE_([A-Z0-9_]+)__')
+
+
+def escape(value):
+    """HTML-escape a value for use in element text or a quoted attribute."""
+    return html.escape(str(value), quote=True)
+
+
+def compile_template(source):
+    """
+    Parse template source into a render function.
+
+    Args:
+        source (str): Template text with __TEMPLATE_NAME__ placeholders.
+
+    Returns:
+        function: render(**slots) yielding the page as string chunks. Each
+        slot is named after its placeholder in lower case ('movie_grid' for
+        __TEMPLATE_MOVIE_GRID__) and is either a string or an iterable of
+        strings, which is streamed without being joined. Slot values are
+        inserted as HTML; escape data with escape() before passing it.
+        Missing slots render as empty.
+    """
+    parts = []
+    position = 0
+    for match in PLACEHOLDER.finditer(source):
+        parts.append((True, source[position:match.start()]))
+        parts.append((False, match.group(1).lower()))
+        position = match.end()
+    parts.append((True, source[position:]))
+    parts = tuple((literal, value) for literal, value in parts if value or not literal)
+
+    def render(**slots):
+        for literal, value in parts:
+            if literal:
+                yield value
+                continue
+            slot = slots.get(value, '')
+            if isinstance(slot, str):
+                yield slot
+            else:
+                yield from slot
+
+    render.slots = tuple(value for literal, value in parts if not literal)
+    return render
+
+
+@lru_cache(maxsize=16)
+def _load(path, mtime):
+    with open(path, 'r', encoding='utf-8') as f:
+        return compile_template(f.read())
+
+
+def load_template(path):
+    """Compile a template file, reusing the compiled form until the file changes."""
+    return _load(path, os.stat(path).st_mtime_ns)